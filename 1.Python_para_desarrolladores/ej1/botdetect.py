@@ -0,0 +1,145 @@
+import doctest
+from collections import deque
+from typing import Iterable
+
+"""
+Bot classifier for user agents.
+Las firmas se buscan todas a la vez con un autómata de Aho-Corasick,
+que se construye una única vez, y el resultado se memoriza por user
+agent, ya que en un log los mismos user agents se repiten mucho.
+"""
+
+DEFAULT_SIGNATURES = ('bot', 'spider', 'crawl', 'slurp', 'headlesschrome',
+                      'facebookexternalhit', 'archiver')
+
+
+class AhoCorasick:
+    """
+    Multi-pattern string matching automaton.
+    Cada estado es un nodo del trie de los patrones; fail apunta al
+    estado del sufijo más largo que también es prefijo de algún patrón,
+    y output guarda los patrones que terminan en cada estado.
+
+    Examples
+    --------
+    >>> automaton = AhoCorasick(['he', 'she', 'his', 'hers'])
+    >>> automaton.find_all('ushers')
+    ['she', 'he', 'hers']
+    >>> automaton.search('ushers'), automaton.search('hi')
+    (True, False)
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = [pattern for pattern in dict.fromkeys(patterns) if pattern]
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.output: list[tuple[int, ...]] = [()]
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state] += (index,)
+        self._build_fail()
+
+    def _build_fail(self) -> None:
+        # Recorrido en anchura: el fallo de un nodo depende del de su padre.
+        pending = deque(self.goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, child in self.goto[state].items():
+                pending.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] += self.output[self.fail[child]]
+
+    def _step(self, state: int, char: str) -> int:
+        while state and char not in self.goto[state]:
+            state = self.fail[state]
+        return self.goto[state].get(char, 0)
+
+    def search(self, text: str) -> bool:
+        """
+        Check if any of the patterns appears in the text.
+        """
+        state = 0
+        for char in text:
+            state = self._step(state, char)
+            if self.output[state]:
+                return True
+        return False
+
+    def find_all(self, text: str) -> list[str]:
+        """
+        Returns the patterns found in the text, in order of their end position.
+        """
+        found = []
+        state = 0
+        for char in text:
+            state = self._step(state, char)
+            found.extend(self.patterns[index] for index in self.output[state])
+        return found
+
+
+class BotClassifier:
+    """
+    Classifies user agents as bots with a configurable list of signatures.
+    Las firmas no distinguen mayúsculas. Los resultados se guardan en una
+    caché por user agent (str o bytes), que se vacía al llegar a cache_size.
+    signatures guarda las firmas con que se construyó, para poder pasarlas
+    a otros procesos.
+
+    Examples
+    --------
+    >>> classifier = BotClassifier()
+    >>> classifier.is_bot('Mozilla/5.0 (compatible; Yahoo! Slurp; http://help.yahoo.com/help/us/ysearch/slurp)')
+    True
+    >>> classifier.is_bot(b'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) HeadlessChrome/119.0.0.0 Safari/537.36')
+    True
+    >>> classifier.is_bot('Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/117.0')
+    False
+    >>> BotClassifier(['python-requests']).is_bot('python-requests/2.25.1')
+    True
+    """
+
+    def __init__(self, signatures: Iterable[str] = DEFAULT_SIGNATURES, cache_size: int = 100_000):
+        self.signatures = tuple(signatures)
+        self.automaton = AhoCorasick(signature.lower() for signature in self.signatures)
+        self.cache_size = cache_size
+        self._cache: dict[str | bytes, bool] = {}
+
+    def is_bot(self, user_agent: str | bytes) -> bool:
+        result = self._cache.get(user_agent)
+        if result is None:
+            text = user_agent.decode('utf-8', errors='replace') if isinstance(user_agent, bytes) else user_agent
+            result = self.automaton.search(text.lower())
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[user_agent] = result
+        return result
+
+
+def load_signatures(filename: str) -> list[str]:
+    """
+    Reads a list of signatures from a text file, one per line.
+    Se ignoran las líneas vacías y las que empiezan por '#'.
+    """
+    with open(filename, 'r') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+# ------------ test  ----------------#
+
+def test_doc() -> None:
+    doctest.run_docstring_examples(AhoCorasick, globals(), verbose=False)
+    doctest.run_docstring_examples(BotClassifier, globals(), verbose=False)
+
+
+if __name__ == '__main__':
+    test_doc()
@@ -0,0 +1,247 @@
+import calendar
+import doctest
+import os
+import tempfile
+import uuid
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from logsources import iter_lines
+from solution import LogRecord, histbyhour, ipaddreses, parse_line
+
+"""
+Columnar storage of the parsed access logs.
+El ingest parsea los logs una única vez y escribe los registros en
+ficheros Parquet particionados por día y hora (day=YYYY-MM-DD/hour=H).
+Las consultas posteriores leen solo las columnas que necesitan, sin
+volver a parsear el texto.
+Los user agents se guardan como un id (ua_id) de un diccionario que se
+persiste junto al dataset (USER_AGENTS), de forma que el mismo user agent
+tiene el mismo id en todos los ficheros y en todas las ejecuciones del ingest.
+"""
+
+SCHEMA = pa.schema([
+    ('epoch', pa.int64()),                                   # segundos UTC
+    ('tz_offset', pa.int16()),                               # minutos
+    ('ip', pa.uint32()),                                     # IPv4 como entero
+    ('ip_text', pa.string()),                                # solo si no es IPv4
+    ('method', pa.dictionary(pa.int32(), pa.string())),
+    ('path', pa.string()),
+    ('status', pa.int16()),
+    ('size', pa.int64()),
+    ('ua_id', pa.int32()),                                   # id en USER_AGENTS
+    ('bot', pa.bool_()),
+    ('day', pa.string()),
+    ('hour', pa.int8()),
+])
+
+PARTITIONING = ds.partitioning(pa.schema([('day', pa.string()), ('hour', pa.int8())]), flavor='hive')
+
+# Diccionario de user agents (el id es la posición). Empieza por '_', así que
+# pyarrow.dataset no lo toma como parte de los datos.
+USER_AGENTS = '_user_agents.parquet'
+
+
+def ip_to_int(ip: str) -> int | None:
+    """
+    Converts an IPv4 address to an integer. Devuelve None si no es una IPv4.
+
+    >>> ip_to_int('147.96.46.52')
+    2472554036
+    >>> ip_to_int('2001:db8::1') is None
+    True
+    """
+    parts = ip.split('.')
+    if len(parts) != 4 or not all(part.isdigit() and int(part) < 256 for part in parts):
+        return None
+    a, b, c, d = map(int, parts)
+    return (a << 24) | (b << 16) | (c << 8) | d
+
+
+def int_to_ip(value: int) -> str:
+    """
+    Converts an integer back to an IPv4 address.
+
+    >>> int_to_ip(2472554036)
+    '147.96.46.52'
+    """
+    return f'{value >> 24}.{(value >> 16) & 255}.{(value >> 8) & 255}.{value & 255}'
+
+
+def record_epoch(record: LogRecord) -> int | None:
+    """
+    Seconds since the epoch (UTC) of the record, taking into account its time zone.
+
+    >>> record_epoch(LogRecord(ip='', year=2023, month=10, day=10, hour=12, minute=55, second=47, tz_offset=120))
+    1696935347
+    """
+    if record.year is None:
+        return None
+    local = calendar.timegm((record.year, record.month, record.day,
+                             record.hour, record.minute, record.second))
+    return local - 60 * record.tz_offset
+
+
+def load_user_agents(dataset_dir: str) -> list[str]:
+    """
+    User agents of the dataset, indexed by their ua_id.
+    """
+    path = os.path.join(dataset_dir, USER_AGENTS)
+    if not os.path.exists(path):
+        return []
+    return pq.read_table(path)['user_agent'].to_pylist()
+
+
+def _save_user_agents(dataset_dir: str, user_agents: list[str]) -> None:
+    # Se escribe en un fichero temporal y se renombra, para no dejar el diccionario a medias.
+    path = os.path.join(dataset_dir, USER_AGENTS)
+    os.makedirs(dataset_dir, exist_ok=True)
+    pq.write_table(pa.table({'user_agent': pa.array(user_agents, pa.string())}), path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+class _Batch:
+    """
+    Column buffers of the records pending to be written.
+    ua_ids es el diccionario de user agents compartido por todos los lotes.
+    """
+
+    def __init__(self, ua_ids: dict[str, int]):
+        self.columns: dict[str, list] = {name: [] for name in SCHEMA.names}
+        self.ua_ids = ua_ids
+
+    def __len__(self) -> int:
+        return len(self.columns['epoch'])
+
+    def append(self, record: LogRecord) -> None:
+        columns = self.columns
+        columns['epoch'].append(record_epoch(record))
+        columns['tz_offset'].append(record.tz_offset)
+        ip = ip_to_int(record.ip)
+        columns['ip'].append(ip)
+        columns['ip_text'].append(record.ip if ip is None else None)
+        columns['method'].append(record.method)
+        columns['path'].append(record.path)
+        columns['status'].append(record.status)
+        columns['size'].append(record.size)
+        columns['ua_id'].append(None if record.user_agent is None
+                                else self.ua_ids.setdefault(record.user_agent, len(self.ua_ids)))
+        columns['bot'].append(record.bot)
+        columns['day'].append(None if record.year is None
+                              else f'{record.year:04d}-{record.month:02d}-{record.day:02d}')
+        columns['hour'].append(record.hour)
+
+    def to_table(self) -> pa.Table:
+        return pa.Table.from_pydict(self.columns, schema=SCHEMA)
+
+
+def ingest(sources: str | list[str], dataset_dir: str, batch_size: int = 100_000) -> int:
+    """
+    Parses the log files and appends the records to the partitioned dataset.
+    Los registros se escriben por lotes de batch_size filas; cada ejecución
+    crea ficheros nuevos, así que se pueden ir añadiendo logs al dataset.
+    Los user agents nuevos se añaden al final del diccionario, que se
+    guarda tras cada lote. Devuelve el número de registros escritos.
+    """
+    run_id = uuid.uuid4().hex
+    ua_ids = {user_agent: ua_id for ua_id, user_agent in enumerate(load_user_agents(dataset_dir))}
+    batch, written, batch_number = _Batch(ua_ids), 0, 0
+
+    def flush() -> None:
+        nonlocal batch, written, batch_number
+        ds.write_dataset(batch.to_table(), dataset_dir, format='parquet',
+                         partitioning=PARTITIONING,
+                         basename_template=f'{run_id}-{batch_number}-{{i}}.parquet',
+                         existing_data_behavior='overwrite_or_ignore')
+        _save_user_agents(dataset_dir, list(ua_ids))
+        written += len(batch)
+        batch_number += 1
+        batch = _Batch(ua_ids)
+
+    for log_line in iter_lines(sources):
+        if not log_line.strip():
+            continue
+        batch.append(parse_line(log_line))
+        if len(batch) >= batch_size:
+            flush()
+    if len(batch):
+        flush()
+    return written
+
+
+def dataset(dataset_dir: str) -> ds.Dataset:
+    return ds.dataset(dataset_dir, format='parquet', partitioning=PARTITIONING)
+
+
+def read_columns(dataset_dir: str, columns: list[str], filter: pc.Expression | None = None) -> pa.Table:
+    """
+    Reads only the requested columns of the dataset, optionally filtered.
+    Los filtros sobre day y hour descartan particiones enteras sin leerlas.
+    """
+    return dataset(dataset_dir).to_table(columns=columns, filter=filter)
+
+
+def histbyhour_columnar(dataset_dir: str) -> dict[int, int]:
+    """
+    Same as histbyhour, reading only the hour column of the dataset.
+    """
+    counts = pc.value_counts(read_columns(dataset_dir, ['hour'])['hour'])
+    return {pair['values'].as_py(): pair['counts'].as_py()
+            for pair in counts if pair['values'].is_valid}
+
+
+def ipaddreses_columnar(dataset_dir: str) -> set[str]:
+    """
+    Same as ipaddreses, reading only the ip, ip_text and bot columns of the dataset.
+    Las direcciones que no son IPv4 están en ip_text.
+    """
+    table = read_columns(dataset_dir, ['ip', 'ip_text'], filter=~pc.field('bot'))
+    ips = {int_to_ip(value) for value in pc.unique(table['ip']).to_pylist() if value is not None}
+    return ips | {value for value in pc.unique(table['ip_text']).to_pylist() if value is not None}
+
+
+# ------------ test  ----------------#
+
+def test_doc() -> None:
+    doctest.run_docstring_examples(ip_to_int, globals(), verbose=False)
+    doctest.run_docstring_examples(int_to_ip, globals(), verbose=False)
+    doctest.run_docstring_examples(record_epoch, globals(), verbose=False)
+
+
+def test_ingest(filename: str) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset_dir = os.path.join(tmp, 'access')
+        # Lotes pequeños para que haya varios ficheros por partición.
+        assert ingest(filename, dataset_dir, batch_size=10) == sum(1 for line in open(filename) if line.strip())
+        assert histbyhour_columnar(dataset_dir) == histbyhour(filename)
+        assert ipaddreses_columnar(dataset_dir) == ipaddreses(filename)
+
+
+def test_ids_and_other_ips() -> None:
+    lines = ['2001:db8::1 - - [10/Oct/2023:12:55:47 +0200] "GET / HTTP/1.1" 200 10 "-" "Firefox"\n',
+             '147.96.46.52 - - [10/Oct/2023:13:55:47 +0200] "GET / HTTP/1.1" 200 10 "-" "Curl"\n']
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset_dir = os.path.join(tmp, 'access')
+        logs = []
+        for i, text in enumerate((lines, lines[::-1])):
+            logs.append(os.path.join(tmp, f'{i}.log'))
+            with open(logs[-1], 'w') as f:
+                f.writelines(text)
+            ingest(logs[-1], dataset_dir)
+        # Las direcciones que no son IPv4 también se guardan.
+        assert ipaddreses_columnar(dataset_dir) == ipaddreses(logs) == {'2001:db8::1', '147.96.46.52'}
+        # El mismo user agent tiene el mismo id en todos los ficheros.
+        user_agents = load_user_agents(dataset_dir)
+        assert user_agents == ['Firefox', 'Curl']
+        table = read_columns(dataset_dir, ['hour', 'ua_id'])
+        assert sorted(zip(table['hour'].to_pylist(), table['ua_id'].to_pylist())) == [(12, 0), (12, 0), (13, 1), (13, 1)]
+
+
+if __name__ == '__main__':
+    test_doc()
+    test_ingest('access_short.log')
+    test_ingest('access.log')
+    test_ids_and_other_ips()
@@ -0,0 +1,206 @@
+import doctest
+from array import array
+from typing import NamedTuple
+
+import numpy as np
+import pyarrow.compute as pc
+
+from columnar import read_columns, record_epoch
+from solution import Aggregator, LogRecord, analyze, histbyhour
+
+"""
+Vectorized histogram queries over the timestamps of the accesses.
+Los instantes se guardan como un array int64 de segundos UTC junto con
+el desplazamiento horario de cada línea, y los histogramas se calculan
+con np.bincount / np.searchsorted en lugar de actualizar un diccionario
+por línea.
+"""
+
+WIDTHS = {'minute': 60, '5min': 300, '15min': 900, 'hour': 3600, 'day': 86400}
+
+
+class Events(NamedTuple):
+    """
+    Arrays with one entry per access: epoch (segundos UTC), tz_offset
+    (minutos), status y bot.
+    """
+    epoch: np.ndarray
+    tz_offset: np.ndarray
+    status: np.ndarray
+    bot: np.ndarray
+
+    @classmethod
+    def from_dataset(cls, dataset_dir: str) -> 'Events':
+        """
+        Reads the columns of a dataset written by columnar.ingest.
+        Las filas sin fecha se descartan.
+        """
+        table = read_columns(dataset_dir, ['epoch', 'tz_offset', 'status', 'bot'],
+                             filter=pc.field('epoch').is_valid())
+        return cls(epoch=table['epoch'].to_numpy().astype(np.int64),
+                   tz_offset=table['tz_offset'].to_numpy().astype(np.int16),
+                   status=pc.fill_null(table['status'], 0).to_numpy().astype(np.int16),
+                   bot=table['bot'].to_numpy(zero_copy_only=False).astype(bool))
+
+    @classmethod
+    def from_logs(cls, sources: str | list[str], workers: int = 1) -> 'Events':
+        """
+        Parses the log files (a single pass with solution.analyze).
+        """
+        events, = analyze(sources, EventCollector(), workers=workers)
+        return events
+
+    def select(self, mask: np.ndarray) -> 'Events':
+        return Events(*(column[mask] for column in self))
+
+
+class EventCollector(Aggregator):
+    """
+    Aggregator that collects the columns of Events in compact arrays.
+    Las filas sin fecha se descartan.
+
+    >>> agg = EventCollector()
+    >>> agg.add(LogRecord(ip='1.1.1.1', year=2023, month=10, day=10, hour=12, minute=55, second=47, tz_offset=120, status=404))
+    >>> agg.add(LogRecord(ip='1.1.1.2', hour=7))
+    >>> agg.result()
+    Events(epoch=array([1696935347]), tz_offset=array([120], dtype=int16), status=array([404], dtype=int16), bot=array([False]))
+    """
+
+    def __init__(self):
+        self.epoch, self.tz_offset, self.status, self.bot = array('q'), array('h'), array('h'), array('b')
+
+    def add(self, record: LogRecord) -> None:
+        epoch = record_epoch(record)
+        if epoch is None:
+            return
+        self.epoch.append(epoch)
+        self.tz_offset.append(record.tz_offset)
+        self.status.append(record.status or 0)
+        self.bot.append(record.bot)
+
+    def merge(self, other: 'EventCollector') -> None:
+        self.epoch.extend(other.epoch)
+        self.tz_offset.extend(other.tz_offset)
+        self.status.extend(other.status)
+        self.bot.extend(other.bot)
+
+    def result(self) -> Events:
+        return Events(epoch=np.frombuffer(self.epoch, dtype=np.int64).copy(),
+                      tz_offset=np.frombuffer(self.tz_offset, dtype=np.int16).copy(),
+                      status=np.frombuffer(self.status, dtype=np.int16).copy(),
+                      bot=np.frombuffer(self.bot, dtype=np.int8).astype(bool))
+
+
+def parse_offset(tz: str | int) -> int:
+    """
+    Time zone offset in minutes, from an integer or a string like '+0200'.
+
+    >>> parse_offset('+0200'), parse_offset('-0330'), parse_offset(60)
+    (120, -210, 60)
+    """
+    if isinstance(tz, int):
+        return tz
+    sign = -1 if tz[0] == '-' else 1
+    return sign * (int(tz[1:3]) * 60 + int(tz[3:5]))
+
+
+def local_times(events: Events, tz: str | int = 'local') -> np.ndarray:
+    """
+    Seconds of the wall clock in which the accesses are grouped.
+    tz='local' usa el desplazamiento de cada línea (como histbyhour),
+    tz='utc' agrupa en UTC y un entero o una cadena como '+0200' usa
+    ese desplazamiento fijo para todas las líneas.
+    """
+    if tz == 'local':
+        return events.epoch + events.tz_offset.astype(np.int64) * 60
+    if tz == 'utc':
+        return events.epoch
+    return events.epoch + parse_offset(tz) * 60
+
+
+def _mask(events: Events, status: int | list[int] | None, bot: bool | None) -> np.ndarray | None:
+    mask = None
+    if status is not None:
+        mask = np.isin(events.status, np.atleast_1d(status))
+    if bot is not None:
+        mask = (events.bot == bot) if mask is None else mask & (events.bot == bot)
+    return mask
+
+
+def histogram(events: Events, width: str | int = 'hour', tz: str | int = 'local',
+              status: int | list[int] | None = None, bot: bool | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Number of accesses in consecutive buckets of the given width.
+    width es una clave de WIDTHS o un número de segundos. Los cubos se
+    alinean a múltiplos de width en la zona horaria tz y se devuelven
+    (inicio de cada cubo en segundos de esa zona, número de accesos),
+    incluidos los cubos vacíos intermedios.
+
+    >>> events = Events(epoch=np.array([0, 30, 70, 400]), tz_offset=np.array([60, 60, 60, 60], dtype=np.int16),
+    ...                 status=np.array([200, 404, 200, 200], dtype=np.int16), bot=np.array([False, False, True, False]))
+    >>> histogram(events, 'minute', tz='utc')
+    (array([  0,  60, 120, 180, 240, 300, 360]), array([2, 1, 0, 0, 0, 0, 1]))
+    >>> histogram(events, '5min', tz='utc', status=200, bot=False)
+    (array([  0, 300]), array([1, 1]))
+    >>> histogram(events, 'hour')[0]   # hora local: +0100
+    array([3600])
+    """
+    seconds = WIDTHS[width] if isinstance(width, str) else width
+    mask = _mask(events, status, bot)
+    times = local_times(events if mask is None else events.select(mask), tz)
+    if times.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    buckets = times // seconds
+    first = buckets.min()
+    counts = np.bincount(buckets - first)
+    return (first + np.arange(counts.size)) * seconds, counts
+
+
+def histogram_edges(events: Events, edges: np.ndarray, tz: str | int = 'utc',
+                    status: int | list[int] | None = None, bot: bool | None = None) -> np.ndarray:
+    """
+    Number of accesses between consecutive (sorted) edges, with np.searchsorted.
+    Sirve para cubos de anchura irregular (por ejemplo, meses).
+
+    >>> events = Events(epoch=np.array([0, 30, 70, 400]), tz_offset=np.zeros(4, dtype=np.int16),
+    ...                 status=np.full(4, 200, dtype=np.int16), bot=np.zeros(4, dtype=bool))
+    >>> histogram_edges(events, np.array([0, 60, 100, 1000]))
+    array([2, 1, 1])
+    """
+    mask = _mask(events, status, bot)
+    times = np.sort(local_times(events if mask is None else events.select(mask), tz))
+    return np.diff(np.searchsorted(times, edges, side='left'))
+
+
+def hour_of_day(events: Events, tz: str | int = 'local', status: int | list[int] | None = None,
+                bot: bool | None = None) -> np.ndarray:
+    """
+    Number of accesses in each of the 24 hours of the day (array of length 24).
+    Con tz='local' coincide con histbyhour.
+    """
+    mask = _mask(events, status, bot)
+    times = local_times(events if mask is None else events.select(mask), tz)
+    return np.bincount((times // 3600) % 24, minlength=24)
+
+
+# ------------ test  ----------------#
+
+def test_doc() -> None:
+    doctest.run_docstring_examples(EventCollector, globals(), verbose=False)
+    doctest.run_docstring_examples(parse_offset, globals(), verbose=False)
+    doctest.run_docstring_examples(histogram, globals(), verbose=False)
+    doctest.run_docstring_examples(histogram_edges, globals(), verbose=False)
+
+
+def test_hour_of_day(filename: str) -> None:
+    events = Events.from_logs(filename)
+    hours = hour_of_day(events)
+    assert {hour: int(count) for hour, count in enumerate(hours) if count} == histbyhour(filename)
+    # Los cubos de una hora suman lo mismo en cualquier zona horaria.
+    assert histogram(events, 'hour', tz='utc')[1].sum() == hours.sum() == events.epoch.size
+
+
+if __name__ == '__main__':
+    test_doc()
+    test_hour_of_day('access_short.log')
+    test_hour_of_day('access.log')
@@ -0,0 +1,208 @@
+import glob
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from typing import Callable
+
+from solution import Aggregator, HourHistogram, NonBotIPs, _analyze_range, analyze
+
+"""
+Incremental analysis of a growing log file.
+Después de cada ejecución se guarda un checkpoint con el inodo del
+fichero, el offset hasta el que se ha leído y los agregados parciales,
+de forma que la siguiente ejecución solo procesa los bytes nuevos.
+"""
+
+
+def _file_id(path: str) -> tuple[int, int]:
+    st = os.stat(path)
+    return st.st_dev, st.st_ino
+
+
+def _complete_end(path: str, start: int) -> int:
+    """
+    Position right after the last line break of the file (or start if there is none).
+    La última línea puede estar a medio escribir, así que solo se procesan
+    las líneas completas y el resto queda para la siguiente lectura.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        end = size
+        while end > start:
+            block_start = max(start, end - 65536)
+            f.seek(block_start)
+            block = f.read(end - block_start)
+            newline = block.rfind(b'\n')
+            if newline != -1:
+                return block_start + newline + 1
+            end = block_start
+    return start
+
+
+class LogTail:
+    """
+    Keeps the aggregates of a log file up to date reading only the appended bytes.
+    El estado (inodo, offset y agregadores) se puede guardar y recuperar de
+    un checkpoint. Si el fichero se ha rotado, primero se terminan de leer
+    los bytes pendientes del fichero rotado (buscándolo por su inodo entre
+    los ficheros filename.*) y después se lee el nuevo desde el principio.
+    Si el fichero se ha truncado se vuelve a leer desde el principio.
+    """
+
+    def __init__(self, filename: str, *aggregators: Aggregator, checkpoint_path: str | None = None):
+        self.filename = filename
+        self.aggregators = aggregators
+        self.checkpoint_path = checkpoint_path
+        self.file_id: tuple[int, int] | None = None
+        self.offset = 0
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            self._load()
+
+    def _load(self) -> None:
+        with open(self.checkpoint_path, 'rb') as f:
+            state = pickle.load(f)
+        stored = state['aggregators']
+        if [type(a) for a in stored] != [type(a) for a in self.aggregators]:
+            raise ValueError('El checkpoint no corresponde a los agregadores pedidos')
+        for aggregator, partial in zip(self.aggregators, stored):
+            aggregator.merge(partial)
+        self.file_id = state['file_id']
+        self.offset = state['offset']
+
+    def save(self) -> None:
+        """
+        Writes the checkpoint atomically: se escribe en un fichero temporal
+        y se renombra, para no dejar un checkpoint corrupto.
+        """
+        if self.checkpoint_path is None:
+            return
+        state = {'filename': self.filename, 'file_id': self.file_id,
+                 'offset': self.offset, 'aggregators': self.aggregators}
+        directory = os.path.dirname(os.path.abspath(self.checkpoint_path))
+        with tempfile.NamedTemporaryFile('wb', dir=directory, delete=False) as f:
+            pickle.dump(state, f)
+        os.replace(f.name, self.checkpoint_path)
+
+    def _rotated_path(self) -> str | None:
+        for candidate in glob.glob(glob.escape(self.filename) + '.*'):
+            if os.path.isfile(candidate) and _file_id(candidate) == self.file_id:
+                return candidate
+        return None
+
+    def poll(self) -> int:
+        """
+        Processes the complete lines appended since the last call.
+        Devuelve el número de bytes procesados.
+        """
+        if not os.path.exists(self.filename):
+            return 0
+        consumed = 0
+        current_id = _file_id(self.filename)
+        if self.file_id is not None and current_id != self.file_id:
+            rotated = self._rotated_path()
+            if rotated is not None:
+                end = os.path.getsize(rotated)
+                _analyze_range(rotated, self.offset, end, self.aggregators)
+                consumed += max(0, end - self.offset)
+            else:
+                logging.warning(f'No se encontró el fichero rotado de {self.filename}, '
+                                f'se pierden los bytes desde {self.offset}')
+            self.offset = 0
+        elif os.path.getsize(self.filename) < self.offset:
+            logging.warning(f'{self.filename} se ha truncado, se lee desde el principio')
+            self.offset = 0
+        self.file_id = current_id
+        end = _complete_end(self.filename, self.offset)
+        if end > self.offset:
+            _analyze_range(self.filename, self.offset, end, self.aggregators)
+            consumed += end - self.offset
+            self.offset = end
+        return consumed
+
+    def results(self) -> tuple:
+        return tuple(aggregator.result() for aggregator in self.aggregators)
+
+
+def analyze_incremental(filename: str, checkpoint_path: str, *aggregators: Aggregator) -> tuple:
+    """
+    Like analyze, but only reads the bytes appended since the last run.
+    Los agregados de las ejecuciones anteriores se recuperan del checkpoint
+    y el checkpoint se actualiza al terminar.
+    """
+    tail = LogTail(filename, *aggregators, checkpoint_path=checkpoint_path)
+    tail.poll()
+    tail.save()
+    return tail.results()
+
+
+def follow(filename: str, *aggregators: Aggregator, checkpoint_path: str | None = None,
+           interval: float = 1.0, on_update: Callable[[tuple], None] | None = None,
+           stop: threading.Event | None = None) -> tuple:
+    """
+    Follows the log file like tail -f, updating the aggregates as lines arrive.
+    Cada vez que llegan líneas nuevas se llama a on_update con los resultados
+    y se guarda el checkpoint. Termina cuando se activa stop.
+    """
+    tail = LogTail(filename, *aggregators, checkpoint_path=checkpoint_path)
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        if tail.poll():
+            tail.save()
+            if on_update is not None:
+                on_update(tail.results())
+        else:
+            stop.wait(interval)
+    tail.save()
+    return tail.results()
+
+
+# ------------ test  ----------------#
+
+def test_incremental(filename: str) -> None:
+    with open(filename, 'rb') as f:
+        lines = f.readlines()
+    expected = analyze(filename, HourHistogram(), NonBotIPs())
+    with tempfile.TemporaryDirectory() as tmp:
+        log = os.path.join(tmp, 'access.log')
+        checkpoint = os.path.join(tmp, 'access.ckpt')
+        half = len(lines) // 2
+        # Primera ejecución con media línea a medio escribir al final.
+        with open(log, 'wb') as f:
+            f.writelines(lines[:half])
+            f.write(lines[half][:10])
+        analyze_incremental(log, checkpoint, HourHistogram(), NonBotIPs())
+        # Se completa la línea, se rota el fichero y se escribe el resto en uno nuevo.
+        with open(log, 'ab') as f:
+            f.write(lines[half][10:])
+        shutil.move(log, log + '.1')
+        with open(log, 'wb') as f:
+            f.writelines(lines[half + 1:])
+        assert analyze_incremental(log, checkpoint, HourHistogram(), NonBotIPs()) == expected
+        # Sin datos nuevos el resultado no cambia.
+        assert analyze_incremental(log, checkpoint, HourHistogram(), NonBotIPs()) == expected
+
+
+def test_follow(filename: str) -> None:
+    expected = analyze(filename, HourHistogram(), NonBotIPs())
+    with tempfile.TemporaryDirectory() as tmp:
+        log = os.path.join(tmp, 'access.log')
+        shutil.copy(filename, log)
+        stop = threading.Event()
+        updates = []
+
+        def on_update(results: tuple) -> None:
+            updates.append(results)
+            stop.set()
+
+        assert follow(log, HourHistogram(), NonBotIPs(), interval=0.01,
+                      on_update=on_update, stop=stop) == expected
+        assert len(updates) == 1
+
+
+if __name__ == '__main__':
+    test_incremental('access.log')
+    test_follow('access.log')
+    logging.info('¡Éxito!')
@@ -0,0 +1,175 @@
+import bz2
+import doctest
+import glob
+import gzip
+import lzma
+import os
+import queue
+import re
+import threading
+from typing import IO, Iterable, Iterator
+
+"""
+Input sources for the log analyzer: globs, rotated files and
+compressed logs (.gz, .bz2, .xz) read as a stream, without
+temporary files.
+"""
+
+_OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+# access.log.3.gz -> 3, access.log.1 -> 1, access.log -> sin número
+_ROTATION_RE = re.compile(r'\.(\d+)(\.gz|\.bz2|\.xz)?$')
+
+_CHUNK_SIZE = 1 << 20
+
+
+def is_compressed(path: str) -> bool:
+    """
+    Check if the file is compressed, according to its extension.
+
+    >>> is_compressed('access.log.1.gz'), is_compressed('access.log.2.xz'), is_compressed('access.log')
+    (True, True, False)
+    """
+    return os.path.splitext(path)[1] in _OPENERS
+
+
+def rotation_key(path: str) -> tuple[str, int]:
+    """
+    Sort key that places rotated files in chronological order.
+    Los ficheros rotados llevan un número tras el nombre base: cuanto
+    mayor es el número, más antiguo es el fichero. El fichero sin
+    número es el actual y va el último.
+
+    >>> sorted(['access.log', 'access.log.1', 'access.log.10.gz', 'access.log.2.gz'], key=rotation_key)
+    ['access.log.10.gz', 'access.log.2.gz', 'access.log.1', 'access.log']
+    """
+    match = _ROTATION_RE.search(path)
+    if match is None:
+        base = path[:-len(os.path.splitext(path)[1])] if is_compressed(path) else path
+        return base, 0
+    return path[:match.start()], -int(match[1])
+
+
+def expand_sources(sources: str | Iterable[str]) -> list[str]:
+    """
+    Expands a path, a glob or a list of them into the list of files to read.
+    Los ficheros se devuelven sin repetir y ordenados con rotation_key.
+    :raise FileNotFoundError: if a glob does not match any file.
+
+    >>> expand_sources('access_short.log')
+    ['access_short.log']
+    >>> expand_sources(['access*.log'])
+    ['access.log', 'access_short.log']
+    >>> expand_sources('noexiste*.log.gz')
+    Traceback (most recent call last):
+        ...
+    FileNotFoundError: No se encontraron ficheros para noexiste*.log.gz
+    """
+    if isinstance(sources, str):
+        sources = [sources]
+    paths = set()
+    for source in sources:
+        if glob.has_magic(source):
+            matches = glob.glob(source)
+            if not matches:
+                raise FileNotFoundError(f'No se encontraron ficheros para {source}')
+            paths.update(matches)
+        else:
+            paths.add(source)
+    return sorted(paths, key=rotation_key)
+
+
+def open_log(path: str) -> IO[bytes]:
+    """
+    Opens a log file in binary mode, decompressing it as a stream if needed.
+    """
+    opener = _OPENERS.get(os.path.splitext(path)[1], open)
+    return opener(path, 'rb')
+
+
+class ReadAhead:
+    """
+    Reads (and decompresses) a binary stream in a separate thread.
+    Los bloques leídos se dejan en una cola acotada, de forma que la
+    descompresión, que libera el GIL, se solapa con el parsing de las
+    líneas en el hilo principal.
+    """
+
+    _END = None
+
+    def __init__(self, stream: IO[bytes], chunk_size: int = _CHUNK_SIZE, depth: int = 4):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.chunks: queue.Queue = queue.Queue(maxsize=depth)
+        self.error: BaseException | None = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        try:
+            while not self.stopped.is_set():
+                chunk = self.stream.read(self.chunk_size)
+                if not chunk:
+                    break
+                self.chunks.put(chunk)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.chunks.put(self._END)
+
+    def __iter__(self) -> Iterator[bytes]:
+        """
+        Yields the lines of the stream, including the line break.
+        """
+        pending = b''
+        while (chunk := self.chunks.get()) is not self._END:
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line + b'\n'
+        if self.error is not None:
+            raise self.error
+        if pending:
+            yield pending
+
+    def close(self) -> None:
+        self.stopped.set()
+        # Vaciamos la cola para que el hilo no quede bloqueado en put.
+        while self.thread.is_alive():
+            try:
+                self.chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.stream.close()
+
+
+def iter_lines(sources: str | Iterable[str], readahead: bool = False) -> Iterator[str]:
+    """
+    Yields the decoded lines of all the sources, in rotation order.
+    Con readahead=True cada fichero se lee y descomprime en un hilo aparte.
+
+    >>> sum(1 for _ in iter_lines('access_short.log'))
+    6
+    """
+    for path in expand_sources(sources):
+        stream = open_log(path)
+        reader = ReadAhead(stream) if readahead else stream
+        try:
+            for raw_line in reader:
+                yield raw_line.decode('utf-8', errors='replace')
+        finally:
+            reader.close()
+
+
+# ------------ test  ----------------#
+
+def test_doc() -> None:
+    doctest.run_docstring_examples(is_compressed, globals(), verbose=False)
+    doctest.run_docstring_examples(rotation_key, globals(), verbose=False)
+    doctest.run_docstring_examples(expand_sources, globals(), verbose=False)
+    doctest.run_docstring_examples(iter_lines, globals(), verbose=False)
+
+
+if __name__ == '__main__':
+    test_doc()
@@ -0,0 +1,225 @@
+import doctest
+import hashlib
+import heapq
+import math
+
+"""
+Probabilistic sketches with bounded memory for the IP analytics.
+Todos usan un hash de 64 bits determinista (blake2b), de forma que los
+sketches de distintos procesos o de distintos días se pueden combinar
+con merge siempre que tengan la misma configuración.
+"""
+
+
+def _hash64(item: str | bytes) -> int:
+    if isinstance(item, str):
+        item = item.encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(item, digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """
+    HyperLogLog estimator of the number of distinct items.
+    Usa 2**precision registros de un byte; el error relativo típico
+    (desviación estándar) es 1.04 / sqrt(2**precision), es decir, un
+    0.81% con la precisión por defecto (14) y 16 KB de memoria.
+
+    Examples
+    --------
+    >>> hll = HyperLogLog()
+    >>> for i in range(10000):
+    ...     hll.add(f'10.0.{i // 256}.{i % 256}')
+    >>> abs(hll.count() - 10000) < 3 * hll.error * 10000
+    True
+    >>> other = HyperLogLog()
+    >>> for i in range(5000, 15000):
+    ...     other.add(f'10.0.{i // 256}.{i % 256}')
+    >>> hll.merge(other)
+    >>> abs(hll.count() - 15000) < 3 * hll.error * 15000
+    True
+    >>> HyperLogLog(precision=2)
+    Traceback (most recent call last):
+        ...
+    ValueError: precision must be between 4 and 18, not 2
+    """
+
+    def __init__(self, precision: int = 14):
+        if not 4 <= precision <= 18:
+            raise ValueError(f'precision must be between 4 and 18, not {precision}')
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+
+    @property
+    def error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def add(self, item: str | bytes) -> None:
+        x = _hash64(item)
+        index = x >> (64 - self.precision)
+        rest = x & ((1 << (64 - self.precision)) - 1)
+        # Posición del primer bit a 1 en los bits restantes.
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog') -> None:
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge HyperLogLog sketches with different precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        m = self.m
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Corrección para cardinalidades pequeñas (linear counting).
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+
+class CountMinSketch:
+    """
+    Count-Min sketch of the frequency of the items.
+    Con width = ceil(e / epsilon) y depth = ceil(ln(1 / delta)) la
+    estimación nunca es menor que la frecuencia real y, con probabilidad
+    1 - delta, la supera como mucho en epsilon * total.
+
+    Examples
+    --------
+    >>> cms = CountMinSketch.from_error(epsilon=0.001, delta=0.01)
+    >>> (cms.width, cms.depth)
+    (2719, 5)
+    >>> for i in range(1000):
+    ...     cms.add(f'10.0.0.{i % 10}')
+    >>> cms.estimate('10.0.0.1') >= 100, cms.estimate('10.0.0.1') <= 100 + 0.001 * cms.total
+    (True, True)
+    """
+
+    def __init__(self, width: int = 2719, depth: int = 5):
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self.table = [[0] * width for _ in range(depth)]
+
+    @classmethod
+    def from_error(cls, epsilon: float, delta: float) -> 'CountMinSketch':
+        return cls(math.ceil(math.e / epsilon), math.ceil(math.log(1 / delta)))
+
+    def _columns(self, item: str | bytes):
+        # Las depth funciones hash se derivan de un único hash de 64 bits
+        # (h1 + i * h2), como proponen Kirsch y Mitzenmacher.
+        x = _hash64(item)
+        h1, h2 = x >> 32, x & 0xFFFFFFFF
+        return ((h1 + i * h2) % self.width for i in range(self.depth))
+
+    def add(self, item: str | bytes, count: int = 1) -> None:
+        self.total += count
+        for row, column in zip(self.table, self._columns(item)):
+            row[column] += count
+
+    def estimate(self, item: str | bytes) -> int:
+        return min(row[column] for row, column in zip(self.table, self._columns(item)))
+
+    def merge(self, other: 'CountMinSketch') -> None:
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError('Cannot merge Count-Min sketches with different dimensions')
+        self.total += other.total
+        for row, other_row in zip(self.table, other.table):
+            for column, count in enumerate(other_row):
+                if count:
+                    row[column] += count
+
+
+class SpaceSaving:
+    """
+    Space-Saving summary of the k most frequent items.
+    Guarda como mucho k contadores. Cada contador sobreestima la
+    frecuencia real como mucho en su error, que a su vez es como mucho
+    total / k, así que todo elemento con frecuencia mayor que total / k
+    está en el resumen.
+
+    Examples
+    --------
+    >>> summary = SpaceSaving(k=3)
+    >>> for ip in ['a', 'b', 'a', 'c', 'a', 'd', 'b', 'a']:
+    ...     summary.add(ip)
+    >>> summary.top(2)
+    [('a', 4), ('b', 2)]
+    >>> other = SpaceSaving(k=3)
+    >>> for ip in ['b', 'b', 'b', 'e']:
+    ...     other.add(ip)
+    >>> summary.merge(other)
+    >>> summary.top(1)
+    [('b', 5)]
+    """
+
+    def __init__(self, k: int = 100):
+        self.k = k
+        self.total = 0
+        self.counts: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+        # Montículo de (contador, elemento) con entradas que pueden estar
+        # desactualizadas; se corrigen al buscar el mínimo.
+        self._heap: list[tuple[int, str]] = []
+
+    def add(self, item: str, count: int = 1) -> None:
+        self.total += count
+        if item in self.counts:
+            self.counts[item] += count
+            return
+        if len(self.counts) < self.k:
+            self.counts[item] = count
+            self.errors[item] = 0
+            heapq.heappush(self._heap, (count, item))
+            return
+        minimum, victim = self._pop_min()
+        del self.counts[victim], self.errors[victim]
+        self.counts[item] = minimum + count
+        self.errors[item] = minimum
+        heapq.heappush(self._heap, (minimum + count, item))
+
+    def _pop_min(self) -> tuple[int, str]:
+        while True:
+            count, item = heapq.heappop(self._heap)
+            current = self.counts.get(item)
+            if current == count:
+                return count, item
+            if current is not None:
+                heapq.heappush(self._heap, (current, item))
+
+    def _floor(self) -> int:
+        return min(self.counts.values()) if len(self.counts) >= self.k else 0
+
+    def merge(self, other: 'SpaceSaving') -> None:
+        floor, other_floor = self._floor(), other._floor()
+        counts, errors = {}, {}
+        for item in self.counts.keys() | other.counts.keys():
+            counts[item] = self.counts.get(item, floor) + other.counts.get(item, other_floor)
+            errors[item] = self.errors.get(item, floor) + other.errors.get(item, other_floor)
+        kept = heapq.nlargest(self.k, counts, key=lambda item: (counts[item], item))
+        self.counts = {item: counts[item] for item in kept}
+        self.errors = {item: errors[item] for item in kept}
+        self._heap = [(count, item) for item, count in self.counts.items()]
+        heapq.heapify(self._heap)
+        self.total += other.total
+
+    def top(self, n: int | None = None) -> list[tuple[str, int]]:
+        """
+        Returns the n items with the highest counts, from highest to lowest.
+        """
+        ranking = sorted(self.counts.items(), key=lambda pair: (-pair[1], pair[0]))
+        return ranking if n is None else ranking[:n]
+
+
+# ------------ test  ----------------#
+
+def test_doc() -> None:
+    doctest.run_docstring_examples(HyperLogLog, globals(), verbose=False)
+    doctest.run_docstring_examples(CountMinSketch, globals(), verbose=False)
+    doctest.run_docstring_examples(SpaceSaving, globals(), verbose=False)
+
+
+if __name__ == '__main__':
+    test_doc()
@@ -1,8 +1,22 @@
+import bz2
 import doctest
+import gzip
+import lzma
+import mmap
+import multiprocessing
+import os
 import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Iterable, Iterator, NamedTuple
 import logging
 
+from botdetect import DEFAULT_SIGNATURES, BotClassifier
+from logsources import expand_sources, is_compressed, iter_lines
+from sketches import HyperLogLog, SpaceSaving
+
 logging.basicConfig(filename='ej1.log',
                     filemode='w',
                     format='%(name)s - %(levelname)s - %(message)s')
@@ -12,10 +26,129 @@ Program to analize the logs files of an apache server.
 An example of file acommpanies this file: access.log
 """
 
+# ------------ parser rápido del formato combined ------------ #
+
+# Expresión regular precompilada para el formato combined de apache:
+# <ip> <ident> <user> [<fecha>] "<petición>" <estado> <bytes> "<referrer>" "<user agent>"
+_COMBINED_RE = re.compile(r'(?P<ip>\S+) \S+ \S+ \[(?P<time>[^\]]*)\] '
+                          r'"(?P<request>[^"]*)" (?P<status>\d{3}) (?P<size>\d+|-) '
+                          r'"(?P<referrer>[^"]*)" "(?P<user_agent>[^"]*)"')
+
+# Tablas de búsqueda para decodificar la fecha sin usar strptime.
+_MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+           'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+_DAYS = {f'{n:02d}': n for n in range(1, 32)}
+_HOURS = {f'{n:02d}': n for n in range(24)}
+_SIXTY = {f'{n:02d}': n for n in range(60)}
+
+_QUOTES_RE = re.compile('"(.*?)"')
+
+# Las mismas expresiones sobre bytes, para el camino con mmap: así ambos caminos
+# eligen el mismo campo como user agent y descartan las mismas líneas.
+_COMBINED_BYTES_RE = re.compile(_COMBINED_RE.pattern.encode())
+_QUOTES_BYTES_RE = re.compile(_QUOTES_RE.pattern.encode())
+_BLANK = ' \t\r\n\x0b\x0c'
+_NOT_BLANK_BYTES_RE = re.compile(rb'[^ \t\r\n\x0b\x0c]')
+
+# Clasificador de bots sobre el user agent (ver set_bot_signatures).
+_bot_classifier = BotClassifier()
+
+
+class LogRecord(NamedTuple):
+    """
+    Compact record with the fields of one line of the log.
+    Cada línea se procesa una única vez y el registro resultante
+    se reparte entre todos los agregadores. Los campos que no
+    se pudieron obtener quedan como None. tz_offset es el
+    desplazamiento de la zona horaria en minutos ('+0200' -> 120).
+    """
+    ip: str
+    year: int | None = None
+    month: int | None = None
+    day: int | None = None
+    hour: int | None = None
+    minute: int | None = None
+    second: int | None = None
+    tz_offset: int | None = None
+    method: str | None = None
+    path: str | None = None
+    protocol: str | None = None
+    status: int | None = None
+    size: int | None = None
+    referrer: str | None = None
+    user_agent: str | None = None
+    bot: bool = False
+
+
+def parse_combined(line: str) -> LogRecord | None:
+    """
+    Fast path parser of a line in the apache combined log format.
+    Usamos una única expresión regular precompilada y la fecha, que
+    tiene un formato fijo 'dd/Mon/YYYY:HH:MM:SS +zzzz', se decodifica
+    por posiciones con las tablas de búsqueda, sin strptime.
+    Si la línea no sigue el formato devuelve None, para que se
+    use el camino lento.
+
+    Examples
+    --------
+    >>> parse_combined('147.96.46.52 - - [10/Oct/2023:12:55:47 +0200] "GET /favicon.ico HTTP/1.1" 404 519 "https://antares.sip.ucm.es/" "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/117.0"')
+    LogRecord(ip='147.96.46.52', year=2023, month=10, day=10, hour=12, minute=55, second=47, tz_offset=120, method='GET', path='/favicon.ico', protocol='HTTP/1.1', status=404, size=519, referrer='https://antares.sip.ucm.es/', user_agent='Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/117.0', bot=False)
+
+    >>> parse_combined('189.217.221.3 - - [09/Oct/2023:02:39:44 +0200] "-" 408 0 "-" "-"').method is None
+    True
+
+    >>> parse_combined('66.249.66.35 - - [15/Sep/2023:25:18:46 +0200] "GET / HTTP/1.1" 200 10 "-" "-"') is None   # hora incorrecta
+    True
+
+    >>> parse_combined('línea sin formato') is None
+    True
+    """
+    match = _COMBINED_RE.match(line)
+    if match is None:
+        return None
+    timestamp = _parse_timestamp(match['time'])
+    if timestamp is None:
+        return None
+    year, month, day, hour, minute, second, tz_offset = timestamp
+    request = match['request'].split(' ')
+    method, path, protocol = request if len(request) == 3 else (None, None, None)
+    size = match['size']
+    return LogRecord(ip=match['ip'],
+                     year=year, month=month, day=day,
+                     hour=hour, minute=minute, second=second,
+                     tz_offset=tz_offset,
+                     method=method, path=path, protocol=protocol,
+                     status=int(match['status']),
+                     size=None if size == '-' else int(size),
+                     referrer=match['referrer'],
+                     user_agent=match['user_agent'],
+                     bot=_bot_classifier.is_bot(match['user_agent']))
+
+
+def _parse_timestamp(ts: str) -> tuple[int, int, int, int, int, int, int] | None:
+    # (año, mes, día, hora, minuto, segundo, zona en minutos) de 'dd/Mon/YYYY:HH:MM:SS +zzzz',
+    # o None si no tiene exactamente ese formato.
+    try:
+        if len(ts) != 26 or ts[6] != '/' or ts[11] != ':' or ts[20] != ' ' or ts[21] not in '+-':
+            return None
+        tz_offset = _HOURS[ts[22:24]] * 60 + _SIXTY[ts[24:26]]
+        year = ts[7:11]
+        if not year.isdigit():
+            return None
+        day, month, hour = _DAYS[ts[0:2]], _MONTHS[ts[3:6]], _HOURS[ts[12:14]]
+        minute, second = _SIXTY[ts[15:17]], _SIXTY[ts[18:20]]
+    except KeyError:
+        return None
+    return int(year), month, day, hour, minute, second, -tz_offset if ts[21] == '-' else tz_offset
+
+
+# ------------ funciones por línea ------------ #
+
 def get_user_agent(line: str) -> str:
     """
     Get the user agent of the line.
-    Buscamos todas las substrings que estan encerradas entre comillas,
+    Si la línea sigue el formato combined usamos el parser rápido.
+    En otro caso buscamos todas las substrings que estan encerradas entre comillas,
     es decir que son de la forma 
     "(.*?)"
     Esperamos que hayan tres de estas, el request, el url y el usuario. Regresamos la última.
@@ -28,11 +161,52 @@ def get_user_agent(line: str) -> str:
     >>> get_user_agent('147.96.46.52 - - [10/Oct/2023:12:55:47 +0200] "GET /favicon.ico HTTP/1.1" 404 519 "https://antares.sip.ucm.es/" "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/117.0"')
     'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/117.0'
     """
-    quotes_oc = re.findall('"(.*?)"', line)
+    record = parse_combined(line)
+    if record is not None:
+        return record.user_agent
+    return _user_agent_fallback(line)
+
+
+def _find_user_agent(line: str) -> str | None:
+    quotes_oc = _QUOTES_RE.findall(line)
     if len(quotes_oc) >= 3:
         return quotes_oc[2]
-    else:
+    return None
+
+
+def _user_agent_span(line, start: int, end: int, combined: re.Pattern,
+                     quotes: re.Pattern) -> tuple[int, int] | None:
+    # Posición del user agent en line[start:end] (str o bytes): el campo del formato
+    # combined o, si la línea no lo sigue, el tercer campo entre comillas.
+    match = combined.match(line, start, end)
+    if match is not None:
+        return match.span('user_agent')
+    for i, match in enumerate(quotes.finditer(line, start, end)):
+        if i == 2:
+            return match.span(1)
+    return None
+
+
+def _user_agent_fallback(line: str) -> str | None:
+    user_agent = _find_user_agent(line)
+    if user_agent is None:
         logging.error('La línea no tiene el formato esperado. No se pudo conseguir el usuario.')
+    return user_agent
+
+
+def set_bot_signatures(signatures: Iterable[str]) -> None:
+    '''
+    Replaces the signatures used to detect bots (see botdetect.DEFAULT_SIGNATURES).
+    '''
+    global _bot_classifier
+    _bot_classifier = BotClassifier(signatures)
+
+
+def _use_bot_signatures(signatures: tuple[str, ...] | None) -> None:
+    # En los procesos del pool: con el método spawn o forkserver no heredan el
+    # clasificador del proceso principal, así que las firmas llegan con cada tarea.
+    if signatures is not None and signatures != _bot_classifier.signatures:
+        set_bot_signatures(signatures)
 
 
 def is_bot(line: str) -> bool:
@@ -49,8 +223,15 @@ def is_bot(line: str) -> bool:
 
     >>> is_bot('213.180.203.109 - - [15/Sep/2023:00:12:18 +0200] "GET /robots.txt HTTP/1.1" 302 567 "-" "Mozilla/5.0 (compatible; YandexBot/3.0; +http://yandex.com/bots)"')
     True
+
+    >>> is_bot('72.30.14.57 - - [15/Sep/2023:00:12:18 +0200] "GET /robots.txt HTTP/1.1" 200 567 "-" "Mozilla/5.0 (compatible; Yahoo! Slurp; http://help.yahoo.com/help/us/ysearch/slurp)"')
+    True
+
+    >>> is_bot('147.96.46.52 - - [10/Oct/2023:12:55:47 +0200] "GET /robots.txt HTTP/1.1" 200 519 "-" "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/117.0"')   # solo cuenta el user agent
+    False
     '''
-    return 'bot' in line.lower()
+    span = _user_agent_span(line, 0, len(line), _COMBINED_RE, _QUOTES_RE)
+    return _bot_classifier.is_bot(line if span is None else line[span[0]:span[1]])
 
 
 def get_ipaddr(line):
@@ -70,7 +251,9 @@ def get_ipaddr(line):
 def get_hour(line: str) -> int:
     """
     Get the user agent of the line.
-    Suponemos que la fecha está en la primera
+    Si la línea sigue el formato combined usamos el parser rápido,
+    que decodifica la hora por posición con una tabla de búsqueda.
+    En otro caso suponemos que la fecha está en la primera
     ocurrencia de un grupo dentro de paréntesis cuadrados.
     Luego usamos el módulo datetime para obtener
     la hora de la fecha.
@@ -85,53 +268,541 @@ def get_hour(line: str) -> int:
 
     >>> get_hour('147.96.46.52 - - [10/Oct/2023:12:55:47 +0200] "GET /favicon.ico HTTP/1.1" 404 519 "https://antacres.sip.ucm.es/" "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/117.0"')
     12
+
+    >>> get_hour('1.2.3.4 - - [10/Oct/2023:12:55:47] "GET /"')   # sin zona horaria, camino lento
+    12
     """
-    date_line = re.findall('\[(.*?)\]', line)[0]
+    record = parse_combined(line)
+    if record is not None:
+        return record.hour
+    return _hour_fallback(line)
+
+
+def _hour_fallback(line: str) -> int:
+    date_line = re.findall(r'\[(.*?)\]', line)[0]
     datetime_object = datetime.strptime(date_line.split(' ')[0], '%d/%b/%Y:%H:%M:%S')
     return int(datetime_object.hour)
 
 
-def histbyhour(filename: str) -> dict[int, int]:
+def get_status(line: str) -> int | None:
+    """
+    Get the HTTP status code of the line.
+    El código de estado es el primer campo que sigue a la petición,
+    es decir, lo que hay después de la segunda comilla.
+
+    Examples
+    --------
+    >>> get_status('147.96.46.52 - - [10/Oct/2023:12:55:47 +0200] "GET /favicon.ico HTTP/1.1" 404 519 "https://antares.sip.ucm.es/" "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/117.0"')
+    404
+
+    >>> get_status('189.217.221.3 - - [09/Oct/2023:02:39:44 +0200] "-" 408 0 "-" "-"')
+    408
+
+    >>> get_status('línea sin formato') is None
+    True
+    """
+    record = parse_combined(line)
+    if record is not None:
+        return record.status
+    return _status_fallback(line)
+
+
+def _status_fallback(line: str) -> int | None:
+    parts = line.split('"', 3)
+    if len(parts) < 3:
+        return None
+    fields = parts[2].split()
+    if fields and fields[0].isdigit():
+        return int(fields[0])
+    return None
+
+
+def parse_line(line: str) -> LogRecord:
+    """
+    Parses a line of the log into a LogRecord.
+    Primero se intenta el parser rápido parse_combined. Si la línea
+    no sigue el formato combined se usa el camino lento, que solo
+    rellena la ip, la hora, el estado, el user agent y si es un bot.
+    Los errores al obtener la hora se registran en el log y
+    la hora queda como None, de forma que el resto de campos
+    (por ejemplo la IP) se sigan pudiendo agregar.
+
+    Examples
+    --------
+    >>> parse_line('66.249.66.35 - - [15/Sep/2023:00:18:46 +0200] "GET /~luis/sw05-06/libre_m2_baja.pdf HTTP/1.1" 200 5940849 "-" "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)"').hour
+    0
+
+    >>> parse_line('66.249.66.35 - - [15/Sep/2023:00:18:46] "GET / HTTP/1.1" 200 10 "-" "Googlebot"')   # camino lento
+    LogRecord(ip='66.249.66.35', year=None, month=None, day=None, hour=0, minute=None, second=None, tz_offset=None, method=None, path=None, protocol=None, status=200, size=None, referrer=None, user_agent='Googlebot', bot=True)
+    """
+    record = parse_combined(line)
+    if record is not None:
+        return record
+    try:
+        hour = _hour_fallback(line)
+    except (ValueError, IndexError) as e:
+        logging.error(f'Error obteniendo hora: {e}')
+        hour = None
+    return LogRecord(ip=get_ipaddr(line),
+                     hour=hour,
+                     status=_status_fallback(line),
+                     user_agent=_user_agent_fallback(line),
+                     bot=is_bot(line))
+
+
+class Aggregator:
+    """
+    Base class of the aggregators fed by analyze.
+    Cada agregador recibe los registros uno a uno con add
+    y devuelve su resultado final con result. Con merge se
+    combinan los resultados parciales de otro agregador del
+    mismo tipo (por ejemplo, el de otro proceso) y con empty se
+    obtiene un agregador vacío con la misma configuración.
+    """
+
+    def empty(self) -> 'Aggregator':
+        return type(self)()
+
+    def add(self, record: LogRecord) -> None:
+        raise NotImplementedError()
+
+    def merge(self, other: 'Aggregator') -> None:
+        raise NotImplementedError()
+
+    def result(self):
+        raise NotImplementedError()
+
+
+class HourHistogram(Aggregator):
+    """
+    Histogram of accesses by hour.
+
+    >>> agg = HourHistogram()
+    >>> agg.add(LogRecord(ip='1.1.1.1', hour=5, status=200, bot=False))
+    >>> agg.add(LogRecord(ip='1.1.1.2', hour=5, status=200, bot=True))
+    >>> agg.add(LogRecord(ip='1.1.1.3', hour=None, status=200, bot=False))
+    >>> agg.result()
+    {5: 2}
+    >>> other = HourHistogram()
+    >>> other.add(LogRecord(ip='1.1.1.4', hour=7, status=200, bot=False))
+    >>> agg.merge(other)
+    >>> agg.result()
+    {5: 2, 7: 1}
+    """
+
+    def __init__(self):
+        self.hist: dict[int, int] = {}
+
+    def add(self, record: LogRecord) -> None:
+        if record.hour is not None:
+            self.hist[record.hour] = self.hist.get(record.hour, 0) + 1
+
+    def merge(self, other: 'HourHistogram') -> None:
+        for hour, count in other.hist.items():
+            self.hist[hour] = self.hist.get(hour, 0) + count
+
+    def result(self) -> dict[int, int]:
+        return self.hist
+
+
+class NonBotIPs(Aggregator):
+    """
+    Set of the IPs of the accesses that are not bots.
+
+    >>> agg = NonBotIPs()
+    >>> agg.add(LogRecord(ip='1.1.1.1', hour=5, status=200, bot=False))
+    >>> agg.add(LogRecord(ip='1.1.1.2', hour=5, status=200, bot=True))
+    >>> agg.result()
+    {'1.1.1.1'}
+    """
+
+    def __init__(self):
+        self.ips: set[str] = set()
+
+    def add(self, record: LogRecord) -> None:
+        if not record.bot:
+            self.ips.add(record.ip)
+
+    def merge(self, other: 'NonBotIPs') -> None:
+        self.ips |= other.ips
+
+    def result(self) -> set[str]:
+        return self.ips
+
+
+class StatusCounts(Aggregator):
+    """
+    Number of accesses by HTTP status code.
+
+    >>> agg = StatusCounts()
+    >>> agg.add(LogRecord(ip='1.1.1.1', hour=5, status=200, bot=False))
+    >>> agg.add(LogRecord(ip='1.1.1.2', hour=5, status=404, bot=True))
+    >>> agg.add(LogRecord(ip='1.1.1.3', hour=5, status=200, bot=True))
+    >>> agg.result()
+    {200: 2, 404: 1}
+    """
+
+    def __init__(self):
+        self.counts: dict[int, int] = {}
+
+    def add(self, record: LogRecord) -> None:
+        if record.status is not None:
+            self.counts[record.status] = self.counts.get(record.status, 0) + 1
+
+    def merge(self, other: 'StatusCounts') -> None:
+        for status, count in other.counts.items():
+            self.counts[status] = self.counts.get(status, 0) + count
+
+    def result(self) -> dict[int, int]:
+        return self.counts
+
+
+class DistinctIPs(Aggregator):
+    """
+    Approximate number of distinct non-bot IPs, with a HyperLogLog sketch.
+    La memoria es fija (2**precision bytes) y el error relativo típico
+    es 1.04 / sqrt(2**precision). Para el conjunto exacto usar NonBotIPs.
+
+    >>> agg = DistinctIPs()
+    >>> for i in range(1000):
+    ...     agg.add(LogRecord(ip=f'10.0.{i // 256}.{i % 256}', bot=False))
+    >>> agg.add(LogRecord(ip='66.249.66.35', bot=True))
+    >>> abs(agg.result() - 1000) < 3 * agg.sketch.error * 1000
+    True
+    """
+
+    def __init__(self, precision: int = 14):
+        self.sketch = HyperLogLog(precision)
+
+    def empty(self) -> 'DistinctIPs':
+        return DistinctIPs(self.sketch.precision)
+
+    def add(self, record: LogRecord) -> None:
+        if not record.bot:
+            self.sketch.add(record.ip)
+
+    def merge(self, other: 'DistinctIPs') -> None:
+        self.sketch.merge(other.sketch)
+
+    def result(self) -> int:
+        return self.sketch.count()
+
+
+class TopIPs(Aggregator):
+    """
+    Approximate top of the non-bot IPs by number of accesses, with Space-Saving.
+    Guarda como mucho k contadores; cada cuenta sobreestima la real como
+    mucho en (accesos totales) / k.
+
+    >>> agg = TopIPs(k=2)
+    >>> for ip in ['1.1.1.1', '1.1.1.2', '1.1.1.1', '1.1.1.3', '1.1.1.1']:
+    ...     agg.add(LogRecord(ip=ip, bot=False))
+    >>> agg.result()
+    [('1.1.1.1', 3), ('1.1.1.3', 2)]
+    """
+
+    def __init__(self, k: int = 100):
+        self.summary = SpaceSaving(k)
+
+    def empty(self) -> 'TopIPs':
+        return TopIPs(self.summary.k)
+
+    def add(self, record: LogRecord) -> None:
+        if not record.bot:
+            self.summary.add(record.ip)
+
+    def merge(self, other: 'TopIPs') -> None:
+        self.summary.merge(other.summary)
+
+    def result(self) -> list[tuple[str, int]]:
+        return self.summary.top()
+
+
+def split_file(filename: str, parts: int) -> list[tuple[int, int]]:
+    '''
+    Splits the file in at most parts byte ranges aligned to line boundaries.
+    Cada rango [inicio, fin) empieza al principio de una línea, de forma
+    que cada línea pertenece exactamente a un rango. Si el fichero es
+    pequeño pueden salir menos rangos de los pedidos.
+    '''
+    size = os.path.getsize(filename)
+    boundaries = [0]
+    with open(filename, 'rb') as f:
+        for i in range(1, parts):
+            offset = size * i // parts
+            if offset <= boundaries[-1]:
+                continue
+            # Nos colocamos en el byte anterior y avanzamos hasta el
+            # comienzo de la siguiente línea.
+            f.seek(offset - 1)
+            f.readline()
+            position = f.tell()
+            if boundaries[-1] < position < size:
+                boundaries.append(position)
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _analyze_range(filename: str, start: int, end: int, aggregators: tuple[Aggregator, ...],
+                   signatures: tuple[str, ...] | None = None) -> tuple[Aggregator, ...]:
+    '''
+    Feeds the lines that start in the byte range [start, end) to the aggregators.
+    Se ejecuta en los procesos del pool y devuelve los agregadores parciales.
+    signatures son las firmas de bots del proceso principal (None: las actuales).
+    '''
+    _use_bot_signatures(signatures)
+
+    def lines() -> Iterator[str]:
+        with open(filename, 'rb') as f:
+            f.seek(start)
+            position = start
+            while position < end:
+                raw_line = f.readline()
+                if not raw_line:
+                    break
+                position += len(raw_line)
+                yield raw_line.decode('utf-8', errors='replace')
+
+    return _feed(lines(), aggregators)
+
+
+def _analyze_source(path: str, aggregators: tuple[Aggregator, ...], readahead: bool,
+                    signatures: tuple[str, ...] | None = None) -> tuple[Aggregator, ...]:
+    '''
+    Feeds a whole (possibly compressed) file to the aggregators.
+    Los ficheros comprimidos no se pueden dividir en rangos de bytes,
+    así que en el modo paralelo cada uno es una tarea.
+    '''
+    _use_bot_signatures(signatures)
+    return _feed(iter_lines(path, readahead), aggregators)
+
+
+def _feed(lines: Iterable[str], aggregators: tuple[Aggregator, ...]) -> tuple[Aggregator, ...]:
+    for log_line in lines:
+        if not log_line.strip(_BLANK):
+            continue
+        record = parse_line(log_line)
+        for aggregator in aggregators:
+            aggregator.add(record)
+    return aggregators
+
+
+def analyze(filename: str | list[str], *aggregators: Aggregator,
+            workers: int = 1, readahead: bool = False) -> tuple:
+    '''
+    Reads the log files once and feeds every line to all the aggregators.
+    Cada línea se lee y se procesa una sola vez, sin importar cuántos
+    agregadores se pidan. Devuelve una tupla con el resultado de cada
+    agregador, en el mismo orden en que se pasaron.
+    filename puede ser un fichero, un glob o una lista de ellos, incluidos
+    ficheros rotados y comprimidos (.gz, .bz2, .xz), que se descomprimen
+    al vuelo. Con readahead=True la descompresión se hace en un hilo aparte.
+    Con workers > 1 cada fichero sin comprimir se divide en rangos de bytes
+    alineados a líneas y cada fichero comprimido es una tarea; las tareas
+    se procesan en un pool de procesos con una copia vacía de los
+    agregadores y las firmas de bots actuales (ver set_bot_signatures),
+    y los resultados parciales se combinan al final con merge.
+    '''
+    paths = expand_sources(filename)
+    if workers > 1:
+        signatures = _bot_classifier.signatures
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = []
+            for path in paths:
+                if is_compressed(path):
+                    futures.append(pool.submit(_analyze_source, path,
+                                               tuple(aggregator.empty() for aggregator in aggregators),
+                                               readahead, signatures))
+                    continue
+                for start, end in split_file(path, workers):
+                    futures.append(pool.submit(_analyze_range, path, start, end,
+                                               tuple(aggregator.empty() for aggregator in aggregators),
+                                               signatures))
+            for future in futures:
+                for aggregator, partial in zip(aggregators, future.result()):
+                    aggregator.merge(partial)
+        return tuple(aggregator.result() for aggregator in aggregators)
+
+    _feed(iter_lines(paths, readahead), aggregators)
+    return tuple(aggregator.result() for aggregator in aggregators)
+
+
+# ------------ lectura a nivel de bytes con mmap ------------ #
+
+
+
+def is_bot_bytes(buffer: bytes, start: int = 0, end: int | None = None) -> bool:
+    '''
+    Check if the line in buffer[start:end] corresponds to a bot.
+    Igual que is_bot pero sobre bytes: el user agent se elige con las
+    mismas reglas (ver _user_agent_span), se busca directamente en el
+    buffer y solo se decodifica si no está ya en la caché del clasificador.
+
+    Examples
+    --------
+    >>> is_bot_bytes(b'66.249.66.35 - - [15/Sep/2023:00:18:46 +0200] "GET / HTTP/1.1" 200 10 "-" "Mozilla/5.0 (compatible; Googlebot/2.1)"')
+    True
+    >>> is_bot_bytes(b'147.96.46.52 - - [10/Oct/2023:12:55:47 +0200] "GET / HTTP/1.1" 404 519 "-" "Firefox/117.0"\\nGooglebot', 0, 90)
+    False
+    >>> is_bot_bytes(b'1.2.3.4 - - [10/Oct/2023:12:55:47 +0200] "GET / HTTP/1.1" 200 1 "-" "Firefox" "Googlebot"')   # como is_bot
+    False
+    '''
+    if end is None:
+        end = len(buffer)
+    span = _user_agent_span(buffer, start, end, _COMBINED_BYTES_RE, _QUOTES_BYTES_RE)
+    if span is None:
+        return _bot_classifier.is_bot(buffer[start:end])
+    return _bot_classifier.is_bot(buffer[span[0]:span[1]])
+
+
+@contextmanager
+def _mapped(filename: str):
+    '''
+    Maps the file in memory in read mode. Un fichero vacío no se puede
+    mapear, así que en ese caso se devuelve un bytes vacío.
+    '''
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield mm
+
+
+def _line_spans(buffer: bytes) -> Iterator[tuple[int, int]]:
+    '''
+    Yields the (start, end) positions of the non blank lines of the buffer.
+    Se buscan los saltos de línea directamente en el buffer, sin crear
+    un objeto por línea. Como en analyze, solo se saltan las líneas en blanco.
+
+    >>> list(_line_spans(b'ab\\n \\t\\n cd'))
+    [(0, 2), (6, 9)]
+    '''
+    position, size = 0, len(buffer)
+    while position < size:
+        end = buffer.find(b'\n', position)
+        if end == -1:
+            end = size
+        if _NOT_BLANK_BYTES_RE.search(buffer, position, end):
+            yield position, end
+        position = end + 1
+
+
+def _ipaddreses_mmap(paths: list[str]) -> set[str]:
+    '''
+    Bytes-level version of ipaddreses over the memory-mapped files.
+    Solo se copia la IP de las líneas que no son bots, y cada IP
+    distinta se decodifica una única vez al final.
+    '''
+    raw_ips = set()
+    for path in paths:
+        with _mapped(path) as buffer:
+            for start, end in _line_spans(buffer):
+                if is_bot_bytes(buffer, start, end):
+                    continue
+                space = buffer.find(b' ', start, end)
+                raw_ips.add(buffer[start:end if space == -1 else space])
+    return {raw_ip.decode('utf-8', errors='replace') for raw_ip in raw_ips}
+
+
+def _histbyhour_mmap(paths: list[str]) -> dict[int, int]:
+    '''
+    Bytes-level version of histbyhour over the memory-mapped files.
+    Las líneas en formato combined se reconocen sobre los bytes y solo se
+    decodifica su fecha, que se valida entera igual que en parse_combined.
+    Si no, se decodifica la línea y se usa get_hour, como en analyze.
+    '''
+    hour_dict = {}
+    for path in paths:
+        with _mapped(path) as buffer:
+            for start, end in _line_spans(buffer):
+                match = _COMBINED_BYTES_RE.match(buffer, start, end)
+                timestamp = None
+                if match is not None:
+                    timestamp = _parse_timestamp(match['time'].decode('utf-8', errors='replace'))
+                if timestamp is not None:
+                    hour = timestamp[3]
+                else:
+                    try:
+                        hour = get_hour(buffer[start:end].decode('utf-8', errors='replace'))
+                    except (ValueError, IndexError) as e:
+                        logging.error(f'Error obteniendo hora: {e}')
+                        continue
+                hour_dict[hour] = hour_dict.get(hour, 0) + 1
+    return hour_dict
+
+
+def histbyhour(filename: str | list[str], workers: int = 1,
+               readahead: bool = False) -> dict[int, int]:
     '''
     Computes the histogram of access by hour.
     Creamos un diccionario cuyas claves son las horas,
     y sus valores son cuantas líneas tienen
-    dicha hora. Ponemos el try dentro de la lectura de
-    cada línea para evitar que una línea
+    dicha hora. Las líneas incorrectas se registran en el log
+    desde parse_line, para evitar que una línea
     incorrecta e intermedia arruine todo el programa.
+    filename puede ser también un glob o una lista de ficheros, rotados
+    o comprimidos (ver analyze).
+    Con workers > 1 los ficheros se procesan en paralelo; si no, y
+    ninguno está comprimido, se recorren mapeados en memoria a nivel de bytes.
     '''
-    hour_dict = {}
-    with open(filename, 'r') as f:
-        for log_line in f:
-            try:
-                hour_line = get_hour(log_line)
-                hour_dict[hour_line] = hour_dict.get(hour_line, 0) + 1
-            except ValueError as e:
-                logging.error(f'Error obteniendo hora: {e}')
-    return hour_dict
+    paths = expand_sources(filename)
+    if workers == 1 and not any(is_compressed(path) for path in paths):
+        return _histbyhour_mmap(paths)
+    hist, = analyze(paths, HourHistogram(), workers=workers, readahead=readahead)
+    return hist
 
 
-def ipaddreses(filename: str) -> set[str]:
+def ipaddreses(filename: str | list[str], workers: int = 1,
+               readahead: bool = False) -> set[str]:
     '''
     Returns the IPs of the accesses that are not bots
+    filename puede ser también un glob o una lista de ficheros, rotados
+    o comprimidos (ver analyze).
+    Con workers > 1 los ficheros se procesan en paralelo; si no, y
+    ninguno está comprimido, se recorren mapeados en memoria a nivel de bytes.
     '''
-    ipaddreses_set = set()
-    with open(filename, 'r') as f:
-        for log_line in f:
-            try:
-                if not is_bot(log_line):
-                    ipadd_line = get_ipaddr(log_line)
-                    ipaddreses_set.add(ipadd_line)
-            except ValueError as e:
-                logging.error(f'Error obteniendo ip address: {e}')
-    return ipaddreses_set
+    paths = expand_sources(filename)
+    if workers == 1 and not any(is_compressed(path) for path in paths):
+        return _ipaddreses_mmap(paths)
+    ips, = analyze(paths, NonBotIPs(), workers=workers, readahead=readahead)
+    return ips
+
+
+def count_ipaddreses(filename: str | list[str], workers: int = 1, readahead: bool = False,
+                     precision: int = 14) -> int:
+    '''
+    Approximate number of distinct IPs of the accesses that are not bots.
+    Usa memoria fija, a diferencia de len(ipaddreses(filename)).
+    '''
+    count, = analyze(filename, DistinctIPs(precision), workers=workers, readahead=readahead)
+    return count
+
+
+def top_ipaddreses(filename: str | list[str], n: int = 10, workers: int = 1,
+                   readahead: bool = False, k: int = 1000) -> list[tuple[str, int]]:
+    '''
+    Approximate n IPs (not bots) with more accesses, with their number of accesses.
+    '''
+    top, = analyze(filename, TopIPs(k), workers=workers, readahead=readahead)
+    return top[:n]
 
 
 def test_doc():
+    doctest.run_docstring_examples(parse_combined, globals(), verbose=True)
     doctest.run_docstring_examples(get_user_agent, globals(), verbose=True)
     doctest.run_docstring_examples(is_bot, globals(), verbose=True)
     doctest.run_docstring_examples(get_ipaddr, globals(), verbose=True)
+    doctest.run_docstring_examples(is_bot_bytes, globals(), verbose=True)
+    doctest.run_docstring_examples(_line_spans, globals(), verbose=True)
     doctest.run_docstring_examples(get_hour, globals(), verbose=True)
+    doctest.run_docstring_examples(get_status, globals(), verbose=True)
+    doctest.run_docstring_examples(parse_line, globals(), verbose=True)
+    doctest.run_docstring_examples(HourHistogram, globals(), verbose=True)
+    doctest.run_docstring_examples(NonBotIPs, globals(), verbose=True)
+    doctest.run_docstring_examples(StatusCounts, globals(), verbose=True)
+    doctest.run_docstring_examples(DistinctIPs, globals(), verbose=True)
+    doctest.run_docstring_examples(TopIPs, globals(), verbose=True)
 
 
 def test_ipaddresses(filename: str, ipadds_dict: dict):
@@ -143,12 +814,97 @@ def test_hist(filename: str, hist_dict: dict):
     assert hist == hist_dict
 
 
+def test_analyze(filename: str, ipadds_dict: dict, hist_dict: dict):
+    # Ambos resultados se obtienen en una única lectura del fichero.
+    ips, hist = analyze(filename, NonBotIPs(), HourHistogram())
+    assert ips == ipadds_dict
+    assert hist == hist_dict
+
+
+def test_parallel(filename: str, ipadds_dict: dict, hist_dict: dict):
+    # Los rangos deben cubrir el fichero completo y empezar al inicio de una línea.
+    ranges = split_file(filename, 4)
+    assert ranges[0][0] == 0 and ranges[-1][1] == os.path.getsize(filename)
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    assert ipaddreses(filename, workers=4) == ipadds_dict
+    assert histbyhour(filename, workers=4) == hist_dict
+
+
+def test_signatures(filename: str):
+    # Los procesos del pool usan las firmas del proceso principal, también con spawn.
+    set_bot_signatures(['firefox'])
+    try:
+        ips, = analyze(filename, NonBotIPs())
+        assert analyze(filename, NonBotIPs(), workers=2) == (ips,)
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            partial, = pool.submit(_analyze_range, filename, 0, os.path.getsize(filename),
+                                   (NonBotIPs(),), _bot_classifier.signatures).result()
+        assert partial.result() == ips
+    finally:
+        set_bot_signatures(DEFAULT_SIGNATURES)
+
+
+def test_sketches(filename: str, ipadds_dict: dict):
+    # Con pocas IPs el HyperLogLog es prácticamente exacto.
+    assert count_ipaddreses(filename) == len(ipadds_dict)
+    assert count_ipaddreses(filename, workers=4) == len(ipadds_dict)
+    assert {ip for ip, _ in top_ipaddreses(filename, n=len(ipadds_dict), workers=4)} == ipadds_dict
+
+
+def test_rotated(filename: str, ipadds_dict: dict, hist_dict: dict):
+    # Repartimos el fichero entre varios ficheros rotados y comprimidos.
+    with open(filename, 'rb') as f:
+        lines = f.readlines()
+    with tempfile.TemporaryDirectory() as tmp:
+        base = os.path.join(tmp, 'access.log')
+        third = len(lines) // 3
+        with lzma.open(base + '.3.xz', 'wb') as f:
+            f.writelines(lines[:third])
+        with bz2.open(base + '.2.bz2', 'wb') as f:
+            f.writelines(lines[third:2 * third])
+        with gzip.open(base + '.1.gz', 'wb') as f:
+            f.writelines(lines[2 * third:-1])
+        with open(base, 'wb') as f:
+            f.writelines(lines[-1:])
+        for workers, readahead in [(1, False), (1, True), (2, False)]:
+            assert ipaddreses(base + '*', workers, readahead) == ipadds_dict
+            assert histbyhour(base + '*', workers, readahead) == hist_dict
+
+
+def test_malformed():
+    # El camino con mmap y analyze deben coincidir también en líneas que no siguen el formato.
+    lines = [b'66.249.66.35 - - [15/Sep/2023:00:18:46 +0200] "GET / HTTP/1.1" 200 10 "-" "Googlebot/2.1"',
+             b'5.6.7.8 - - [10/Oct/2023:13:00:00 +0200] "GET / HTTP/1.1" 200 10 "-" "Firefox" "Googlebot"',
+             b'  1.2.3.4 - - [10/Oct/2023:12:55:47 +0200] "GET / HTTP/1.1" 200 10 "-" "Firefox"',
+             b'9.9.9.9 - - [10/Oct/2023:14:00:00] "GET /" "-" "Firefox" "Googlebot"',
+             b'8.8.8.8 sin formato',
+             b'7.7.7.7 - - [10/Oct/2023:12:99:00 +0200] "GET / HTTP/1.1" 200 10 "-" "Firefox"',
+             b' \t',
+             b'']
+    with tempfile.TemporaryDirectory() as tmp:
+        fname = os.path.join(tmp, 'malformed.log')
+        with open(fname, 'wb') as f:
+            f.write(b'\n'.join(lines))
+        ips, hist = analyze(fname, NonBotIPs(), HourHistogram())
+        assert ips == {'5.6.7.8', '', '9.9.9.9', '8.8.8.8', '7.7.7.7'}
+        assert ipaddreses(fname) == ips
+        # La línea con minuto 99 no cuenta en el histograma en ningún camino.
+        assert histbyhour(fname) == histbyhour(fname, workers=2) == hist == {0: 1, 12: 1, 13: 1, 14: 1}
+
+
 def main(filename: str, ip_addresses: set, hist_dict: dict):
 
     # Ejecutamos las funciones de prueba
     test_doc()
     test_ipaddresses(filename, ip_addresses)
     test_hist(filename, hist_dict)
+    test_analyze(filename, ip_addresses, hist_dict)
+    test_parallel(filename, ip_addresses, hist_dict)
+    test_signatures(filename)
+    test_sketches(filename, ip_addresses)
+    test_rotated(filename, ip_addresses, hist_dict)
+    test_malformed()
 
     logging.info("¡Éxito!")
 
@@ -160,8 +916,9 @@ if __name__ == '__main__':
     main(filename='access_short.log', ip_addresses=ips_add_short, hist_dict=hist_dict_short)
 
     # Probar el archivo normal:
+    # 65.154.226.171 no aparece porque su user agent es HeadlessChrome.
     ips_add_all = {'203.2.64.59','189.217.221.3', '34.132.45.188',
-                   '20.120.74.197', '188.76.13.241', '65.154.226.171',
+                   '20.120.74.197', '188.76.13.241',
                    '119.120.163.213', '94.23.8.213', '23.229.104.2',
                    '147.96.60.31', '34.105.93.183', '39.103.168.88',
                    '185.105.102.189', '34.79.162.186'}
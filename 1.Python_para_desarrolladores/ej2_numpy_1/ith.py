@@ -1,12 +1,24 @@
 # imports
 
+import os
+import tempfile
+from typing import NamedTuple
+
 import numpy as np
 
+from raster_io import load_text
+from running_stats import RunningStats
+
+# Tamaño máximo de cada bloque de filas en los cálculos por bloques (bytes por buffer)
+TILE_BYTES = 16 * 1024 * 1024
 
-def summary(a: np.ndarray) -> tuple[float, float, float, float]:
+
+def summary(a: np.ndarray, skipna: bool = False) -> tuple[float, float, float, float]:
     """
     function that returns the minimum, maximum, mean and standard deviation of an array
     :param a: ndarray
+    :param skipna: bool
+       if True, the nan cells are ignored (see running_stats.RunningStats)
     :return: tuple of float
        a tuple of four float values: min, max, mean, std
     Examples
@@ -15,6 +27,8 @@ def summary(a: np.ndarray) -> tuple[float, float, float, float]:
     (1, 6, 3.5, 1.707825127659933)
     >>> summary(np.array([[1,np.nan,3], [4,5,6]]))   # array con un nan
     (nan, nan, nan, nan)
+    >>> summary(np.array([[1,np.nan,3], [4,5,6]]), skipna=True)   # ignorando el nan
+    (1.0, 6.0, 3.8, 1.7204650534085253)
     >>> summary(np.array([]))   # array vacío
     Traceback (most recent call last):
     ...
@@ -22,6 +36,10 @@ def summary(a: np.ndarray) -> tuple[float, float, float, float]:
     """
 
     # write your code here
+    if skipna:
+        stats = RunningStats(skipna=True)
+        stats.update(a)
+        return stats.result()
     return (np.min(a), np.max(a), np.mean(a), np.std(a))
 
 
@@ -40,8 +58,9 @@ def check_nulls(a: np.ndarray) -> bool:
     >>> check_nulls(np.array([]))   # array vacío
     True
     """
-    # write your code here
-    return not any(np.isnan(a.flatten()))
+    # np.isnan(a).any() recorre el array en C, sin copiarlo con flatten
+    # ni iterar elemento a elemento con el any de Python.
+    return not np.isnan(a).any()
 
 
 def ith(temperature: np.ndarray, humidity: np.ndarray) -> np.ndarray:
@@ -70,12 +89,189 @@ def ith(temperature: np.ndarray, humidity: np.ndarray) -> np.ndarray:
     ValueError: Shape of data sensors must be the same. Temperature: (2, 2) != humidity: (2, 3)
     """
 
+    # El cálculo se hace por bloques para no crear temporales del tamaño de la malla.
+    return ith_tiled(temperature, humidity)
+
+
+def _tile_rows(shape: tuple[int, ...], itemsize: int, tile_rows: int | None) -> int:
+    """
+    Number of rows (first axis) of each tile, so that a tile buffer has at most TILE_BYTES.
+    """
+    if tile_rows is not None:
+        return max(1, tile_rows)
+    row_bytes = itemsize * int(np.prod(shape[1:], dtype=np.int64))
+    return max(1, TILE_BYTES // max(1, row_bytes))
+
+
+def ith_tiled(temperature: np.ndarray, humidity: np.ndarray, out: np.ndarray | None = None,
+              tile_rows: int | None = None) -> np.ndarray:
+    """
+    Calculates the THI by tiles of rows, writing the result in out.
+    Las entradas pueden ser np.memmap: solo se lee un bloque de filas cada vez
+    y todas las operaciones se hacen in situ sobre dos buffers del tamaño del
+    bloque (parámetro out= de las ufuncs), así que la memoria usada depende del
+    tamaño del bloque y no del de la malla. El orden de las operaciones es el
+    mismo que en la fórmula de ith, por lo que el resultado es idéntico.
+    :param out: np.ndarray
+        array (or memmap) where the result is written. If None, a new array is created.
+    :param tile_rows: int
+        rows per tile. By default, the rows that fit in TILE_BYTES.
+    :return: np.ndarray
+        out, with the temperature-humidity index (THI)
+    :raise ValueError: if shape of input arrays is not the same
+    >>> ith_tiled(np.array([[1,2,3], [4,5,6]]), np.array([[1,2,3], [4,5,6]]), tile_rows=1)
+    array([[47., 48., 48.],
+           [49., 50., 51.]])
+    """
     if temperature.shape != humidity.shape:
         raise ValueError(f"Shape of data sensors must be the same. Temperature: {temperature.shape} != humidity: {humidity.shape}")
-    else:
-        return np.around(0.8*temperature + (1/100*humidity)*(temperature - 14.3) + 46.4)
+    dtype = np.result_type(temperature, humidity, 14.3)
+    if out is None:
+        out = np.empty(temperature.shape, dtype=dtype)
+    elif out.shape != temperature.shape:
+        raise ValueError(f"Shape of output must be {temperature.shape}, not {out.shape}")
+    if temperature.ndim == 0:
+        out[...] = np.around(0.8*temperature + (1/100*humidity)*(temperature - 14.3) + 46.4)
+        return out
 
-    # write your code here
+    rows = _tile_rows(temperature.shape, dtype.itemsize, tile_rows)
+    a, b = _tile_buffers(temperature.shape, rows, dtype)
+    for start in range(0, temperature.shape[0], rows):
+        t = temperature[start:start + rows]
+        _thi_tile(t, humidity[start:start + rows], a, b, out[start:start + t.shape[0]])
+    return out
+
+
+def _tile_buffers(shape: tuple[int, ...], rows: int, dtype: np.dtype) -> tuple[np.ndarray, np.ndarray]:
+    buffer_shape = (min(rows, shape[0]),) + shape[1:]
+    return np.empty(buffer_shape, dtype=dtype), np.empty(buffer_shape, dtype=dtype)
+
+
+def _thi_tile(t: np.ndarray, h: np.ndarray, a: np.ndarray, b: np.ndarray, out: np.ndarray) -> None:
+    """
+    THI of one tile, computed in place over the buffers a and b and written in out.
+    """
+    n = t.shape[0]
+    ta, tb = a[:n], b[:n]
+    np.multiply(1/100, h, out=ta)       # 1/100*humidity
+    np.subtract(t, 14.3, out=tb)        # temperature - 14.3
+    np.multiply(ta, tb, out=ta)
+    np.multiply(0.8, t, out=tb)         # 0.8*temperature
+    np.add(tb, ta, out=tb)
+    np.add(tb, 46.4, out=tb)
+    np.around(tb, out=out)
+
+
+class ThiAnalysis(NamedTuple):
+    """
+    Results of analyze_thi: the THI, the stress mask, the validity of the
+    data (same as check_nulls) and the summary of the THI (same as summary).
+    """
+    thi: np.ndarray
+    stress: np.ndarray
+    valid: bool
+    summary: tuple[float, float, float, float]
+
+
+def analyze_thi(temperature: np.ndarray, humidity: np.ndarray, thi_out: np.ndarray | None = None,
+                stress_out: np.ndarray | None = None, tile_rows: int | None = None) -> ThiAnalysis:
+    """
+    Calculates THI, stress mask, null check and summary in a single pass over the data.
+    Equivale a llamar a ith, isStress, check_nulls y summary (sobre el THI),
+    pero cada bloque de filas se lee una sola vez: mientras el bloque está en
+    caché se calcula el THI, la máscara de estrés y sus estadísticas parciales
+    (mínimo, máximo, suma y suma de cuadrados centrada), que se combinan al
+    final con la fórmula de Chan para la varianza. La comprobación de NaN
+    aprovecha la suma del bloque: solo si es NaN se busca el NaN
+    (ver running_stats.RunningStats).
+    :param thi_out: np.ndarray
+        array (or memmap) where the THI is written. If None, a new array is created.
+    :param stress_out: np.ndarray
+        boolean array (or memmap) where the stress mask is written. If None, a new array is created.
+    :return: ThiAnalysis
+    :raise ValueError: if shape of input arrays is not the same or they are empty
+    >>> result = analyze_thi(np.array([[30, 35, 3], [4, 5, 6]]), np.array([[80, 90, 3], [4, 5, 6]]), tile_rows=1)
+    >>> result.thi
+    array([[83., 93., 48.],
+           [49., 50., 51.]])
+    >>> result.stress
+    array([[ True,  True, False],
+           [False, False, False]])
+    >>> result.valid, result.summary
+    (True, (48.0, 93.0, 62.333333333333336, 18.399879226656775))
+    >>> analyze_thi(np.array([[1,np.nan,3], [4,5,6]]), np.array([[1,2,3], [4,5,6]])).summary   # array con un nan
+    (nan, nan, nan, nan)
+    >>> analyze_thi(np.array([[np.inf, 1]]), np.array([[0, 1]])).valid   # THI nan, pero los datos no tienen nan
+    True
+    >>> analyze_thi(np.array([]), np.array([]))   # array vacío
+    Traceback (most recent call last):
+    ...
+    ValueError: zero-size array to reduction operation minimum which has no identity
+    """
+    if temperature.shape != humidity.shape:
+        raise ValueError(f"Shape of data sensors must be the same. Temperature: {temperature.shape} != humidity: {humidity.shape}")
+    if temperature.size == 0:
+        raise ValueError("zero-size array to reduction operation minimum which has no identity")
+    if temperature.ndim == 0:
+        temperature, humidity = temperature.reshape(1), humidity.reshape(1)
+    dtype = np.result_type(temperature, humidity, 14.3)
+    thi = np.empty(temperature.shape, dtype=dtype) if thi_out is None else thi_out
+    stress = np.empty(temperature.shape, dtype=bool) if stress_out is None else stress_out
+
+    rows = _tile_rows(temperature.shape, dtype.itemsize, tile_rows)
+    a, b = _tile_buffers(temperature.shape, rows, dtype)
+    stats = RunningStats(skipna=False)
+    valid = True
+    for start in range(0, temperature.shape[0], rows):
+        t, h = temperature[start:start + rows], humidity[start:start + rows]
+        n = t.shape[0]
+        tile = thi[start:start + n]
+        _thi_tile(t, h, a, b, tile)
+        np.greater(tile, 78, out=stress[start:start + n])
+        # Estadísticas del bloque, combinadas con las acumuladas (Chan et al.)
+        nan_count = stats.nan_count
+        stats.update(tile, work=b[:n])
+        # Un NaN en los datos da NaN en el THI, pero no al revés (0 * inf):
+        # solo si el THI del bloque tiene NaN se buscan en los datos.
+        if valid and stats.nan_count > nan_count:
+            valid = check_nulls(t) and check_nulls(h)
+    return ThiAnalysis(thi, stress, valid, stats.result())
+
+
+def ith_memmap(temperature_path: str, humidity_path: str, output_path: str,
+               tile_rows: int | None = None) -> np.memmap:
+    """
+    Calculates the THI of two rasters stored as .npy files, without loading them in memory.
+    Las entradas se abren con np.load(mmap_mode='r') y el resultado se escribe
+    en un fichero .npy mapeado en memoria, bloque a bloque.
+    :return: np.memmap
+        the output raster, mapped in read/write mode
+    """
+    temperature = np.load(temperature_path, mmap_mode='r')
+    humidity = np.load(humidity_path, mmap_mode='r')
+    if temperature.shape != humidity.shape:
+        raise ValueError(f"Shape of data sensors must be the same. Temperature: {temperature.shape} != humidity: {humidity.shape}")
+    out = np.lib.format.open_memmap(output_path, mode='w+',
+                                    dtype=np.result_type(temperature, humidity, 14.3),
+                                    shape=temperature.shape)
+    ith_tiled(temperature, humidity, out=out, tile_rows=tile_rows)
+    out.flush()
+    return out
+
+
+def load_sensors(temperature_fname: str = 'datos/temperaturas.txt',
+                 humidity_fname: str = 'datos/humedad.txt',
+                 mmap: bool = False) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Loads the temperature and humidity grids through their binary cache
+    (ver raster_io.load_text): el texto se parsea solo la primera vez.
+    :param mmap: bool
+        if True, return the cached grids mapped in read only mode, without copying them
+    :return: tuple of np.ndarray
+       temperature and humidity, as writable arrays (np.memmap if mmap)
+    """
+    grids = load_text(temperature_fname), load_text(humidity_fname)
+    return grids if mmap else tuple(np.array(grid) for grid in grids)
 
 
 def isStress(ith: np.ndarray) -> np.ndarray:
@@ -110,10 +306,57 @@ def test_doc() -> None:
     """
     doctest.run_docstring_examples(check_nulls, globals(), verbose=False)  # vemos los resultados de los test
     doctest.run_docstring_examples(ith, globals(), verbose=False)  # vemos los resultados de los test
+    doctest.run_docstring_examples(ith_tiled, globals(), verbose=False)
+    doctest.run_docstring_examples(analyze_thi, globals(), verbose=False)
     doctest.run_docstring_examples(isStress, globals(), verbose=False)  # solo los resultados de los test que fallan
     doctest.run_docstring_examples(summary, globals(), verbose=False)  # solo los resultados de los test que fallan
 
 
+def test_tiled() -> None:
+    """
+    Compares the tiled THI with the direct formula over the sensor data,
+    both in memory and through memory-mapped files.
+    """
+    temperature, humidity = load_sensors()
+    expected = np.around(0.8*temperature + (1/100*humidity)*(temperature - 14.3) + 46.4)
+    for tile_rows in (1, 7, 1000):
+        assert np.array_equal(ith_tiled(temperature, humidity, tile_rows=tile_rows), expected)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [os.path.join(tmp, name) for name in ('t.npy', 'h.npy', 'thi.npy')]
+        np.save(paths[0], temperature)
+        np.save(paths[1], humidity)
+        ith_memmap(*paths, tile_rows=10)
+        assert np.array_equal(np.load(paths[2]), expected)
+    mapped = load_sensors(mmap=True)
+    assert all(isinstance(grid, np.memmap) and not grid.flags.writeable for grid in mapped)
+    assert all(not isinstance(grid, np.memmap) and grid.flags.writeable for grid in (temperature, humidity))
+    assert np.array_equal(ith_tiled(*mapped, tile_rows=7), expected)
+
+
+def test_fused() -> None:
+    """
+    Compares analyze_thi with the separate functions over the sensor data.
+    """
+    temperature, humidity = load_sensors()
+    thi = ith(temperature, humidity)
+    for tile_rows in (1, 7, 1000):
+        result = analyze_thi(temperature, humidity, tile_rows=tile_rows)
+        assert np.array_equal(result.thi, thi)
+        assert np.array_equal(result.stress, isStress(thi))
+        assert result.valid == check_nulls(temperature) == check_nulls(humidity)
+        assert np.allclose(result.summary, summary(thi))
+    temperature[50, 50] = np.nan
+    result = analyze_thi(temperature, humidity, tile_rows=7)
+    assert not result.valid and np.isnan(result.summary).all()
+    temperature[50, 50], humidity = np.inf, np.array(humidity)
+    humidity[50, 50] = 0
+    result = analyze_thi(temperature, humidity, tile_rows=7)
+    assert result.valid == check_nulls(temperature) == check_nulls(humidity) == True
+    assert np.array_equal(result.stress, isStress(ith(temperature, humidity)))
+
+
 if __name__ == "__main__":
     test_doc()  # executing tests
+    test_tiled()
+    test_fused()
 
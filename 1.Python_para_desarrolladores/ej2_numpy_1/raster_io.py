@@ -0,0 +1,253 @@
+# imports
+
+import doctest
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+"""
+Binary raster storage for the grids that are distributed as text files.
+Un fichero de texto se convierte una sola vez a un fichero binario con
+cabecera (dtype, shape, nodata y la marca del fichero de origen) seguida
+de los datos en orden C; las lecturas posteriores abren ese fichero con
+np.memmap, sin volver a parsear el texto.
+También lo usa ej3_numpy_2/numpy_example_2/zonal_stat.py, que añade este
+directorio al path.
+"""
+
+MAGIC = b'RASTER1\n'
+ALIGN = 64                      # los datos empiezan en un múltiplo de 64 bytes
+CACHE_DIR = '__rastercache__'   # subdirectorio junto al fichero de texto
+PARALLEL_BYTES = 8 * 1024 ** 2  # por debajo de este tamaño se parsea en un solo proceso
+
+
+class RasterHeader(NamedTuple):
+    """
+    Metadata of a binary raster. source es (tamaño, mtime_ns) del fichero
+    de texto del que se convirtió, o None.
+    """
+    dtype: np.dtype
+    shape: tuple[int, ...]
+    nodata: float | None = None
+    source: tuple[int, int] | None = None
+
+
+def _stamp(fname: str) -> tuple[int, int]:
+    st = os.stat(fname)
+    return st.st_size, st.st_mtime_ns
+
+
+def write_raster(path: str, data: np.ndarray, nodata: float | None = None,
+                 source: tuple[int, int] | None = None) -> None:
+    """
+    Writes an array as a binary raster. El fichero se escribe en un temporal
+    y se renombra, así que un lector nunca ve un raster a medio escribir.
+    """
+    data = np.ascontiguousarray(data)
+    header = json.dumps({'dtype': data.dtype.str, 'shape': list(data.shape), 'nodata': nodata,
+                         'source': None if source is None else list(source)}).encode()
+    size = len(MAGIC) + 4 + len(header) + 1
+    header += b' ' * (-size % ALIGN) + b'\n'
+    directory = os.path.dirname(path) or '.'
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(len(header).to_bytes(4, 'little'))
+            f.write(header)
+            data.tofile(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def read_header(path: str) -> tuple[RasterHeader, int]:
+    """
+    Returns the header of a binary raster and the offset of its data.
+    :raise ValueError: if the file is not a binary raster.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a binary raster")
+        length = int.from_bytes(f.read(4), 'little')
+        header = json.loads(f.read(length))
+    source = header['source']
+    return (RasterHeader(np.dtype(header['dtype']), tuple(header['shape']), header['nodata'],
+                         None if source is None else tuple(source)),
+            len(MAGIC) + 4 + length)
+
+
+def open_raster(path: str, mode: str = 'r') -> np.memmap:
+    """
+    Maps a binary raster in memory (mode 'r' o 'r+').
+    """
+    header, offset = read_header(path)
+    return np.memmap(path, dtype=header.dtype, mode=mode, offset=offset, shape=header.shape)
+
+
+def read_masked(path: str) -> np.ma.MaskedArray:
+    """
+    Maps a binary raster with its nodata cells masked (y también los NaN).
+    """
+    header, _ = read_header(path)
+    data = open_raster(path)
+    mask = np.isnan(data) if data.dtype.kind == 'f' else np.zeros(data.shape, dtype=bool)
+    if header.nodata is not None:
+        mask |= data == header.nodata
+    return np.ma.MaskedArray(data, mask=mask)
+
+
+def _split_lines(fname: str, parts: int) -> list[tuple[int, int]]:
+    # Rangos de bytes que empiezan y terminan en un salto de línea.
+    size = os.path.getsize(fname)
+    bounds = [0]
+    with open(fname, 'rb') as f:
+        for i in range(1, parts):
+            f.seek(max(size * i // parts, bounds[-1]))
+            f.readline()
+            bounds.append(f.tell())
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _parse_range(fname: str, start: int, end: int) -> np.ndarray:
+    with open(fname, 'rb') as f:
+        f.seek(start)
+        lines = f.read(end - start).splitlines()
+    return np.loadtxt(lines, ndmin=2)
+
+
+def parse_text(fname: str, workers: int | None = None) -> np.ndarray:
+    """
+    Parses a whitespace-separated text grid as float64, like np.loadtxt.
+    El fichero se divide en rangos de líneas que se parsean en paralelo.
+    El parser de NumPy no libera el GIL, así que se usan procesos; por
+    defecto solo con ficheros de más de PARALLEL_BYTES.
+
+    Examples
+    --------
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     fname = os.path.join(tmp, 'grid.txt')
+    ...     with open(fname, 'w') as f:
+    ...         _ = f.write('1 2 3\\n4 nan 6\\n7 8 9\\n')
+    ...     parse_text(fname, workers=2)
+    array([[ 1.,  2.,  3.],
+           [ 4., nan,  6.],
+           [ 7.,  8.,  9.]])
+    """
+    if workers is None:
+        workers = (os.cpu_count() or 1) if os.path.getsize(fname) > PARALLEL_BYTES else 1
+    ranges = _split_lines(fname, workers)
+    if workers == 1 or len(ranges) <= 1:
+        return np.loadtxt(fname, ndmin=2)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        blocks = list(pool.map(_parse_range, [fname] * len(ranges), *zip(*ranges)))
+    if len({block.shape[1] for block in blocks}) > 1:
+        raise ValueError(f"The rows of {fname} do not have the same number of columns")
+    return np.vstack(blocks)
+
+
+def convert_text(fname: str, path: str, dtype: type = float, nodata: float | None = None,
+                 workers: int | None = None) -> np.memmap:
+    """
+    Converts a text grid into a binary raster and returns it mapped in memory.
+    Los valores se parsean como float64 y se convierten a dtype, igual que
+    np.loadtxt(fname).astype(dtype).
+    """
+    source = _stamp(fname)
+    write_raster(path, parse_text(fname, workers).astype(dtype), nodata=nodata, source=source)
+    return open_raster(path)
+
+
+def cache_path(fname: str, dtype: type = float) -> str:
+    """
+    Path of the binary raster that caches a text grid.
+
+    >>> cache_path('datos/humedad.txt', float)
+    'datos/__rastercache__/humedad.float64.raster'
+    """
+    directory, name = os.path.split(fname)
+    stem = os.path.splitext(name)[0]
+    return os.path.join(directory, CACHE_DIR, f'{stem}.{np.dtype(dtype).name}.raster')
+
+
+def load_text(fname: str, dtype: type = float, nodata: float | None = None,
+              workers: int | None = None) -> np.memmap:
+    """
+    Loads a text grid through its binary cache, converting it the first time.
+    La caché se rehace si el fichero de texto cambia de tamaño o de fecha
+    de modificación, o si nodata no coincide.
+    :param fname: str
+        a path containing the .txt file to read
+    :param dtype: type
+        a data type for the returned array
+    :return: np.memmap
+        the grid, mapped in read only mode; a plain array if the cache can
+        not be written (por ejemplo, en un directorio de solo lectura)
+    """
+    path = cache_path(fname, dtype)
+    try:
+        header, _ = read_header(path)
+        if header.source == _stamp(fname) and header.nodata == nodata:
+            return open_raster(path)
+    except (OSError, ValueError):
+        pass
+    source = _stamp(fname)
+    data = parse_text(fname, workers).astype(dtype)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_raster(path, data, nodata=nodata, source=source)
+    except OSError:
+        return data
+    return open_raster(path)
+
+
+# ------------ test  ----------------#
+
+def test_doc() -> None:
+    doctest.run_docstring_examples(parse_text, globals(), verbose=False)
+    doctest.run_docstring_examples(cache_path, globals(), verbose=False)
+
+
+def test_cache() -> None:
+    """
+    Compares the cached rasters with np.loadtxt and checks that the cache is
+    rebuilt when the text file changes.
+    """
+    for fname in ('datos/temperaturas.txt', 'datos/humedad.txt'):
+        expected = np.loadtxt(fname)
+        assert np.array_equal(parse_text(fname, workers=3), expected)
+        for _ in range(2):  # conversión y lectura desde la caché
+            data = load_text(fname)
+            assert isinstance(data, np.memmap) and np.array_equal(data, expected)
+        assert np.array_equal(load_text(fname, int), expected.astype(int))
+    with tempfile.TemporaryDirectory() as tmp:
+        fname = os.path.join(tmp, 'grid.txt')
+        with open(fname, 'w') as f:
+            f.write('1 -9999\n3 4\n')
+        load_text(fname, nodata=-9999)
+        assert read_masked(cache_path(fname)).mask.tolist() == [[False, True], [False, False]]
+        with open(fname, 'w') as f:
+            f.write('1 2 3\n4 5 6\n')
+        assert load_text(fname, nodata=-9999).shape == (2, 3)
+        os.utime(fname, ns=(0, 0))
+        write_raster(cache_path(fname, int), np.zeros((1, 1), dtype=int), source=_stamp(fname))
+        assert load_text(fname, int).tolist() == [[0]]  # la caché válida no se vuelve a parsear
+    with tempfile.TemporaryDirectory() as tmp:
+        # Si la caché no se puede crear se parsea el texto sin guardarla.
+        fname = os.path.join(tmp, 'grid.txt')
+        with open(fname, 'w') as f:
+            f.write('1 2\n3 4\n')
+        open(os.path.join(tmp, CACHE_DIR), 'w').close()
+        data = load_text(fname, int)
+        assert not isinstance(data, np.memmap) and data.tolist() == [[1, 2], [3, 4]]
+
+
+if __name__ == "__main__":
+    test_doc()  # executing tests
+    test_cache()
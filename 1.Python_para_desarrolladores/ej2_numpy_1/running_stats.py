@@ -0,0 +1,193 @@
+# imports
+
+import doctest
+import math
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
+
+import numpy as np
+
+from raster_io import load_text
+
+"""
+Streaming statistics of sensor data, block by block.
+Las medias y varianzas se combinan con las fórmulas de Welford / Chan,
+de forma que los resultados parciales de distintos bloques, ficheros o
+procesos se pueden unir con merge sin volver a leer los datos.
+"""
+
+
+class RunningStats:
+    """
+    Mergeable accumulator of count, min, max, mean and standard deviation.
+    Con skipna=True las celdas NaN se cuentan aparte y se ignoran; con
+    skipna=False, como summary, basta un NaN para que todos los resultados
+    sean NaN. En ambos casos report indica la cobertura de los datos.
+
+    Examples
+    --------
+    >>> stats = RunningStats()
+    >>> stats.update(np.array([[1, 2, 3], [4, np.nan, 6]]))
+    >>> stats.result()
+    (1.0, 6.0, 3.2, 1.7204650534085253)
+    >>> other = RunningStats()
+    >>> other.update(np.array([7, 8]))
+    >>> stats.merge(other)
+    >>> stats.report()
+    {'count': 7, 'nan_count': 1, 'coverage': 0.875, 'min': 1.0, 'max': 8.0, 'mean': 4.428571428571429, 'std': 2.4411439272335804}
+    >>> strict = RunningStats(skipna=False)
+    >>> strict.update(np.array([[1, np.nan, 3], [4, 5, 6]]))
+    >>> strict.result()
+    (nan, nan, nan, nan)
+    """
+
+    def __init__(self, skipna: bool = True):
+        self.skipna = skipna
+        self.count = 0
+        self.nan_count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    @property
+    def total(self) -> int:
+        return self.count + self.nan_count
+
+    def _combine(self, count: int, mean: float, m2: float, minimum: float, maximum: float) -> None:
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.min = min(self.min, minimum)
+        self.max = max(self.max, maximum)
+
+    def update(self, block: np.ndarray, work: np.ndarray | None = None) -> None:
+        """
+        Adds the values of a block (array of any shape, or memmap).
+        :param work: np.ndarray
+            optional buffer with the shape of block, used to compute the squared
+            deviations in place instead of creating a temporary array.
+        """
+        block = np.asarray(block)
+        if block.size == 0:
+            return
+        block_sum = float(np.add.reduce(block, axis=None))
+        if math.isnan(block_sum):
+            nans = np.isnan(block)
+            nan_count = int(np.count_nonzero(nans))
+            if nan_count:
+                self.nan_count += nan_count
+                block = block[~nans]
+                work = None
+                if block.size == 0:
+                    return
+                block_sum = float(block.sum())
+        count = block.size
+        mean = block_sum / count
+        if work is None:
+            deviations = block - mean
+        else:
+            deviations = np.subtract(block, mean, out=work)
+        np.multiply(deviations, deviations, out=deviations)
+        self._combine(count, mean, float(np.add.reduce(deviations, axis=None)),
+                      float(block.min()), float(block.max()))
+
+    def merge(self, other: 'RunningStats') -> None:
+        """
+        Adds the partial results of other accumulator (de otro bloque, fichero o proceso).
+        """
+        self.nan_count += other.nan_count
+        self._combine(other.count, other.mean, other.m2, other.min, other.max)
+
+    def result(self, ddof: int = 0) -> tuple[float, float, float, float]:
+        """
+        Returns min, max, mean and standard deviation, as summary.
+        """
+        if self.count == 0 or (self.nan_count and not self.skipna):
+            return (math.nan,) * 4
+        std = math.sqrt(self.m2 / (self.count - ddof)) if self.count > ddof else math.nan
+        return self.min, self.max, self.mean, std
+
+    def report(self) -> dict:
+        """
+        Coverage report: cells with data, missing cells and statistics.
+        """
+        minimum, maximum, mean, std = self.result()
+        return {'count': self.count, 'nan_count': self.nan_count,
+                'coverage': self.count / self.total if self.total else math.nan,
+                'min': minimum, 'max': maximum, 'mean': mean, 'std': std}
+
+
+def summarize_array(a: np.ndarray, skipna: bool = True, tile_rows: int = 4096) -> RunningStats:
+    """
+    Statistics of an array (or memmap) read by blocks of rows.
+    """
+    stats = RunningStats(skipna)
+    if a.ndim == 0:
+        stats.update(a)
+        return stats
+    work = np.empty((min(tile_rows, a.shape[0]),) + a.shape[1:], dtype=np.result_type(a, 1.0))
+    for start in range(0, a.shape[0], tile_rows):
+        block = a[start:start + tile_rows]
+        stats.update(block, work[:block.shape[0]])
+    return stats
+
+
+def _summarize_file(path: str, skipna: bool, tile_rows: int) -> RunningStats:
+    return summarize_array(np.load(path, mmap_mode='r'), skipna, tile_rows)
+
+
+def summarize_files(paths: Iterable[str], skipna: bool = True, tile_rows: int = 4096,
+                    workers: int = 1) -> RunningStats:
+    """
+    Statistics of a set of .npy files, each one read by blocks through a memmap.
+    Con workers > 1 cada fichero se resume en un proceso y los resultados
+    parciales se combinan con merge.
+    """
+    paths = list(paths)
+    stats = RunningStats(skipna)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for partial in pool.map(_summarize_file, paths, [skipna] * len(paths), [tile_rows] * len(paths)):
+                stats.merge(partial)
+    else:
+        for path in paths:
+            stats.merge(_summarize_file(path, skipna, tile_rows))
+    return stats
+
+
+# ------------ test  ----------------#
+
+def test_doc() -> None:
+    doctest.run_docstring_examples(RunningStats, globals(), verbose=False)
+
+
+def test_files() -> None:
+    """
+    Splits the sensor data into files, with some missing cells, and compares
+    the merged statistics with the ones of NumPy over the whole array.
+    """
+    humidity = np.array(load_text('datos/humedad.txt'))
+    humidity[::17, ::13] = np.nan
+    expected = (np.nanmin(humidity), np.nanmax(humidity), np.nanmean(humidity), np.nanstd(humidity))
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i, part in enumerate(np.array_split(humidity, 5)):
+            paths.append(os.path.join(tmp, f'part{i}.npy'))
+            np.save(paths[-1], part)
+        for workers in (1, 3):
+            stats = summarize_files(paths, tile_rows=7, workers=workers)
+            assert np.allclose(stats.result(), expected)
+            assert stats.nan_count == np.isnan(humidity).sum() and stats.total == humidity.size
+        assert np.isnan(summarize_files(paths, skipna=False).result()).all()
+
+
+if __name__ == "__main__":
+    test_doc()  # executing tests
+    test_files()
@@ -0,0 +1,230 @@
+# imports
+
+import doctest
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, NamedTuple
+
+import numpy as np
+
+from ith import _thi_tile, _tile_buffers, _tile_rows, isStress, ith, load_sensors
+
+"""
+THI processing of time series of grids (time, y, x).
+Los datos se recorren en el tiempo acumulando, para cada celda, las horas
+de estrés y las rachas de estrés consecutivo, sin guardar la pila completa.
+La malla se divide en bloques de filas que se procesan en un pool de hilos:
+NumPy libera el GIL en las operaciones sobre arrays, así que los bloques
+avanzan en paralelo.
+"""
+
+
+class StressMaps(NamedTuple):
+    """
+    Per-cell results: horas de estrés acumuladas, racha más larga de horas
+    consecutivas con estrés, racha actual (la que sigue abierta al final de
+    los datos) y número de horas procesadas.
+    """
+    stress_hours: np.ndarray
+    longest_run: np.ndarray
+    current_run: np.ndarray
+    hours: int
+
+
+class StressAccumulator:
+    """
+    Accumulates stress hours and stress runs of each cell, frame by frame.
+    Se puede alimentar con pilas (time, y, x), por ejemplo np.memmap, con
+    update_stack, o con mallas horarias sueltas con update_frame; el estado
+    se conserva entre llamadas, así que las rachas continúan de una pila
+    a la siguiente. El pool de hilos se crea en la primera llamada y se
+    reutiliza en las siguientes; se libera con close o usando el
+    acumulador como context manager.
+
+    Examples
+    --------
+    >>> acc = StressAccumulator((1, 3), workers=1)
+    >>> for thi in ([80, 70, 80], [80, 80, 70], [70, 80, 80], [80, 80, 80]):
+    ...     acc.update_thi(np.array([thi], dtype=float))
+    >>> result = acc.result()
+    >>> result.stress_hours, result.longest_run, result.current_run, result.hours
+    (array([[3, 3, 3]], dtype=int32), array([[2, 3, 2]], dtype=int32), array([[1, 3, 2]], dtype=int32), 4)
+    """
+
+    def __init__(self, shape: tuple[int, int], tile_rows: int | None = None, workers: int | None = None):
+        self.shape = tuple(shape)
+        self.stress_hours = np.zeros(self.shape, dtype=np.int32)
+        self.longest_run = np.zeros(self.shape, dtype=np.int32)
+        self.current_run = np.zeros(self.shape, dtype=np.int32)
+        self.hours = 0
+        self.rows = _tile_rows(self.shape, np.dtype(np.float64).itemsize, tile_rows)
+        self.workers = workers or os.cpu_count() or 1
+        self._pool: ThreadPoolExecutor | None = None
+
+    def __enter__(self) -> 'StressAccumulator':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Shuts down the thread pool. Si se vuelve a usar, se crea otro.
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _tiles(self) -> list[slice]:
+        return [slice(start, start + self.rows) for start in range(0, self.shape[0], self.rows)]
+
+    def _accumulate(self, rows: slice, stress: np.ndarray) -> None:
+        # La racha actual se incrementa donde hay estrés y se pone a cero donde no.
+        current = self.current_run[rows]
+        np.add(self.stress_hours[rows], stress, out=self.stress_hours[rows])
+        np.add(current, 1, out=current)
+        np.multiply(current, stress, out=current)
+        np.maximum(self.longest_run[rows], current, out=self.longest_run[rows])
+
+    def _process_tile(self, rows: slice, temperature: np.ndarray, humidity: np.ndarray) -> None:
+        t_stack, h_stack = temperature[:, rows], humidity[:, rows]
+        dtype = np.result_type(t_stack, h_stack, 14.3)
+        a, b = _tile_buffers(t_stack.shape[1:], t_stack.shape[1], dtype)
+        thi = np.empty(t_stack.shape[1:], dtype=dtype)
+        stress = np.empty(t_stack.shape[1:], dtype=bool)
+        for t, h in zip(t_stack, h_stack):
+            _thi_tile(t, h, a, b, thi)
+            np.greater(thi, 78, out=stress)
+            self._accumulate(rows, stress)
+
+    def _run(self, function, *args) -> None:
+        tiles = self._tiles()
+        if self.workers == 1 or len(tiles) == 1:
+            for rows in tiles:
+                function(rows, *args)
+            return
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        for future in [self._pool.submit(function, rows, *args) for rows in tiles]:
+            future.result()
+
+    def update_stack(self, temperature: np.ndarray, humidity: np.ndarray) -> None:
+        """
+        Adds a stack of hourly grids (time, y, x). Cada hilo recorre en el
+        tiempo su bloque de filas, así que solo hay en memoria un bloque por hilo.
+        """
+        if temperature.shape != humidity.shape:
+            raise ValueError(f"Shape of data sensors must be the same. Temperature: {temperature.shape} != humidity: {humidity.shape}")
+        if temperature.shape[1:] != self.shape:
+            raise ValueError(f"Shape of the grids must be {self.shape}, not {temperature.shape[1:]}")
+        self._run(self._process_tile, temperature, humidity)
+        self.hours += temperature.shape[0]
+
+    def update_frame(self, temperature: np.ndarray, humidity: np.ndarray) -> None:
+        """
+        Adds one hourly grid (y, x).
+        """
+        self.update_stack(temperature[np.newaxis], humidity[np.newaxis])
+
+    def update_thi(self, thi: np.ndarray) -> None:
+        """
+        Adds one hourly grid of already computed THI values (y, x).
+        """
+        if thi.shape != self.shape:
+            raise ValueError(f"Shape of the grids must be {self.shape}, not {thi.shape}")
+        self._run(lambda rows: self._accumulate(rows, isStress(thi[rows])))
+        self.hours += 1
+
+    def result(self) -> StressMaps:
+        return StressMaps(self.stress_hours, self.longest_run, self.current_run, self.hours)
+
+
+def stress_stack(temperature: np.ndarray, humidity: np.ndarray, tile_rows: int | None = None,
+                 workers: int | None = None) -> StressMaps:
+    """
+    Stress hours and longest stress runs of each cell of a stack (time, y, x).
+    """
+    with StressAccumulator(temperature.shape[1:], tile_rows=tile_rows, workers=workers) as acc:
+        acc.update_stack(temperature, humidity)
+    return acc.result()
+
+
+def stress_stack_memmap(temperature_path: str, humidity_path: str, tile_rows: int | None = None,
+                        workers: int | None = None) -> StressMaps:
+    """
+    Same as stress_stack, over stacks stored as .npy files opened with mmap_mode='r'.
+    """
+    return stress_stack(np.load(temperature_path, mmap_mode='r'), np.load(humidity_path, mmap_mode='r'),
+                        tile_rows=tile_rows, workers=workers)
+
+
+def stress_frames(frames: Iterable[tuple[np.ndarray, np.ndarray]], tile_rows: int | None = None,
+                  workers: int | None = None) -> StressMaps:
+    """
+    Same as stress_stack, over an iterable of (temperature, humidity) hourly grids.
+    Útil cuando las mallas llegan de una en una (por ejemplo, un fichero por hora).
+    Se usa un único pool de hilos para todas las mallas.
+    """
+    acc = None
+    try:
+        for temperature, humidity in frames:
+            if acc is None:
+                acc = StressAccumulator(temperature.shape, tile_rows=tile_rows, workers=workers)
+            acc.update_frame(temperature, humidity)
+    finally:
+        if acc is not None:
+            acc.close()
+    if acc is None:
+        raise ValueError("No frames to process")
+    return acc.result()
+
+
+# ------------ test  ----------------#
+
+def test_doc() -> None:
+    doctest.run_docstring_examples(StressAccumulator, globals(), verbose=False)
+
+
+def _naive(temperature: np.ndarray, humidity: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    stress = isStress(ith(temperature, humidity))
+    current = np.zeros(stress.shape[1:], dtype=np.int32)
+    longest = np.zeros(stress.shape[1:], dtype=np.int32)
+    for frame in stress:
+        current = np.where(frame, current + 1, 0)
+        longest = np.maximum(longest, current)
+    return stress.sum(axis=0), longest, current
+
+
+def test_stack() -> None:
+    """
+    Compares the streaming results with a direct computation over a synthetic
+    week of hourly grids built from the sensor data.
+    """
+    rng = np.random.default_rng(0)
+    temperature, humidity = (grid[:40, :30] for grid in load_sensors())
+    hours = 24 * 7
+    daily = 12 * np.sin(np.arange(hours) * 2 * np.pi / 24)[:, None, None]
+    t_stack = temperature + daily + rng.normal(0, 2, (hours,) + temperature.shape)
+    h_stack = np.broadcast_to(humidity, t_stack.shape)
+    t_stack[5, 3, 3] = np.nan
+    expected = _naive(t_stack, h_stack)
+    for tile_rows, workers in ((7, 4), (1000, 1)):
+        result = stress_stack(t_stack, h_stack, tile_rows=tile_rows, workers=workers)
+        assert result.hours == hours
+        for got, want in zip(result, expected):
+            assert np.array_equal(got, want)
+    result = stress_frames(zip(t_stack, h_stack), tile_rows=9, workers=3)
+    for got, want in zip(result, expected):
+        assert np.array_equal(got, want)
+    # El pool se crea una vez y se reutiliza entre mallas hasta close.
+    with StressAccumulator(temperature.shape, tile_rows=9, workers=3) as acc:
+        acc.update_frame(t_stack[0], h_stack[0])
+        pool = acc._pool
+        acc.update_frame(t_stack[1], h_stack[1])
+        assert pool is not None and acc._pool is pool
+    assert acc._pool is None
+
+
+if __name__ == "__main__":
+    test_doc()  # executing tests
+    test_stack()
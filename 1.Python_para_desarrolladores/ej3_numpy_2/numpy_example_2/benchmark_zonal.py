@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, NamedTuple
+
+import numpy as np
+
+from zonal_stat import (ZoneIndex, label_regions, mean_areas, read_data, set_of_areas, zonal_stats,
+                        zonal_stats_tiled)
+
+"""
+Benchmark and regression suite of the zonal statistics.
+Genera rasters sintéticos de zonas y valores, mide el tiempo y el pico de
+memoria (tracemalloc, que también ve los buffers de NumPy) de cada camino
+de zonal_stat, comprueba los resultados con la implementación de
+referencia (una máscara por zona) y compara las medidas con las guardadas
+en un fichero de referencia: si alguna empeora más de la tolerancia, el
+programa termina con error. La referencia depende de la máquina, así que
+no se guarda en el repositorio: hay que crearla con --update, y sin ella
+el programa también termina con error.
+
+    python benchmark_zonal.py --update          # guarda la referencia
+    python benchmark_zonal.py                   # compara con ella
+    python benchmark_zonal.py --max-cells 1e8   # incluye los rasters grandes
+"""
+
+BASELINE = 'benchmark_baseline.json'
+CELLS = (10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8)
+ZONES = (10, 1000, 100_000)
+REFERENCE_CELLS = 10 ** 6   # hasta aquí se comparan los resultados con la referencia
+REFERENCE_ZONES = 1000      # la referencia recorre el raster una vez por zona
+TEXT_CELLS = 10 ** 6        # hasta aquí se mide read_data (escribe el raster como texto)
+TIME_TOLERANCE = 1.5        # tiempo máximo admitido, en veces el de la referencia
+MEMORY_TOLERANCE = 1.25
+TIME_SLACK = 0.02           # segundos; por debajo, las diferencias son ruido
+POOL_TIME_SLACK = 0.05      # en los caminos con un pool de hilos, que varían más
+POOL_PATHS = ('zonal_stats_tiled',)
+MEMORY_SLACK = 1024 ** 2    # bytes
+
+
+class Measure(NamedTuple):
+    seconds: float
+    peak_bytes: int
+
+
+def synthetic_rasters(cells: int, zones: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Square zone and value rasters of about cells cells with zones zone codes.
+    Las zonas son bloques rectangulares con códigos dispersos (no consecutivos),
+    como los de un mapa administrativo; los valores siguen una normal.
+
+    >>> zonas, valores = synthetic_rasters(10 ** 4, 10)
+    >>> zonas.shape, valores.shape, len(set_of_areas(zonas))
+    ((100, 100), (100, 100), 10)
+    """
+    rng = np.random.default_rng(seed)
+    side = int(round(np.sqrt(cells)))
+    blocks = int(np.ceil(np.sqrt(zones)))
+    codes = rng.choice(10 * zones, zones, replace=False)
+    block_zone = np.resize(rng.permutation(zones), (blocks, blocks))
+    edges = np.linspace(0, side, blocks + 1).astype(int)
+    rows = np.searchsorted(edges, np.arange(side), side='right') - 1
+    zonas = codes[block_zone[rows[:, np.newaxis], rows[np.newaxis, :]]]
+    return zonas, rng.normal(20, 5, zonas.shape)
+
+
+def measure(function: Callable[[], object], repeat: int = 3) -> Measure:
+    """
+    Best time of repeat calls and the allocation peak of one more call.
+    """
+    seconds = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds = min(seconds, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return Measure(seconds, peak)
+
+
+def mean_areas_reference(zonas: np.ndarray, valores: np.ndarray) -> np.ndarray:
+    # Implementación original de mean_areas: una máscara completa por zona.
+    output = np.zeros(zonas.shape)
+    for zone in np.unique(zonas):
+        idx_zone = zonas == zone
+        output[idx_zone] = np.around(np.mean(valores[idx_zone]), 1)
+    return output
+
+
+def check_results(zonas: np.ndarray, valores: np.ndarray) -> None:
+    """
+    Compares the fast paths with the reference implementation.
+    """
+    assert np.allclose(mean_areas(zonas, valores), mean_areas_reference(zonas, valores), atol=0.05 + 1e-9)
+    table = zonal_stats(zonas, valores, ['count', 'mean', 'min', 'max', 'median']).table
+    for i in range(0, table['zone'].size, max(1, table['zone'].size // 20)):
+        cells = valores[zonas == table['zone'][i]]
+        expected = (cells.size, cells.mean(), cells.min(), cells.max(), np.median(cells))
+        got = tuple(table[stat][i] for stat in ('count', 'mean', 'min', 'max', 'median'))
+        assert np.allclose(got, expected), (table['zone'][i], got, expected)
+    tiled = zonal_stats_tiled(zonas, valores, ['mean', 'max'], tile_rows=max(1, zonas.shape[0] // 7))
+    assert np.allclose(tiled.table['mean'], table['mean']) and np.array_equal(tiled.table['max'], table['max'])
+
+
+def code_paths(zonas: np.ndarray, valores: np.ndarray, text_dir: str | None) -> dict[str, Callable[[], object]]:
+    index = ZoneIndex(zonas)
+    index.order  # se calcula aquí para medir solo el uso del índice
+    paths = {
+        'set_of_areas': lambda: set_of_areas(zonas),
+        'mean_areas': lambda: mean_areas(zonas, valores),
+        'mean_areas/index': lambda: mean_areas(index, valores),
+        'zone_index': lambda: ZoneIndex(zonas).order,
+        'zonal_stats/moments': lambda: zonal_stats(index, valores, ['count', 'mean', 'std']),
+        'zonal_stats/order': lambda: zonal_stats(index, valores, ['min', 'max', 'median']),
+        'zonal_stats_tiled': lambda: zonal_stats_tiled(zonas, valores, ['count', 'mean', 'std', 'min', 'max']),
+        'zonal_stats/bands': lambda: zonal_stats(index, np.broadcast_to(valores, (4,) + valores.shape), ['mean']),
+        'label_regions': lambda: label_regions(zonas),
+    }
+    if text_dir is not None:
+        fname = os.path.join(text_dir, 'valores.txt')
+        np.savetxt(fname, valores, fmt='%.3f')
+
+        def convert() -> np.ndarray:
+            os.utime(fname)  # la caché deja de ser válida y se vuelve a convertir
+            return read_data(fname, float)
+
+        paths['read_data/convert'] = convert
+        paths['read_data/cached'] = lambda: read_data(fname, float)
+    return paths
+
+
+def run(max_cells: int, repeat: int, check: bool = True) -> dict[str, Measure]:
+    results = {}
+    for cells in CELLS:
+        if cells > max_cells:
+            break
+        for zones in ZONES:
+            if zones > cells // 10:
+                continue
+            zonas, valores = synthetic_rasters(cells, zones)
+            if check and cells <= REFERENCE_CELLS and zones <= REFERENCE_ZONES:
+                check_results(zonas, valores)
+            with tempfile.TemporaryDirectory() as tmp:
+                paths = code_paths(zonas, valores, tmp if cells <= TEXT_CELLS else None)
+                for name, function in paths.items():
+                    key = f'{name} cells={cells} zones={zones}'
+                    results[key] = measure(function, repeat)
+                    print(f'{key:55} {results[key].seconds * 1000:10.2f} ms {results[key].peak_bytes / 1024 ** 2:10.1f} MB')
+    return results
+
+
+def regressions(results: dict[str, Measure], baseline: dict[str, Measure]) -> list[str]:
+    """
+    Measures that are worse than the baseline by more than the tolerances.
+
+    >>> regressions({'a': Measure(0.3, 10 ** 6), 'b': Measure(0.1, 10 ** 8),
+    ...              'zonal_stats_tiled cells=1': Measure(0.05, 1)},
+    ...             {'a': Measure(0.1, 10 ** 6), 'b': Measure(0.1, 10 ** 6), 'c': Measure(1, 1),
+    ...              'zonal_stats_tiled cells=1': Measure(0.01, 1)})
+    ['a: 300.0 ms > 1.5 x 100.0 ms', 'b: 95.4 MB > 1.25 x 1.0 MB']
+    """
+    failures = []
+    for key, measure in results.items():
+        if key not in baseline:
+            continue
+        reference = baseline[key]
+        slack = POOL_TIME_SLACK if key.split(' ')[0] in POOL_PATHS else TIME_SLACK
+        if measure.seconds > reference.seconds * TIME_TOLERANCE + slack:
+            failures.append(f'{key}: {measure.seconds * 1000:.1f} ms > {TIME_TOLERANCE} x {reference.seconds * 1000:.1f} ms')
+        if measure.peak_bytes > reference.peak_bytes * MEMORY_TOLERANCE + MEMORY_SLACK:
+            failures.append(f'{key}: {measure.peak_bytes / 1024 ** 2:.1f} MB > {MEMORY_TOLERANCE} x '
+                            f'{reference.peak_bytes / 1024 ** 2:.1f} MB')
+    return failures
+
+
+def load_baseline(path: str) -> dict[str, Measure]:
+    with open(path) as f:
+        return {key: Measure(*value) for key, value in json.load(f).items()}
+
+
+def save_baseline(path: str, results: dict[str, Measure]) -> None:
+    with open(path, 'w') as f:
+        json.dump({key: list(value) for key, value in results.items()}, f, indent=1)
+
+
+# ------------ test  ----------------#
+import doctest
+
+def test_doc() -> None:
+    doctest.run_docstring_examples(synthetic_rasters, globals(), verbose=False)
+    doctest.run_docstring_examples(regressions, globals(), verbose=False)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark and regression suite of zonal_stat')
+    parser.add_argument('--max-cells', type=float, default=1e6, help='largest raster size (cells)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed calls per measure')
+    parser.add_argument('--baseline', default=BASELINE, help='file with the reference measures')
+    parser.add_argument('--update', action='store_true', help='save the measures as the new reference')
+    args = parser.parse_args()
+
+    if not args.update and not os.path.exists(args.baseline):
+        print(f'No baseline in {args.baseline}: create it with --update', file=sys.stderr)
+        return 2
+    test_doc()
+    results = run(int(args.max_cells), args.repeat)
+    if args.update:
+        previous = load_baseline(args.baseline) if os.path.exists(args.baseline) else {}
+        save_baseline(args.baseline, {**previous, **results})
+        print(f'Baseline saved in {args.baseline}')
+        return 0
+    failures = regressions(results, load_baseline(args.baseline))
+    for failure in failures:
+        print('REGRESSION', failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,35 @@
+import functools
+import hashlib
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, NamedTuple, Sequence
+
 import numpy as np
 
+# raster_io está en ej2_numpy_1: los ejercicios no son paquetes, así que se
+# añade su directorio al path en lugar de copiar el módulo.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'ej2_numpy_1'))
+
+from raster_io import load_text, open_raster
+
+INDEX_CACHE = '__zoneindex__'  # directorio por defecto de ZoneIndex.cached
+
+TILE_BYTES = 16 * 1024 ** 2  # tamaño aproximado de los bloques del modo por bloques
 
-def read_data(fname: str, tipo: type) -> np.ndarray:
+
+def read_data(fname: str, tipo: type, mmap: bool = False) -> np.ndarray:
     """
     Reads a text file containing data and creates a numpy array of the given datatype.
+    El texto se convierte la primera vez a un raster binario (ver raster_io)
+    y las lecturas siguientes lo abren con np.memmap y lo copian en un array nuevo.
     :param fname: str
         a path containing the .txt file to read
     :param tipo: type
         a data type to create the numpy array
+    :param mmap: bool
+        if True, return the cached raster mapped in read only mode, without copying it
 
     Examples:
     --------
@@ -27,13 +49,14 @@ def read_data(fname: str, tipo: type) -> np.ndarray:
            [2, 2, 3, 3, 2, 2],
            [3, 3, 3, 3, 3, 2]])
     """
-    return np.loadtxt(fname=fname).astype(tipo)  # Otra opción es np.loadtxt(fname=fname, dtype=tipo), pero me da un warning de numpy.
+    data = load_text(fname, tipo)
+    return data if mmap else np.array(data)
 
 
-def set_of_areas(zonas: np.ndarray)-> set[int]:
+def set_of_areas(zonas: 'np.ndarray | ZoneIndex')-> set[int]:
     """
     Calculates a set containing the unique zones in the zonas array
-    :param zonas:  np.ndarray
+    :param zonas:  np.ndarray or ZoneIndex
         a numpy array of integers containing zone codes as integers.
     :raise TypeError: if cells are not integers in the zonas input.
     Examples:
@@ -49,21 +72,26 @@ def set_of_areas(zonas: np.ndarray)-> set[int]:
         ...
     TypeError: The elements type must be int, not float64
     """
+    if isinstance(zonas, ZoneIndex):
+        return set(zonas.zone)
     if np.issubdtype(zonas.dtype, int):
         return set(np.unique(zonas))
     else:
         raise TypeError("The elements type must be int, not float64")
 
 
-def mean_areas(zonas: np.ndarray, valores: np.ndarray) -> np.ndarray:
+def mean_areas(zonas: 'np.ndarray | ZoneIndex', valores: np.ndarray) -> np.ndarray:
 
     """
     Calculates new array where the [i,j] entry contains the means of all the entries 
     of valores, whose corresponding entry in zonas equals the zone of the [i,j] array.
-    :param zonas:  np.ndarray
-        a numpy array of integers containing zone codes as integers.
+    :param zonas:  np.ndarray or ZoneIndex
+        a numpy array of integers containing zone codes as integers, or its
+        ZoneIndex when the same zones are used with several value arrays.
     :param valores:  np.ndarray
-        a numpy array of numbers containing values for each cell as float numbers.
+        a numpy array of numbers containing values for each cell as float numbers,
+        or a stack of bands (band, y, x): la agrupación por zonas se hace una
+        sola vez para todas las bandas y se devuelve una malla por banda.
     :raise ndexError: if both input arrays don't have the same size.
     Examples:
     --------
@@ -85,30 +113,523 @@ def mean_areas(zonas: np.ndarray, valores: np.ndarray) -> np.ndarray:
            [1. , 0. , 0.8, 0.8, 0.8, 4.4],
            [1. , 0. , 0.8, 0.8, 0.8, 4.4],
            [1. , 0. , 0. , 0. , 0. , 4.4]])
+    >>> bandas = np.stack([read_data('./datos/valores.txt', float), np.ones((6, 6))])
+    >>> mean_areas(read_data('./datos/zonas.txt', int), bandas)[:, 2]
+    array([[4. , 4. , 3.6, 3.6, 3.6, 1.5],
+           [1. , 1. , 1. , 1. , 1. , 1. ]])
     """
 
-    if zonas.shape != valores.shape:
+    if zonas.shape != valores.shape[valores.ndim - len(zonas.shape):] or valores.ndim > len(zonas.shape) + 1:
+        raise IndexError("Los arrays proporcionados deben tener las mismas dimensiones")
+    else:
+
+        # Una sola pasada: índice de zona de cada celda, suma y número de celdas
+        # por zona con np.bincount, y las medias se reparten con un único gather.
+        index = zonas if isinstance(zonas, ZoneIndex) else ZoneIndex(zonas)
+        return index.paint(np.around(index.mean(valores), 1))
+
+
+def zone_inverse(zonas: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the sorted zone codes and, for each cell (en orden C), the
+    position of its zone in them, like np.unique(zonas, return_inverse=True).
+    Si los códigos son enteros en un rango no mucho mayor que el número de
+    celdas se usa una tabla de búsqueda en O(N) en lugar de ordenar.
+    :param zonas:  np.ndarray
+        a numpy array containing zone codes.
+    Examples:
+    --------
+    >>> zone_inverse(np.array([[7, 3], [3, -1]]))
+    (array([-1,  3,  7]), array([2, 1, 1, 0]))
+    """
+    flat = zonas.ravel()
+    if flat.size and np.issubdtype(flat.dtype, np.integer):
+        low, high = int(flat.min()), int(flat.max())
+        info = np.iinfo(np.intp)
+        if high - low <= 4 * flat.size + 1024 and info.min <= low and high <= info.max:
+            # La resta se hace en intp: en el dtype del raster (p. ej. int8) desbordaría.
+            offset = flat.astype(np.intp) - low
+            present = np.bincount(offset, minlength=high - low + 1) > 0
+            ids = np.flatnonzero(present)
+            lookup = np.cumsum(present) - 1
+            return (ids + low).astype(flat.dtype), lookup[offset]
+    return np.unique(flat, return_inverse=True)
+
+
+class ZoneIndex:
+    """
+    Grouping of the cells of a zone raster, reusable with many value rasters.
+    Guarda los códigos de zona, el índice de zona de cada celda, el número
+    de celdas por zona y la permutación que deja juntas las celdas de cada
+    zona; cada raster de valores cuesta entonces un bincount o un gather.
+    Con ZoneIndex.cached el índice se guarda en disco con el hash del
+    contenido del raster de zonas como clave.
+
+    Examples
+    --------
+    >>> index = ZoneIndex(np.array([[7, 3], [3, -1]]))
+    >>> index.zone, index.counts, index.order
+    (array([-1,  3,  7]), array([1, 2, 1]), array([3, 1, 2, 0]))
+    >>> index.mean(np.array([[1., 2.], [4., 8.]]))
+    array([8., 3., 1.])
+    >>> index.paint(index.counts)
+    array([[1, 2],
+           [2, 1]])
+    >>> index.sum(np.arange(8).reshape(2, 2, 2))   # dos bandas
+    array([[ 3.,  3.,  0.],
+           [ 7., 11.,  4.]])
+    """
+
+    def __init__(self, zonas: np.ndarray):
+        self.shape = zonas.shape
+        self.zone, self.inverse = zone_inverse(zonas)
+        self.counts = np.bincount(self.inverse, minlength=self.zone.size)
+
+    @functools.cached_property
+    def order(self) -> np.ndarray:
+        # Se calcula la primera vez que se usa: mean y sum no lo necesitan.
+        return np.argsort(self.inverse, kind='stable')
+
+    @property
+    def starts(self) -> np.ndarray:
+        # Posición en order de la primera celda de cada zona.
+        return np.cumsum(self.counts) - self.counts
+
+    def check(self, valores: np.ndarray) -> np.ndarray:
+        """
+        Returns valores flattened: (celdas,) para una malla o (bandas, celdas)
+        para una pila de bandas (band, y, x).
+        :raise IndexError: if the grids don't have the shape of the zones.
+        """
+        if valores.shape == self.shape:
+            return valores.ravel()
+        if valores.ndim == len(self.shape) + 1 and valores.shape[1:] == self.shape:
+            return valores.reshape(valores.shape[0], -1)
         raise IndexError("Los arrays proporcionados deben tener las mismas dimensiones")
+
+    def group_sum(self, values: np.ndarray) -> np.ndarray:
+        """
+        Per-zone sums of flattened values (una fila por banda si es 2D).
+        Con varias bandas el índice de zona de la banda b se desplaza b * zonas,
+        así que un solo np.bincount suma todas las bandas, sin ordenar las celdas.
+        """
+        nzones = self.zone.size
+        if values.ndim == 1:
+            return np.bincount(self.inverse, weights=values, minlength=nzones)
+        bands = values.shape[0]
+        index = (self.inverse + np.arange(bands)[:, np.newaxis] * nzones).ravel()
+        return np.bincount(index, weights=values.ravel(), minlength=bands * nzones).reshape(bands, nzones)
+
+    def sum(self, valores: np.ndarray) -> np.ndarray:
+        return self.group_sum(self.check(valores))
+
+    def mean(self, valores: np.ndarray) -> np.ndarray:
+        return self.sum(valores) / self.counts
+
+    def paint(self, column: np.ndarray) -> np.ndarray:
+        """
+        Grid with the value of column (una entrada por zona) in each cell;
+        con una fila por banda, una malla por banda.
+        """
+        column = np.asarray(column)
+        return column[..., self.inverse].reshape(column.shape[:-1] + self.shape)
+
+    @staticmethod
+    def content_hash(zonas: np.ndarray) -> str:
+        """
+        Hash of the dtype, shape and cells of a zone raster, leído por bloques
+        de filas para no copiar en memoria un raster mapeado.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f'{zonas.dtype.str}{zonas.shape}'.encode())
+        rows = max(1, TILE_BYTES // max(1, zonas[:1].nbytes)) if zonas.ndim else 1
+        for start in range(0, len(zonas) if zonas.ndim else 1, rows):
+            digest.update(np.ascontiguousarray(zonas[start:start + rows] if zonas.ndim else zonas).data)
+        return digest.hexdigest()
+
+    def save(self, path: str) -> None:
+        """
+        Saves the index as an .npz file (escritura atómica con un temporal).
+        """
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.npz')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, shape=np.array(self.shape, dtype=np.int64), zone=self.zone,
+                         inverse=self.inverse, counts=self.counts, order=self.order)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> 'ZoneIndex':
+        index = cls.__new__(cls)
+        with np.load(path) as data:
+            index.shape = tuple(int(n) for n in data['shape'])
+            index.zone, index.inverse = data['zone'], data['inverse']
+            index.counts, index.order = data['counts'], data['order']
+        return index
+
+    @classmethod
+    def cached(cls, zonas: np.ndarray, cache_dir: str = INDEX_CACHE) -> 'ZoneIndex':
+        """
+        Loads the index of zonas from cache_dir, or builds and saves it there.
+        """
+        path = os.path.join(cache_dir, f'{cls.content_hash(zonas)}.npz')
+        if os.path.exists(path):
+            return cls.load(path)
+        index = cls(zonas)
+        os.makedirs(cache_dir, exist_ok=True)
+        index.save(path)
+        return index
+
+
+class ZonalStats(NamedTuple):
+    """
+    Result of zonal_stats: table tiene una fila por zona (columna 'zone' con
+    los códigos ordenados y una columna por estadístico) y grids, si se pide,
+    el valor de cada estadístico repartido por las celdas de su zona.
+    """
+    table: dict[str, np.ndarray]
+    grids: dict[str, np.ndarray] | None = None
+
+
+MOMENTS = ('count', 'sum', 'mean', 'std')
+ORDER = ('min', 'max', 'median')  # y percentiles 'p<q>', por ejemplo 'p90' o 'p2.5'
+
+
+def _percentile(stat: str) -> float:
+    if stat == 'median':
+        return 50.0
+    if stat.startswith('p'):
+        try:
+            q = float(stat[1:])
+        except ValueError:
+            q = -1.0
+        if 0 <= q <= 100:
+            return q
+    raise ValueError(f"Unknown statistic {stat!r}")
+
+
+def _order_stats(index: ZoneIndex, values: np.ndarray, stats: list[str]) -> dict[str, np.ndarray]:
+    counts, starts = index.counts, index.starts
+    result = {}
+    if values.ndim == 2 and not all(stat in ('min', 'max') for stat in stats):
+        # Percentiles de una pila: una ordenación por banda.
+        bands = [_order_stats(index, band, stats) for band in values]
+        return {stat: np.stack([band[stat] for band in bands]) for stat in stats}
+    if not all(stat in ('min', 'max') for stat in stats):
+        # Celdas ordenadas por zona y, dentro de cada zona, por valor: el
+        # estadístico de orden k de la zona z está en starts[z] + k.
+        ordered = values[np.lexsort((values, index.inverse))]
+        grouped = None
     else:
+        # Solo min y max: basta con agrupar las celdas con la permutación del índice.
+        grouped = np.take(values, index.order, axis=-1)
+    for stat in stats:
+        if grouped is not None:
+            result[stat] = (np.minimum if stat == 'min' else np.maximum).reduceat(grouped, starts, axis=-1)
+        elif stat == 'min':
+            result[stat] = ordered[starts]
+        elif stat == 'max':
+            result[stat] = ordered[starts + counts - 1]
+        else:
+            # Interpolación lineal entre los dos valores más próximos, como np.percentile.
+            position = _percentile(stat) / 100 * (counts - 1)
+            low = np.floor(position).astype(np.intp)
+            high = np.minimum(low + 1, counts - 1)
+            fraction = position - low
+            below, above = ordered[starts + low], ordered[starts + high]
+            result[stat] = below + (above - below) * fraction
+    return result
+
+
+def zonal_stats(zonas: np.ndarray | ZoneIndex, valores: np.ndarray, stats: Sequence[str] = ('count', 'mean'),
+                broadcast: bool = False) -> ZonalStats:
+    """
+    Calculates several statistics of valores for each zone in one grouped pass.
+    Los momentos (count, sum, mean, std) salen de np.bincount sobre el
+    índice de zona de cada celda; min, max, median y los percentiles 'p<q>'
+    de una única ordenación de las celdas por zona y valor.
+    :param zonas:  np.ndarray or ZoneIndex
+        a numpy array of integers containing zone codes as integers, or its ZoneIndex.
+    :param valores:  np.ndarray
+        a numpy array of numbers containing values for each cell, or a stack
+        of bands (band, y, x); entonces cada columna de la tabla salvo zone y
+        count tiene una fila por banda.
+    :param stats: sequence of str
+        statistics to compute: count, sum, mean, std, min, max, median, p<q>.
+    :param broadcast: bool
+        if True, also returns each statistic painted over the grid, como
+        mean_areas (sin redondear). Ocupa tanto como la entrada por estadístico.
+    :raise IndexError: if both input arrays don't have the same size.
+    :raise ValueError: if a statistic is unknown.
+    Examples:
+    --------
+    >>> zonas, valores = read_data('./datos/zonas.txt', int), read_data('./datos/valores.txt', float)
+    >>> result = zonal_stats(zonas, valores, ['count', 'mean', 'min', 'max', 'median', 'p25'])
+    >>> for name, column in result.table.items():
+    ...     print(name, np.around(column, 2))
+    zone [1 2 3 4]
+    count [ 9  9 16  2]
+    mean [3.11 4.   3.62 1.5 ]
+    min [1. 2. 1. 1.]
+    max [5. 8. 7. 2.]
+    median [3.  4.  3.  1.5]
+    p25 [2.   3.   2.75 1.25]
+    >>> zonal_stats(zonas, valores, ['std'], broadcast=True).grids['std'][2]
+    array([1.82574186, 1.82574186, 1.57619003, 1.57619003, 1.57619003,
+           0.5       ])
+    >>> zonal_stats(zonas, np.stack([valores, 2 * valores]), ['max']).table['max']
+    array([[ 5.,  8.,  7.,  2.],
+           [10., 16., 14.,  4.]])
+    """
+    stats = list(stats)
+    order_stats = [stat for stat in stats if stat not in MOMENTS]
+    for stat in order_stats:
+        if stat not in ORDER:
+            _percentile(stat)
+
+    index = zonas if isinstance(zonas, ZoneIndex) else ZoneIndex(zonas)
+    ids, inverse, counts = index.zone, index.inverse, index.counts
+    values = index.check(valores)
+    columns = {'count': counts}
+    if any(stat in stats for stat in ('sum', 'mean', 'std')):
+        sums = index.group_sum(values)
+        means = sums / counts
+        if 'std' in stats:
+            # Segunda pasada sobre las desviaciones, más estable que sum(x**2) - n*mean**2.
+            centered = values - means[..., inverse]
+            np.multiply(centered, centered, out=centered)
+            columns['std'] = np.sqrt(index.group_sum(centered) / counts)
+        columns['sum'], columns['mean'] = sums, means
+    if order_stats:
+        columns.update(_order_stats(index, values, order_stats))
+    table = {'zone': ids, **{stat: columns[stat] for stat in stats}}
+
+    grids = None
+    if broadcast:
+        grids = {stat: index.paint(table[stat]) for stat in stats}
+    return ZonalStats(table, grids)
+
+
+def _neighbour_pairs(zonas: np.ndarray, connectivity: int) -> tuple[np.ndarray, np.ndarray]:
+    # Pares de celdas vecinas (índices planos) con el mismo código de zona.
+    cells = np.arange(zonas.size).reshape(zonas.shape)
+    shifts = [(np.s_[:, :-1], np.s_[:, 1:]), (np.s_[:-1, :], np.s_[1:, :])]
+    if connectivity == 8:
+        shifts += [(np.s_[:-1, :-1], np.s_[1:, 1:]), (np.s_[:-1, 1:], np.s_[1:, :-1])]
+    first, second = [], []
+    for a, b in shifts:
+        same = zonas[a] == zonas[b]
+        first.append(cells[a][same])
+        second.append(cells[b][same])
+    return np.concatenate(first), np.concatenate(second)
+
+
+def label_regions(zonas: np.ndarray, connectivity: int = 4) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Splits each zone into its connected regions (parches de celdas vecinas
+    con el mismo código). Union-find vectorizado: en cada ronda la raíz mayor
+    de cada par de vecinos se cuelga de la menor y los caminos se comprimen
+    con saltos de punteros, hasta que todos los vecinos comparten raíz.
+    :param zonas:  np.ndarray
+        a 2D numpy array containing zone codes.
+    :param connectivity: int
+        4 (vecinos por lado) u 8 (también por las esquinas).
+    :return: tuple of np.ndarray
+        the region of each cell (0, 1, ... en el orden en que aparece su
+        primera celda) and the zone code of each region.
+    :raise ValueError: if zonas is not 2D or connectivity is not 4 or 8.
+    Examples:
+    --------
+    >>> regions, region_zone = label_regions(read_data('./datos/zonas.txt', int))
+    >>> regions
+    array([[0, 0, 0, 0, 1, 1],
+           [0, 0, 0, 0, 1, 2],
+           [3, 3, 1, 1, 1, 4],
+           [3, 3, 1, 1, 1, 4],
+           [3, 3, 1, 1, 5, 5],
+           [1, 1, 1, 1, 1, 5]])
+    >>> region_zone
+    array([1, 3, 1, 2, 4, 2])
+    """
+    if zonas.ndim != 2:
+        raise ValueError(f"zonas must be a 2D array, not {zonas.ndim}D")
+    if connectivity not in (4, 8):
+        raise ValueError(f"connectivity must be 4 or 8, not {connectivity}")
+    first, second = _neighbour_pairs(zonas, connectivity)
+    parent = np.arange(zonas.size)
+    while first.size:
+        root_a, root_b = parent[first], parent[second]
+        pending = root_a != root_b
+        first, second = first[pending], second[pending]
+        root_a, root_b = root_a[pending], root_b[pending]
+        # Si una raíz aparece en varios pares gana una de las asignaciones;
+        # los demás pares siguen pendientes para la ronda siguiente.
+        parent[np.maximum(root_a, root_b)] = np.minimum(root_a, root_b)
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+    # Cada región queda identificada por su primera celda: se numeran en ese orden.
+    roots, regions = zone_inverse(parent)
+    return regions.reshape(zonas.shape), zonas.ravel()[roots]
+
+
+def region_stats(zonas: np.ndarray, valores: np.ndarray, stats: Sequence[str] = ('mean',),
+                 connectivity: int = 4, cell_area: float = 1.0, broadcast: bool = False) -> ZonalStats:
+    """
+    Same as zonal_stats, grouping by connected region instead of by zone code.
+    La tabla tiene las columnas region, zone (código de la zona de la región)
+    y area (número de celdas por cell_area), seguidas de los estadísticos.
+    Examples:
+    --------
+    >>> result = region_stats(read_data('./datos/zonas.txt', int), read_data('./datos/valores.txt', float))
+    >>> for name, column in result.table.items():
+    ...     print(name, np.around(column, 2))
+    region [0 1 2 3 4 5]
+    zone [1 3 1 2 4 2]
+    area [ 8. 16.  1.  6.  2.  3.]
+    mean [3.12 3.62 3.   4.5  1.5  3.  ]
+    """
+    regions, region_zone = label_regions(zonas, connectivity)
+    index = ZoneIndex(regions)
+    result = zonal_stats(index, valores, stats, broadcast)
+    table = {'region': index.zone, 'zone': region_zone, 'area': index.counts * cell_area}
+    table.update((stat, column) for stat, column in result.table.items() if stat != 'zone')
+    return ZonalStats(table, result.grids)
+
+
+class ZonalPartial(NamedTuple):
+    """
+    Mergeable per-zone aggregates of part of a raster: códigos de zona
+    ordenados y, para cada uno, número de celdas, suma, suma de cuadrados de
+    las desviaciones respecto a la media (m2), mínimo y máximo.
+    """
+    zone: np.ndarray
+    count: np.ndarray
+    sum: np.ndarray
+    m2: np.ndarray
+    min: np.ndarray
+    max: np.ndarray
+
+
+TILED = ('count', 'sum', 'mean', 'std', 'min', 'max')
+
+
+def zonal_partial(zonas: np.ndarray, valores: np.ndarray) -> ZonalPartial:
+    """
+    Per-zone aggregates of a tile (una pasada de bincount y una ordenación por zona).
+    """
+    ids, inverse = zone_inverse(zonas)
+    values = valores.ravel()
+    counts = np.bincount(inverse, minlength=ids.size)
+    sums = np.bincount(inverse, weights=values, minlength=ids.size)
+    centered = values - (sums / counts)[inverse]
+    np.multiply(centered, centered, out=centered)
+    m2 = np.bincount(inverse, weights=centered, minlength=ids.size)
+    # Las celdas de cada zona quedan contiguas y reduceat recorre cada grupo.
+    ordered = values[np.argsort(inverse, kind='stable')]
+    starts = np.cumsum(counts) - counts
+    return ZonalPartial(ids, counts, sums, m2,
+                        np.minimum.reduceat(ordered, starts), np.maximum.reduceat(ordered, starts))
+
+
+def merge_partials(partials: Iterable[ZonalPartial]) -> ZonalPartial:
+    """
+    Combines the aggregates of several tiles (fórmulas de Chan et al. para m2).
+    """
+    partials = list(partials)
+    ids, inverse = np.unique(np.concatenate([partial.zone for partial in partials]), return_inverse=True)
+    count, total, m2, minimum, maximum = (np.concatenate(column) for column in list(zip(*partials))[1:])
+    counts = np.bincount(inverse, weights=count, minlength=ids.size).astype(np.int64)
+    sums = np.bincount(inverse, weights=total, minlength=ids.size)
+    delta = total / count - (sums / counts)[inverse]
+    m2 = np.bincount(inverse, weights=m2 + count * delta * delta, minlength=ids.size)
+    low, high = np.full(ids.size, np.inf), np.full(ids.size, -np.inf)
+    np.minimum.at(low, inverse, minimum)
+    np.maximum.at(high, inverse, maximum)
+    return ZonalPartial(ids, counts, sums, m2, low, high)
+
+
+def _tile_slices(shape: tuple[int, ...], itemsize: int, tile_rows: int | None) -> list[slice]:
+    if tile_rows is None:
+        row_bytes = itemsize * int(np.prod(shape[1:], dtype=np.int64))
+        tile_rows = max(1, TILE_BYTES // max(1, row_bytes))
+    return [slice(start, start + tile_rows) for start in range(0, shape[0], tile_rows)]
+
+
+def _map_tiles(function, tiles: list[slice], workers: int | None) -> list:
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tiles) == 1:
+        return [function(rows) for rows in tiles]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(function, tiles))
+
+
+def zonal_stats_tiled(zonas: np.ndarray, valores: np.ndarray, stats: Sequence[str] = ('count', 'mean'),
+                      out: dict[str, np.ndarray] | None = None, tile_rows: int | None = None,
+                      workers: int | None = None) -> ZonalStats:
+    """
+    Same as zonal_stats, reading both rasters by blocks of rows (por ejemplo
+    np.memmap de rasters mayores que la memoria). Cada bloque se resume en un
+    ZonalPartial en un pool de hilos y los resúmenes se combinan; solo se
+    admiten los estadísticos combinables (TILED), no la mediana ni percentiles.
+    :param out: dict of np.ndarray
+        optional output grids (p. ej. memmaps) por estadístico; se rellenan en
+        una segunda pasada por bloques, convirtiendo al dtype de cada grid, y
+        se devuelven como grids.
+    :raise IndexError: if both input arrays don't have the same size.
+    :raise ValueError: if a statistic can not be computed by blocks.
+    Examples:
+    --------
+    >>> zonas, valores = read_data('./datos/zonas2.txt', int), read_data('./datos/valores2.txt', float)
+    >>> result = zonal_stats_tiled(zonas, valores, ['count', 'mean', 'max'], tile_rows=3, workers=2)
+    >>> result.table['count'], np.around(result.table['mean'], 2), result.table['max']
+    (array([10,  5,  5,  8,  8,  4,  8, 12]), array([1.  , 2.  , 1.16, 4.4 , 5.  , 6.  , 0.  , 0.75]), array([1.  , 2.  , 1.2 , 4.98, 5.  , 6.  , 0.  , 1.  ]))
+    """
+    if zonas.shape != valores.shape:
+        raise IndexError("Los arrays proporcionados deben tener las mismas dimensiones")
+    stats = list(stats)
+    for stat in stats:
+        if stat not in TILED:
+            raise ValueError(f"Statistic {stat!r} can not be computed by blocks, use zonal_stats")
+    grids = out
+    if zonas.ndim == 1:
+        zonas, valores = zonas[:, np.newaxis], valores[:, np.newaxis]
+        out = None if out is None else {stat: grid[:, np.newaxis] for stat, grid in out.items()}
+    tiles = _tile_slices(zonas.shape, zonas.itemsize + valores.itemsize, tile_rows)
 
-        output = np.zeros(zonas.shape)
+    total = merge_partials(_map_tiles(lambda rows: zonal_partial(zonas[rows], valores[rows]), tiles, workers))
+    columns = {'count': total.count, 'sum': total.sum, 'mean': total.sum / total.count,
+               'std': np.sqrt(total.m2 / total.count), 'min': total.min, 'max': total.max}
+    table = {'zone': total.zone, **{stat: columns[stat] for stat in stats}}
 
-        # Obtenemos las diferentes zonas que hay en el array de zonas:
-        all_zones = np.unique(zonas)
+    if out:
+        def paint(rows: slice) -> None:
+            position = np.searchsorted(total.zone, zonas[rows])
+            for stat, grid in out.items():
+                grid[rows] = table[stat][position]
+        _map_tiles(paint, tiles, workers)
+    return ZonalStats(table, grids)
 
-        # Para cada zona obtenemos los indices que tienen esta zona.
-        # Y cambiamos estos indices en output.
 
-        for zone in all_zones:
-            idx_zone = zonas == zone
-            mean_zone = np.around(np.mean(valores[idx_zone]), 1)
-            output[idx_zone] = mean_zone
+def zonal_stats_rasters(zonas_path: str, valores_path: str, stats: Sequence[str] = ('count', 'mean'),
+                        tile_rows: int | None = None, workers: int | None = None) -> ZonalStats:
+    """
+    Same as zonal_stats_tiled, over two binary rasters (ver raster_io) mapped in memory.
+    """
+    return zonal_stats_tiled(open_raster(zonas_path), open_raster(valores_path), stats,
+                             tile_rows=tile_rows, workers=workers)
 
-        return output
 
 # ------------ test  --------#
 import doctest
 
+from raster_io import write_raster
+
 def test_doc()-> None:
     """
     The following instructions are to execute the tests of same functions
@@ -118,7 +639,201 @@ def test_doc()-> None:
     doctest.run_docstring_examples(read_data, globals(), verbose=False)  # vemos los resultados de los test que fallan
     doctest.run_docstring_examples(set_of_areas, globals(), verbose=False)  # vemos los resultados de los test que fallan
     doctest.run_docstring_examples(mean_areas, globals(), verbose=True)  # vemos los resultados de los test que fallan
+    doctest.run_docstring_examples(zone_inverse, globals(), verbose=False)
+    doctest.run_docstring_examples(ZoneIndex, globals(), verbose=False)
+    doctest.run_docstring_examples(zonal_stats, globals(), verbose=False)
+    doctest.run_docstring_examples(zonal_stats_tiled, globals(), verbose=False)
+    doctest.run_docstring_examples(label_regions, globals(), verbose=False)
+    doctest.run_docstring_examples(region_stats, globals(), verbose=False)
+
+
+def test_mean_areas() -> None:
+    """
+    Compares mean_areas with the per-zone masks over random grids, with dense
+    and sparse zone codes (the latter go through np.unique).
+    """
+    rng = np.random.default_rng(0)
+    valores = rng.integers(0, 100, (200, 300)).astype(float)
+    for codes in (np.arange(50), rng.choice(10 ** 9, 50, replace=False) - 10 ** 8):
+        zonas = codes[rng.integers(0, codes.size, valores.shape)]
+        expected = np.zeros(zonas.shape)
+        for zone in np.unique(zonas):
+            expected[zonas == zone] = np.mean(valores[zonas == zone])
+        assert np.allclose(mean_areas(zonas, valores), expected, atol=0.05 + 1e-9)
+        assert set_of_areas(zonas) == set(zone_inverse(zonas)[0])
+    # Rasters de enteros estrechos: el rango de códigos no cabe en su dtype.
+    for dtype, codes in ((np.int8, [-100, 100]), (np.int16, [-30000, 30000]), (np.uint8, [0, 255])):
+        zonas = np.array(codes, dtype=dtype)[rng.integers(0, 2, (200, 200))]
+        zone, inverse = zone_inverse(zonas)
+        assert zone.dtype == dtype and zone.tolist() == codes and np.array_equal(zone[inverse], zonas.ravel())
+        expected = np.where(zonas == codes[0], valores[:200, :200][zonas == codes[0]].mean(),
+                            valores[:200, :200][zonas == codes[1]].mean())
+        assert np.allclose(mean_areas(zonas, valores[:200, :200]), expected, atol=0.05 + 1e-9)
+    # read_data devuelve una copia modificable salvo con mmap=True.
+    valores = read_data('./datos/valores.txt', float)
+    valores[0, 0] = -1
+    mapped = read_data('./datos/valores.txt', float, mmap=True)
+    assert isinstance(mapped, np.memmap) and not mapped.flags.writeable and mapped[0, 0] == 5
+
+
+def test_zonal_stats() -> None:
+    """
+    Compares zonal_stats with NumPy over the cells of each zone.
+    """
+    rng = np.random.default_rng(1)
+    zonas = rng.integers(0, 30, (120, 80))
+    valores = rng.normal(10, 3, zonas.shape)
+    stats = ['count', 'sum', 'mean', 'std', 'min', 'max', 'median', 'p10', 'p99.5']
+    functions = [np.size, np.sum, np.mean, np.std, np.min, np.max, np.median,
+                 lambda a: np.percentile(a, 10), lambda a: np.percentile(a, 99.5)]
+    result = zonal_stats(zonas, valores, stats, broadcast=True)
+    assert list(result.table) == ['zone'] + stats
+    for i, zone in enumerate(result.table['zone']):
+        cells = valores[zonas == zone]
+        for stat, function in zip(stats, functions):
+            assert np.isclose(result.table[stat][i], function(cells))
+            assert np.all(result.grids[stat][zonas == zone] == result.table[stat][i])
+    try:
+        zonal_stats(zonas, valores, ['p101'])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("p101 must be rejected")
+
+
+def test_tiled() -> None:
+    """
+    Compares the tiled statistics, and the grids painted in the second pass,
+    with zonal_stats, also over binary rasters mapped in memory.
+    """
+    rng = np.random.default_rng(2)
+    zonas = rng.integers(0, 40, (150, 70)) * 7 - 100
+    valores = rng.normal(0, 5, zonas.shape)
+    expected = zonal_stats(zonas, valores, TILED, broadcast=True)
+    for tile_rows, workers in ((1, 1), (13, 4), (None, None)):
+        out = {'mean': np.empty(zonas.shape), 'max': np.empty(zonas.shape)}
+        result = zonal_stats_tiled(zonas, valores, TILED, out=out, tile_rows=tile_rows, workers=workers)
+        assert result.table.keys() == expected.table.keys()
+        for stat, column in expected.table.items():
+            assert np.allclose(result.table[stat], column)
+        for stat, grid in out.items():
+            assert np.allclose(grid, expected.grids[stat])
+    # Grids de otro dtype que la columna y entrada 1D: se devuelven los grids del llamante.
+    out = {'mean': np.empty(zonas.shape, dtype=np.float32), 'count': np.empty(zonas.shape)}
+    result = zonal_stats_tiled(zonas, valores, ['count', 'mean'], out=out, tile_rows=13, workers=2)
+    assert result.grids is out
+    assert np.allclose(out['mean'], expected.grids['mean'], atol=1e-5)
+    assert np.array_equal(out['count'], expected.grids['count'])
+    out = {'max': np.empty(zonas.size)}
+    result = zonal_stats_tiled(zonas.ravel(), valores.ravel(), ['max'], out=out, tile_rows=100)
+    assert result.grids['max'] is out['max'] and np.array_equal(out['max'], expected.grids['max'].ravel())
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [os.path.join(tmp, name) for name in ('zonas.raster', 'valores.raster')]
+        write_raster(paths[0], zonas)
+        write_raster(paths[1], valores)
+        result = zonal_stats_rasters(*paths, ['std'], tile_rows=9, workers=3)
+        assert np.allclose(result.table['std'], expected.table['std'])
+
+
+def test_zone_index() -> None:
+    """
+    Checks that a cached ZoneIndex gives the same results as the zone raster
+    and that the cache is keyed by the content of the raster.
+    """
+    rng = np.random.default_rng(3)
+    zonas = rng.integers(0, 25, (60, 90))
+    with tempfile.TemporaryDirectory() as tmp:
+        index = ZoneIndex.cached(zonas, tmp)
+        assert os.listdir(tmp) == [f'{ZoneIndex.content_hash(zonas)}.npz']
+        cached = ZoneIndex.cached(zonas.copy(), tmp)
+        assert len(os.listdir(tmp)) == 1 and cached.shape == index.shape
+        for _ in range(3):
+            valores = rng.normal(0, 1, zonas.shape)
+            assert np.array_equal(mean_areas(cached, valores), mean_areas(zonas, valores))
+            expected = zonal_stats(zonas, valores, ['mean', 'min', 'max', 'p75'])
+            for stat, column in zonal_stats(cached, valores, ['mean', 'min', 'max', 'p75']).table.items():
+                assert np.allclose(column, expected.table[stat])
+        zonas[0, 0] += 1
+        ZoneIndex.cached(zonas, tmp)
+        assert len(os.listdir(tmp)) == 2
+    assert set_of_areas(index) == set_of_areas(zonas)
+
+
+def test_bands() -> None:
+    """
+    Compares the statistics of a stack of bands with the ones of each band.
+    """
+    rng = np.random.default_rng(4)
+    zonas = rng.integers(0, 30, (50, 40))
+    bandas = rng.normal(20, 5, (4,) + zonas.shape)
+    index = ZoneIndex(zonas)
+    stats = ['count', 'sum', 'mean', 'std', 'min', 'max', 'median']
+    result = zonal_stats(index, bandas, stats, broadcast=True)
+    means = mean_areas(index, bandas)
+    for band, valores in enumerate(bandas):
+        expected = zonal_stats(index, valores, stats, broadcast=True)
+        assert np.array_equal(means[band], mean_areas(zonas, valores))
+        for stat in stats[1:]:
+            assert np.allclose(result.table[stat][band], expected.table[stat])
+            assert np.allclose(result.grids[stat][band], expected.grids[stat])
+    assert np.array_equal(result.table['count'], expected.table['count'])
+    try:
+        mean_areas(zonas, bandas[:, :-1])
+    except IndexError:
+        pass
+    else:
+        raise AssertionError("bands with other shape must be rejected")
+
+
+def _flood_fill(zonas: np.ndarray, connectivity: int) -> np.ndarray:
+    # Etiquetado de referencia con una pila, celda a celda.
+    steps = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+    if connectivity == 8:
+        steps += [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+    regions = np.full(zonas.shape, -1)
+    label = 0
+    for start in np.ndindex(zonas.shape):
+        if regions[start] >= 0:
+            continue
+        regions[start] = label
+        stack = [start]
+        while stack:
+            i, j = stack.pop()
+            for di, dj in steps:
+                k, m = i + di, j + dj
+                if 0 <= k < zonas.shape[0] and 0 <= m < zonas.shape[1] and regions[k, m] < 0 \
+                        and zonas[k, m] == zonas[i, j]:
+                    regions[k, m] = label
+                    stack.append((k, m))
+        label += 1
+    return regions
+
+
+def test_regions() -> None:
+    """
+    Compares label_regions with a flood fill over random grids with many
+    small patches, and with a spiral that needs many union-find rounds.
+    """
+    rng = np.random.default_rng(5)
+    for connectivity in (4, 8):
+        zonas = rng.integers(0, 3, (60, 45))
+        regions, region_zone = label_regions(zonas, connectivity)
+        assert np.array_equal(regions, _flood_fill(zonas, connectivity))
+        assert np.array_equal(region_zone[regions], zonas)
+    spiral = np.zeros((41, 41), dtype=int)
+    for k in range(0, 20, 2):
+        spiral[k, k:41 - k] = spiral[k:41 - k, 40 - k] = spiral[40 - k, k:41 - k] = 1
+        spiral[k + 2:41 - k, k] = 1
+        spiral[k + 2, k + 1] = 1
+    regions, _ = label_regions(spiral)
+    assert np.array_equal(regions, _flood_fill(spiral, 4))
 
 
 if __name__ == "__main__":
     test_doc()   # executing tests
+    test_mean_areas()
+    test_zonal_stats()
+    test_tiled()
+    test_zone_index()
+    test_bands()
+    test_regions()
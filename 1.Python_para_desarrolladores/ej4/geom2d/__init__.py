@@ -1,2 +1,4 @@
 from .point import Point
-from .vector import Vector
\ No newline at end of file
+from .vector import Vector
+from .arrays import PointArray, VectorArray
+from .spatial import GridHash, KDTree
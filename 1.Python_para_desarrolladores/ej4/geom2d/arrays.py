@@ -0,0 +1,180 @@
+from typing import Iterable, Iterator, Self
+
+import numpy as np
+
+from .point import Point
+from .vector import Vector
+
+
+class _CoordinateArray():
+    """
+    Colección de objetos de dos coordenadas guardadas en un único array
+    float64 contiguo de forma (n, 2). Las operaciones se hacen con NumPy
+    sobre todos los elementos a la vez, sin crear un objeto por elemento.
+    """
+
+    _item: type = object
+
+    def __init__(self, x: Iterable[float], y: Iterable[float]):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if x.ndim != 1 or x.shape != y.shape:
+            raise ValueError(f'x and y must be 1D with the same length, not {x.shape} and {y.shape}')
+        self._xy: np.ndarray = np.column_stack((x, y))
+
+    @classmethod
+    def _wrap(cls, xy: np.ndarray) -> Self:
+        # Constructor interno: adopta el array (n, 2) sin copiarlo.
+        array = cls.__new__(cls)
+        array._xy = xy
+        return array
+
+    @classmethod
+    def from_xy(cls, xy: Iterable[Iterable[float]]) -> Self:
+        """
+        Construye la colección a partir de un array (n, 2) de coordenadas.
+        """
+        xy = np.ascontiguousarray(xy, dtype=np.float64)
+        if xy.ndim != 2 or xy.shape[1] != 2:
+            raise ValueError(f'xy must have shape (n, 2), not {xy.shape}')
+        return cls._wrap(xy)
+
+    @classmethod
+    def from_list(cls, items: Iterable) -> Self:
+        """
+        Construye la colección a partir de objetos con atributos x e y.
+        """
+        items = list(items)
+        return cls([item.x for item in items], [item.y for item in items])
+
+    def to_list(self) -> list:
+        return [self._item(x, y) for x, y in self._xy.tolist()]
+
+    @property
+    def xy(self) -> np.ndarray:
+        return self._xy
+
+    @property
+    def x(self) -> np.ndarray:
+        return self._xy[:, 0]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self._xy[:, 1]
+
+    def __len__(self) -> int:
+        return len(self._xy)
+
+    def __getitem__(self, index):
+        """
+        Con un entero devuelve el elemento; con un slice, una máscara o un
+        array de índices, otra colección.
+        """
+        if isinstance(index, (int, np.integer)):
+            x, y = self._xy[index].tolist()
+            return self._item(x, y)
+        return self._wrap(self._xy[index])
+
+    def __iter__(self) -> Iterator:
+        return iter(self.to_list())
+
+    def _coords(self, other) -> np.ndarray:
+        # Coordenadas de otro operando: una colección (n, 2) o un único elemento (2,).
+        if isinstance(other, _CoordinateArray):
+            return other._xy
+        return np.array((other.x, other.y), dtype=np.float64)
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self._xy.tolist()})'
+
+
+class VectorArray(_CoordinateArray):
+    """
+    Colección de vectores con las operaciones de Vector vectorizadas.
+    El otro operando puede ser otra VectorArray de la misma longitud o un
+    único Vector, que se aplica a todos los elementos.
+
+    >>> vs = VectorArray([1, 0], [2, 3])
+    >>> vs + Vector(1, 1)
+    VectorArray([[2.0, 3.0], [1.0, 4.0]])
+    >>> 2 * vs
+    VectorArray([[2.0, 4.0], [0.0, 6.0]])
+    >>> vs * VectorArray([1, 1], [1, 1])
+    array([3., 3.])
+    >>> vs.to_list()
+    [V(1.0, 2.0), V(0.0, 3.0)]
+    """
+
+    _item = Vector
+
+    @property
+    def mod(self) -> np.ndarray:
+        return np.hypot(self.x, self.y)
+
+    def __add__(self, other: 'VectorArray | Vector') -> 'VectorArray':
+        return self._wrap(self._xy + self._coords(other))
+
+    def __sub__(self, other: 'VectorArray | Vector') -> 'VectorArray':
+        return self._wrap(self._xy - self._coords(other))
+
+    def __neg__(self) -> 'VectorArray':
+        return self._wrap(-self._xy)
+
+    def __rmul__(self, other: float | np.ndarray) -> 'VectorArray':
+        """
+        Producto por un escalar, o por un array de n escalares (uno por vector).
+        """
+        other = np.asarray(other, dtype=np.float64)
+        return self._wrap(self._xy * (other[:, np.newaxis] if other.ndim == 1 else other))
+
+    def __mul__(self, other: 'VectorArray | Vector') -> np.ndarray:
+        """
+        Producto escalar elemento a elemento.
+        """
+        coords = self._coords(other)
+        return self.x * coords[..., 0] + self.y * coords[..., 1]
+
+
+class PointArray(_CoordinateArray):
+    """
+    Colección de puntos. La resta da una VectorArray, sumar vectores traslada
+    los puntos y distance calcula distancias elemento a elemento o, con
+    pairwise_distance, todas contra todas.
+
+    >>> ps = PointArray([0, 3], [0, 4])
+    >>> ps.distance(Point(0, 0))
+    array([0., 5.])
+    >>> ps - Point(1, 1)
+    VectorArray([[-1.0, -1.0], [2.0, 3.0]])
+    >>> ps.pairwise_distance(PointArray([0], [4]))
+    array([[4.],
+           [3.]])
+    """
+
+    _item = Point
+
+    def __sub__(self, other: 'PointArray | Point') -> VectorArray:
+        """
+        Vectores que van de other a cada punto, como Point.__sub__.
+        """
+        return VectorArray._wrap(self._xy - self._coords(other))
+
+    def __add__(self, other: VectorArray | Vector) -> 'PointArray':
+        return self._wrap(self._xy + self._coords(other))
+
+    def distance(self, other: 'PointArray | Point') -> np.ndarray:
+        """
+        Distancia de cada punto a other (un Point o una PointArray de la misma longitud).
+        """
+        delta = self._xy - self._coords(other)
+        return np.sqrt(delta[:, 0] ** 2 + delta[:, 1] ** 2)
+
+    def pairwise_distance(self, other: 'PointArray | None' = None) -> np.ndarray:
+        """
+        Matriz (n, m) con la distancia de cada punto a cada punto de other
+        (por defecto, a los de la propia colección).
+        """
+        other = self if other is None else other
+        dx = self.x[:, np.newaxis] - other.x[np.newaxis, :]
+        dy = self.y[:, np.newaxis] - other.y[np.newaxis, :]
+        return np.sqrt(dx ** 2 + dy ** 2)
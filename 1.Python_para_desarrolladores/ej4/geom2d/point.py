@@ -3,36 +3,13 @@ import math
 from typing import Self
 
 class Point():
-    
-    def __init__(self, x: float, y:float):
-        # _x, _y son atributos privados.
-        self._x:float = x
-        self._y:float = y
-    
-    """
-    Getters, similares a los de la clase Vector
-    """
-
-    @property
-    def x(self) -> float:
-        return self._x
+    # Las coordenadas se pueden leer y modificar, así que no hace falta un
+    # getter y un setter: x e y son slots, sin __dict__ por punto.
+    __slots__ = ('x', 'y')
 
-    @property
-    def y(self) -> float:
-        return self._y
-
-    """
-    Setters, seguimos la recomendación del ultimo video y agregamos
-    un decorador setter
-    """
-
-    @x.setter
-    def x(self, value: float) -> None:
-        self._x = value
-
-    @y.setter
-    def y(self, value: float) -> None:
-        self._y = value
+    def __init__(self, x: float, y:float):
+        self.x:float = x
+        self.y:float = y
 
     @property
     def mod(self) -> float:
@@ -0,0 +1,465 @@
+import heapq
+import math
+from typing import Iterable
+
+import numpy as np
+
+from .arrays import PointArray
+from .point import Point
+
+"""
+Índices espaciales sobre puntos para consultas de vecinos más próximos (kNN),
+de radio y de rectángulo. KDTree es estático (se construye una vez sobre
+todos los puntos) y admite consultas por lotes vectorizadas; GridHash es
+una rejilla uniforme que admite inserciones y borrados.
+Las consultas devuelven índices de los puntos (la posición en la colección
+con la que se construyó el KDTree, o el id que devuelve GridHash.insert).
+"""
+
+
+def _as_xy(points) -> np.ndarray:
+    # Coordenadas (n, 2) de un Point, una PointArray, una lista de puntos o un array.
+    if isinstance(points, Point):
+        return np.array([[points.x, points.y]], dtype=np.float64)
+    if isinstance(points, PointArray):
+        return points.xy
+    if isinstance(points, np.ndarray):
+        xy = np.asarray(points, dtype=np.float64)
+    else:
+        points = list(points)
+        xy = np.array([(p.x, p.y) for p in points] if points and hasattr(points[0], 'x') else points,
+                      dtype=np.float64).reshape(-1, 2)
+    if xy.ndim != 2 or xy.shape[1] != 2:
+        raise ValueError(f'points must have shape (n, 2), not {xy.shape}')
+    return xy
+
+
+def _squared_distances(queries: np.ndarray, xy: np.ndarray) -> np.ndarray:
+    # Matriz (m, n) de distancias al cuadrado; la raíz se deja para el final.
+    dx = queries[:, 0, np.newaxis] - xy[np.newaxis, :, 0]
+    dy = queries[:, 1, np.newaxis] - xy[np.newaxis, :, 1]
+    dx *= dx
+    dy *= dy
+    dx += dy
+    return dx
+
+
+def _k_smallest(distances: np.ndarray, indices: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    # Los k menores por fila, ordenados por distancia y, a igual distancia, por índice.
+    if distances.shape[1] > k:
+        part = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        distances = np.take_along_axis(distances, part, axis=1)
+        indices = np.take_along_axis(indices, part, axis=1) if indices.ndim == 2 else indices[part]
+    elif indices.ndim == 1:
+        indices = np.broadcast_to(indices, distances.shape)
+    order = np.lexsort((indices, distances), axis=1)
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+
+class KDTree():
+    """
+    Árbol k-d estático. Cada nodo parte sus puntos por la mediana de la
+    coordenada de mayor extensión; las hojas guardan hasta leaf_size puntos,
+    contiguos en memoria, que se comparan con NumPy de una vez.
+
+    >>> tree = KDTree([Point(0, 0), Point(1, 0), Point(0, 2), Point(5, 5)])
+    >>> tree.nearest(Point(0.9, 0.1), k=2)
+    (array([0.14142136, 0.90553851]), array([1, 0]))
+    >>> tree.within(Point(0, 0), 2)
+    array([0, 1, 2])
+    >>> tree.in_box(-1, -1, 1, 1)
+    array([0, 1])
+    >>> tree.nearest_many([Point(4, 4), Point(0, 1.9)])
+    (array([[1.41421356],
+           [0.1       ]]), array([[3],
+           [2]]))
+    """
+
+    BATCH = 2048       # consultas que se comparan a la vez con sus candidatos
+    PAIRS = 2 ** 20    # tamaño máximo (consultas x candidatos) de las matrices de distancias
+    CANDIDATES = 4096  # con más candidatos, una consulta sola usa la búsqueda de nearest
+
+    def __init__(self, points, leaf_size: int = 16):
+        xy = _as_xy(points)
+        self.leaf_size = max(1, leaf_size)
+        self._index = np.arange(len(xy))
+        # Por nodo: rango [start, end) en _index, hijos (-1 en las hojas) y caja envolvente.
+        self._start, self._end, self._left, self._right, self._box = [], [], [], [], []
+        self._split_dim, self._split = [], []
+        if len(xy):
+            self._build(xy, 0, len(xy))
+        self._start, self._end = np.array(self._start, dtype=np.intp), np.array(self._end, dtype=np.intp)
+        self._left, self._right = np.array(self._left, dtype=np.intp), np.array(self._right, dtype=np.intp)
+        self._box = np.array(self._box, dtype=np.float64).reshape(-1, 4)
+        self._split_dim, self._split = np.array(self._split_dim, dtype=np.intp), np.array(self._split, dtype=np.float64)
+        self._xy = xy[self._index]  # puntos en el orden de las hojas
+
+    def _build(self, xy: np.ndarray, start: int, end: int) -> int:
+        node = len(self._start)
+        coords = xy[self._index[start:end]]
+        low, high = coords.min(axis=0), coords.max(axis=0)
+        self._start.append(start)
+        self._end.append(end)
+        self._box.append((low[0], low[1], high[0], high[1]))
+        self._left.append(-1)
+        self._right.append(-1)
+        self._split_dim.append(0)
+        self._split.append(0.0)
+        if end - start <= self.leaf_size:
+            return node
+        dim = int(np.argmax(high - low))
+        middle = (end - start) // 2
+        order = np.argpartition(coords[:, dim], middle)
+        self._index[start:end] = self._index[start:end][order]
+        self._split_dim[node] = dim
+        self._split[node] = coords[order[middle], dim]
+        self._left[node] = self._build(xy, start, start + middle)
+        self._right[node] = self._build(xy, start + middle, end)
+        return node
+
+    def __len__(self) -> int:
+        return len(self._xy)
+
+    def _min_distance(self, node: int, x: float, y: float) -> float:
+        xmin, ymin, xmax, ymax = self._box[node]
+        dx = max(xmin - x, 0.0, x - xmax)
+        dy = max(ymin - y, 0.0, y - ymax)
+        return math.sqrt(dx * dx + dy * dy)
+
+    def nearest(self, point: Point, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Distancias e índices de los k puntos más próximos, del más cercano al más lejano.
+        :raise ValueError: if k is greater than the number of points.
+        """
+        if not 1 <= k <= len(self):
+            raise ValueError(f'k must be between 1 and {len(self)}, not {k}')
+        x, y = point.x, point.y
+        best_distance, best_index = np.full(k, np.inf), np.full(k, -1)
+        heap = [(0.0, 0)]
+        while heap:
+            bound, node = heapq.heappop(heap)
+            if bound > best_distance[-1]:
+                break
+            if self._left[node] < 0:
+                start, end = self._start[node], self._end[node]
+                distances = np.sqrt(((self._xy[start:end] - (x, y)) ** 2).sum(axis=1))
+                distances, indices = _k_smallest(np.concatenate((best_distance, distances))[np.newaxis],
+                                                 np.concatenate((best_index, self._index[start:end])), k)
+                best_distance, best_index = distances[0], indices[0]
+                continue
+            for child in (self._left[node], self._right[node]):
+                distance = self._min_distance(child, x, y)
+                if distance <= best_distance[-1]:
+                    heapq.heappush(heap, (distance, child))
+        return best_distance, best_index
+
+    def _nodes_in(self, xmin: float, ymin: float, xmax: float, ymax: float):
+        # Recorre los nodos que cortan el rectángulo; devuelve (nodo, contenido entero).
+        stack = [0] if len(self) else []
+        while stack:
+            node = stack.pop()
+            bxmin, bymin, bxmax, bymax = self._box[node]
+            if bxmin > xmax or bxmax < xmin or bymin > ymax or bymax < ymin:
+                continue
+            inside = xmin <= bxmin and bxmax <= xmax and ymin <= bymin and bymax <= ymax
+            if inside or self._left[node] < 0:
+                yield node, inside
+            else:
+                stack.extend((self._left[node], self._right[node]))
+
+    def in_box(self, xmin: float, ymin: float, xmax: float, ymax: float) -> np.ndarray:
+        """
+        Índices (ordenados) de los puntos dentro del rectángulo, bordes incluidos.
+        """
+        found = []
+        for node, inside in self._nodes_in(xmin, ymin, xmax, ymax):
+            start, end = self._start[node], self._end[node]
+            if inside:
+                found.append(self._index[start:end])
+            else:
+                coords = self._xy[start:end]
+                mask = ((coords[:, 0] >= xmin) & (coords[:, 0] <= xmax)
+                        & (coords[:, 1] >= ymin) & (coords[:, 1] <= ymax))
+                found.append(self._index[start:end][mask])
+        return np.sort(np.concatenate(found)) if found else np.empty(0, dtype=np.intp)
+
+    def within(self, point: Point, radius: float) -> np.ndarray:
+        """
+        Índices (ordenados) de los puntos a distancia menor o igual que radius.
+        """
+        return self.within_many([point], radius)[0]
+
+    def _candidates(self, queries: np.ndarray, radius: np.ndarray | float) -> np.ndarray:
+        # Posiciones en _xy de los puntos de las hojas que cortan la caja de las
+        # consultas ampliada en radius: contiene todos los puntos a esa distancia.
+        low, high = queries.min(axis=0) - radius, queries.max(axis=0) + radius
+        ranges = [(self._start[node], self._end[node]) for node, _ in self._nodes_in(low[0], low[1], high[0], high[1])]
+        if not ranges:
+            return np.empty(0, dtype=np.intp)
+        return np.concatenate([np.arange(start, end) for start, end in ranges])
+
+    def _groups(self, queries: np.ndarray, min_points: int) -> Iterable[tuple[int, np.ndarray]]:
+        # Baja todas las consultas a la vez por el árbol hasta el nodo más
+        # profundo con al menos min_points puntos, y las agrupa por nodo en
+        # bloques de consultas próximas entre sí.
+        node = np.zeros(len(queries), dtype=np.intp)
+        active = np.arange(len(queries))
+        sizes = self._end - self._start
+        while active.size:
+            current = node[active]
+            internal = self._left[current] >= 0
+            active, current = active[internal], current[internal]
+            right = queries[active, self._split_dim[current]] >= self._split[current]
+            child = np.where(right, self._right[current], self._left[current])
+            deeper = sizes[child] >= min_points
+            active, child = active[deeper], child[deeper]
+            node[active] = child
+        order = np.argsort(node, kind='stable')
+        bounds = np.flatnonzero(np.diff(node[order])) + 1
+        for group in np.split(order, bounds):
+            for start in range(0, len(group), self.BATCH):
+                yield node[group[0]], group[start:start + self.BATCH]
+
+    def nearest_many(self, points, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Batched nearest: arrays (m, k) de distancias e índices, una fila por consulta.
+        Las consultas se agrupan por nodo y la k-ésima distancia dentro del
+        nodo acota el radio de búsqueda de cada una. Las de radio parecido se
+        comparan con sus candidatos con NumPy de una vez; si la matriz de
+        distancias pasa de PAIRS el bloque se parte en dos, y una consulta
+        sola con más de CANDIDATES candidatos (por ejemplo, muy lejos de los
+        puntos) usa la búsqueda de nearest, que descarta nodos por su caja.
+        :raise ValueError: if k is greater than the number of points.
+        """
+        if not 1 <= k <= len(self):
+            raise ValueError(f'k must be between 1 and {len(self)}, not {k}')
+        queries = _as_xy(points)
+        distances = np.empty((len(queries), k))
+        indices = np.empty((len(queries), k), dtype=np.intp)
+        limit = max(self.CANDIDATES, 8 * k)
+        for node, group in self._groups(queries, k):
+            start, end = self._start[node], self._end[node]
+            local = _squared_distances(queries[group], self._xy[start:end])
+            bounds = np.sqrt(np.partition(local, k - 1, axis=1)[:, k - 1])
+            order = np.argsort(bounds)
+            pending = [(group[order], bounds[order])]
+            while pending:
+                block, block_bounds = pending.pop()
+                q = queries[block]
+                candidates = self._candidates(q, block_bounds[-1])
+                if len(block) == 1 and candidates.size > limit:
+                    d, i = self.nearest(Point(*q[0].tolist()), k)
+                    distances[block[0]], indices[block[0]] = d * d, i
+                elif len(block) > 1 and len(block) * candidates.size > self.PAIRS:
+                    middle = len(block) // 2
+                    pending += [(block[:middle], block_bounds[:middle]), (block[middle:], block_bounds[middle:])]
+                else:
+                    d2 = _squared_distances(q, self._xy[candidates])
+                    distances[block], indices[block] = _k_smallest(d2, self._index[candidates], k)
+        return np.sqrt(distances), indices
+
+    def within_many(self, points, radius: float) -> list[np.ndarray]:
+        """
+        Batched within: una lista con los índices (ordenados) de cada consulta.
+        Como en nearest_many, si la matriz de distancias de un bloque de
+        consultas pasa de PAIRS, el bloque se parte en dos por la mediana de
+        su coordenada de mayor extensión.
+        """
+        queries = _as_xy(points)
+        result = [np.empty(0, dtype=np.intp)] * len(queries)
+        if not len(self):
+            return result
+        pending = [group for _, group in self._groups(queries, 1)]
+        while pending:
+            block = pending.pop()
+            q = queries[block]
+            candidates = self._candidates(q, radius)
+            if len(block) > 1 and len(block) * candidates.size > self.PAIRS:
+                order = np.argsort(q[:, np.argmax(np.ptp(q, axis=0))], kind='stable')
+                middle = len(block) // 2
+                pending += [block[order[:middle]], block[order[middle:]]]
+                continue
+            d = np.sqrt(_squared_distances(q, self._xy[candidates]))
+            rows, columns = np.nonzero(d <= radius)
+            found = np.split(self._index[candidates][columns], np.flatnonzero(np.diff(rows)) + 1)
+            for row, indices in zip(np.unique(rows), found):
+                result[block[row]] = np.sort(indices)
+        return result
+
+    def in_box_many(self, boxes: Iterable[tuple[float, float, float, float]]) -> list[np.ndarray]:
+        """
+        Una lista con los índices de cada rectángulo (xmin, ymin, xmax, ymax).
+        No está vectorizada: llama a in_box para cada rectángulo y solo existe
+        por simetría con nearest_many y within_many.
+        """
+        return [self.in_box(*box) for box in boxes]
+
+
+class GridHash():
+    """
+    Rejilla uniforme de celdas de lado cell_size, con un diccionario de la
+    celda a los ids de sus puntos. Insertar y borrar cuestan O(1); las
+    consultas recorren solo las celdas cercanas, así que funciona mejor con
+    cell_size del orden de la distancia entre puntos o del radio buscado.
+
+    >>> grid = GridHash(1.0)
+    >>> ids = grid.insert_many([Point(0, 0), Point(1, 0), Point(0, 2), Point(5, 5)])
+    >>> grid.nearest(Point(0.9, 0.1), k=2)
+    (array([0.14142136, 0.90553851]), array([1, 0]))
+    >>> grid.remove(1)
+    >>> grid.within(Point(0, 0), 2), grid.in_box(-1, -1, 1, 1)
+    (array([0, 2]), array([0]))
+    """
+
+    def __init__(self, cell_size: float, points=None):
+        if cell_size <= 0:
+            raise ValueError(f'cell_size must be positive, not {cell_size}')
+        self.cell_size = cell_size
+        self._cells: dict[tuple[int, int], list[int]] = {}
+        self._coords: dict[int, tuple[float, float]] = {}
+        self._next_id = 0
+        # Celdas extremas ocupadas: limitan las búsquedas. Tras borrar una celda
+        # del borde se recalculan en la siguiente consulta (_stale).
+        self._low, self._high = (math.inf, math.inf), (-math.inf, -math.inf)
+        self._stale = False
+        if points is not None:
+            self.insert_many(points)
+
+    def __len__(self) -> int:
+        return len(self._coords)
+
+    def _cell(self, x: float, y: float) -> tuple[int, int]:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def insert(self, point: Point) -> int:
+        """
+        Añade un punto y devuelve su id.
+        """
+        point_id = self._next_id
+        self._next_id += 1
+        x, y = point.x, point.y
+        cell = self._cell(x, y)
+        self._coords[point_id] = (x, y)
+        self._cells.setdefault(cell, []).append(point_id)
+        self._low = (min(self._low[0], cell[0]), min(self._low[1], cell[1]))
+        self._high = (max(self._high[0], cell[0]), max(self._high[1], cell[1]))
+        return point_id
+
+    def insert_many(self, points) -> np.ndarray:
+        return np.array([self.insert(Point(x, y)) for x, y in _as_xy(points).tolist()], dtype=np.intp)
+
+    def remove(self, point_id: int) -> None:
+        """
+        :raise KeyError: if there is no point with that id.
+        """
+        x, y = self._coords.pop(point_id)
+        cell = self._cell(x, y)
+        self._cells[cell].remove(point_id)
+        if not self._cells[cell]:
+            del self._cells[cell]
+            if cell[0] in (self._low[0], self._high[0]) or cell[1] in (self._low[1], self._high[1]):
+                self._stale = True
+
+    def _bounds(self) -> tuple[tuple[int, int], tuple[int, int]]:
+        if self._stale:
+            if self._cells:
+                i, j = zip(*self._cells)
+                self._low, self._high = (min(i), min(j)), (max(i), max(j))
+            else:
+                self._low, self._high = (math.inf, math.inf), (-math.inf, -math.inf)
+            self._stale = False
+        return self._low, self._high
+
+    def _points_in_cells(self, cells: Iterable[tuple[int, int]]) -> tuple[np.ndarray, np.ndarray]:
+        ids = [point_id for cell in cells for point_id in self._cells.get(cell, ())]
+        xy = np.array([self._coords[point_id] for point_id in ids], dtype=np.float64).reshape(-1, 2)
+        return np.array(ids, dtype=np.intp), xy
+
+    def _ring(self, center: tuple[int, int], r: int, low: tuple[int, int],
+              high: tuple[int, int]) -> list[tuple[int, int]]:
+        # Celdas a distancia (de Chebyshev) r del centro, recortadas a las ocupadas
+        # [low, high]; si aun así son más que las celdas ocupadas, se filtran estas.
+        i, j = center
+        if 8 * r > len(self._cells):
+            return [cell for cell in self._cells if max(abs(cell[0] - i), abs(cell[1] - j)) == r]
+        if r == 0:
+            return [center]
+        jmin, jmax = max(j - r, low[1]), min(j + r, high[1])
+        imin, imax = max(i - r + 1, low[0]), min(i + r - 1, high[0])
+        cells = [(i + di, jj) for di in (-r, r) if low[0] <= i + di <= high[0] for jj in range(jmin, jmax + 1)]
+        return cells + [(ii, j + dj) for dj in (-r, r) if low[1] <= j + dj <= high[1] for ii in range(imin, imax + 1)]
+
+    def nearest(self, point: Point, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Distancias e ids de los k puntos más próximos, recorriendo anillos de
+        celdas alrededor de la del punto hasta que ninguna celda sin visitar
+        pueda tener un punto más cercano que el k-ésimo encontrado.
+        :raise ValueError: if k is greater than the number of points.
+        """
+        if not 1 <= k <= len(self):
+            raise ValueError(f'k must be between 1 and {len(self)}, not {k}')
+        x, y = point.x, point.y
+        center = self._cell(x, y)
+        low, high = self._bounds()
+        # Los anillos anteriores a first no tienen celdas ocupadas y ningún
+        # punto está más lejos que last anillos.
+        first = max(0, low[0] - center[0], center[0] - high[0], low[1] - center[1], center[1] - high[1])
+        last = max(abs(center[0] - low[0]), abs(center[0] - high[0]),
+                   abs(center[1] - low[1]), abs(center[1] - high[1]))
+        distances, ids = np.empty(0), np.empty(0, dtype=np.intp)
+        for r in range(first, last + 1):
+            ring_ids, xy = self._points_in_cells(self._ring(center, r, low, high))
+            if ring_ids.size:
+                d = np.sqrt(((xy - (x, y)) ** 2).sum(axis=1))
+                distances, ids = np.concatenate((distances, d)), np.concatenate((ids, ring_ids))
+            # Las celdas del anillo r + 1 están al menos a r * cell_size del punto.
+            if ids.size >= k and np.partition(distances, k - 1)[k - 1] <= r * self.cell_size:
+                break
+        distances, ids = _k_smallest(distances[np.newaxis], ids, k)
+        return distances[0], ids[0]
+
+    def in_box(self, xmin: float, ymin: float, xmax: float, ymax: float) -> np.ndarray:
+        """
+        Ids (ordenados) de los puntos dentro del rectángulo, bordes incluidos.
+        """
+        (imin, jmin), (imax, jmax) = self._cell(xmin, ymin), self._cell(xmax, ymax)
+        low, high = self._bounds()
+        imin, jmin = max(imin, low[0]), max(jmin, low[1])
+        imax, jmax = min(imax, high[0]), min(jmax, high[1])
+        if imin > imax or jmin > jmax:
+            return np.empty(0, dtype=np.intp)
+        if (imax - imin + 1) * (jmax - jmin + 1) > len(self._cells):
+            cells = [cell for cell in self._cells if imin <= cell[0] <= imax and jmin <= cell[1] <= jmax]
+        else:
+            cells = [(i, j) for i in range(imin, imax + 1) for j in range(jmin, jmax + 1)]
+        ids, xy = self._points_in_cells(cells)
+        mask = (xy[:, 0] >= xmin) & (xy[:, 0] <= xmax) & (xy[:, 1] >= ymin) & (xy[:, 1] <= ymax)
+        return np.sort(ids[mask])
+
+    def within(self, point: Point, radius: float) -> np.ndarray:
+        """
+        Ids (ordenados) de los puntos a distancia menor o igual que radius.
+        """
+        x, y = point.x, point.y
+        candidates = self.in_box(x - radius, y - radius, x + radius, y + radius)
+        if not candidates.size:
+            return candidates
+        xy = np.array([self._coords[point_id] for point_id in candidates.tolist()])
+        return candidates[np.sqrt(((xy - (x, y)) ** 2).sum(axis=1)) <= radius]
+
+    # Las versiones por lotes de GridHash no están vectorizadas: llaman a la
+    # consulta individual para cada punto y solo dan la misma interfaz que KDTree.
+
+    def nearest_many(self, points, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Arrays (m, k) de distancias e ids, una fila por consulta (un nearest por consulta).
+        """
+        rows = [self.nearest(Point(x, y), k) for x, y in _as_xy(points).tolist()]
+        return (np.array([row[0] for row in rows]).reshape(-1, k),
+                np.array([row[1] for row in rows], dtype=np.intp).reshape(-1, k))
+
+    def within_many(self, points, radius: float) -> list[np.ndarray]:
+        return [self.within(Point(x, y), radius) for x, y in _as_xy(points).tolist()]
+
+    def in_box_many(self, boxes: Iterable[tuple[float, float, float, float]]) -> list[np.ndarray]:
+        return [self.in_box(*box) for box in boxes]
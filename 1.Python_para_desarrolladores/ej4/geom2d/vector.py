@@ -3,6 +3,10 @@ from typing import Self
 
 
 class Vector():
+    # Sin __dict__: cada vector ocupa solo sus coordenadas y el hash, que se
+    # calcula la primera vez que se pide (los vectores no se modifican).
+    __slots__ = ('_x', '_y', '_hash')
+
     def __init__(self, x: float, y:float):
         # _x, _y son atributos privados.
         self._x:float = x
@@ -18,10 +22,13 @@ class Vector():
 
     @property
     def mod(self) -> float:
-        return math.sqrt(self.x**2 * self.y**2)
+        """
+        Módulo (norma euclídea) del vector
+        """
+        return math.hypot(self._x, self._y)
 
     def __eq__(self, other: Self) -> bool:
-        return self.x == other.x and self.y == other.y
+        return self._x == other.x and self._y == other.y
 
     def __le__(self, other: Self) -> bool:
         return self.mod <= other.mod
@@ -32,38 +39,42 @@ class Vector():
         pueda distinguir un punto de un vector.
         Para ello agregamos una tercera coordenada que los diferencie.
         """
-        return hash((self.x, self.y, 'Vector'))
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = hash((self._x, self._y, 'Vector'))
+            return self._hash
 
 
     def __add__(self, other: Self) -> Self:
         """
         Suma de vectores
         """
-        return Vector(self.x + other.x, self.y + other.y)
+        return Vector(self._x + other.x, self._y + other.y)
 
     def __sub__(self, other: Self) -> Self:
         """
         Resta de vectores
         """
-        return Vector(self.x - other.x, self.y - other.y)
+        return Vector(self._x - other.x, self._y - other.y)
 
     def __neg__(self) -> Self:
         """
         Vector inverso
         """
-        return Vector(-self.x, -self.y)
+        return Vector(-self._x, -self._y)
 
     def __rmul__(self, other: float) -> Self:
         """
         Producto de escalar (real) por vector
         """
-        return Vector(other * self.x, other * self.y)
+        return Vector(other * self._x, other * self._y)
 
     def __mul__(self, other: Self) -> float:
         """
         Producto escalar de vectores
         """
-        return self.x * other.x + self.y * other.y
+        return self._x * other.x + self._y * other.y
 
 
     def __repr__(self) -> str:
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from geom2d import *
+
+"""
+Testing the conversion between lists of objects and arrays
+"""
+
+@pytest.mark.parametrize(
+      "cls, items", [
+          (PointArray, [Point(1, 2), Point(-3.5, 0)]),
+          (VectorArray, [Vector(0, 0), Vector(4, 5), Vector(1.5, -2)])
+      ]
+)
+
+def test_round_trip(cls, items):
+    array = cls.from_list(items)
+    assert len(array) == len(items)
+    assert array.to_list() == items
+    assert list(array) == items
+    assert array[1] == items[1]
+    assert array[1:].to_list() == items[1:]
+
+
+"""
+Testing that the vectorized operations match the ones of Vector
+"""
+
+@pytest.mark.parametrize(
+      "vectors1, vectors2", [
+          ([Vector(1, 2), Vector(0, -1)], [Vector(3, 4), Vector(2, 2)]),
+          ([Vector(0.5, 1.5), Vector(-2, 3), Vector(7, 0)], [Vector(1, 1), Vector(0, 3), Vector(-1, -1)])
+      ]
+)
+
+def test_vector_operations(vectors1, vectors2):
+    a, b = VectorArray.from_list(vectors1), VectorArray.from_list(vectors2)
+    assert (a + b).to_list() == [v + w for v, w in zip(vectors1, vectors2)]
+    assert (a - b).to_list() == [v - w for v, w in zip(vectors1, vectors2)]
+    assert (-a).to_list() == [-v for v in vectors1]
+    assert (2.5 * a).to_list() == [2.5 * v for v in vectors1]
+    assert (a * b).tolist() == [v * w for v, w in zip(vectors1, vectors2)]
+    assert (a * vectors2[0]).tolist() == [v * vectors2[0] for v in vectors1]
+    assert np.allclose(a.mod, [v.mod for v in vectors1])
+
+
+"""
+Testing distances between arrays of points
+"""
+
+def test_point_distances():
+    rng = np.random.default_rng(0)
+    points = [Point(x, y) for x, y in rng.normal(0, 10, (50, 2)).tolist()]
+    others = [Point(x, y) for x, y in rng.normal(0, 10, (30, 2)).tolist()]
+    array, other_array = PointArray.from_list(points), PointArray.from_list(others)
+    assert array.distance(others[0]).tolist() == [p.distance(others[0]) for p in points]
+    assert array[:30].distance(other_array).tolist() == [p.distance(q) for p, q in zip(points, others)]
+    matrix = array.pairwise_distance(other_array)
+    assert matrix.shape == (50, 30)
+    assert np.allclose(matrix, [[p.distance(q) for q in others] for p in points])
+    assert (array - others[0]).to_list() == [p - others[0] for p in points]
+    assert np.allclose(np.diag(array.pairwise_distance()), 0)
+
+
+def test_shape_errors():
+    with pytest.raises(ValueError):
+        PointArray([1, 2], [1])
+    with pytest.raises(ValueError):
+        VectorArray.from_xy(np.zeros((3, 3)))
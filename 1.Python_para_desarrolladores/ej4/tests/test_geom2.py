@@ -58,4 +58,49 @@ Testing vector sizes
 )
 
 def test_vector_sizes(vector1, vector2):
-    assert vector1 <= vector2
\ No newline at end of file
+    assert vector1 <= vector2
+
+
+@pytest.mark.parametrize(
+      "vector, mod", [
+          (Vector(3,4), 5.0),
+          (Vector(0,-2), 2.0),
+          (Vector(1,0), 1.0)
+      ]
+)
+
+def test_vector_mod(vector, mod):
+    assert vector.mod == mod
+    assert VectorArray.from_list([vector]).mod.tolist() == [mod]
+
+"""
+Testing the compact representation: no __dict__, same equality and hash
+"""
+
+@pytest.mark.parametrize(
+      "obj, same", [
+          (Point(1,2), Point(1.0,2.0)),
+          (Vector(4,5), Vector(4.0,5.0))
+      ]
+)
+
+def test_slots(obj, same):
+    assert not hasattr(obj, '__dict__')
+    with pytest.raises(AttributeError):
+        obj.z = 0
+    assert obj == same and hash(obj) == hash(same)
+    assert hash(obj) == hash(obj) and same in {obj}
+
+
+def test_point_setters():
+    point = Point(1,2)
+    point.x, point.y = 3, 4
+    assert point == Point(3,4) and hash(point) == hash(Point(3,4))
+
+
+def test_vector_is_read_only():
+    vector = Vector(1,2)
+    with pytest.raises(AttributeError):
+        vector.x = 3
+    assert (vector + Vector(1,1), vector - Vector(1,1), -vector, 2 * vector, vector * Vector(3,4)) \
+        == (Vector(2,3), Vector(0,1), Vector(-1,-2), Vector(2,4), 11)
@@ -0,0 +1,139 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+from geom2d import *
+
+"""
+Testing the spatial indexes against a brute force search over random points
+"""
+
+rng = np.random.default_rng(0)
+POINTS = rng.uniform(0, 100, (2000, 2))
+QUERIES = np.vstack([rng.uniform(-10, 110, (300, 2)), POINTS[:20]])
+
+
+def brute_nearest(k):
+    distances = np.sqrt(((QUERIES[:, np.newaxis] - POINTS[np.newaxis]) ** 2).sum(axis=2))
+    indices = np.argsort(distances, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(distances, indices, axis=1), indices
+
+
+def brute_within(query, radius):
+    return np.flatnonzero(np.sqrt(((POINTS - query) ** 2).sum(axis=1)) <= radius)
+
+
+def build(kind):
+    if kind == 'kdtree':
+        return KDTree(PointArray.from_xy(POINTS), leaf_size=8)
+    return GridHash(5.0, POINTS)
+
+
+@pytest.mark.parametrize("kind", ['kdtree', 'grid'])
+@pytest.mark.parametrize("k", [1, 5, 40])
+
+def test_nearest(kind, k):
+    index = build(kind)
+    expected_distances, expected_indices = brute_nearest(k)
+    distances, indices = index.nearest_many(QUERIES, k)
+    assert np.allclose(distances, expected_distances)
+    assert np.array_equal(indices, expected_indices)
+    for row in (0, 150, 310):
+        distances, indices = index.nearest(Point(*QUERIES[row]), k)
+        assert np.array_equal(indices, expected_indices[row])
+
+
+@pytest.mark.parametrize("kind", ['kdtree', 'grid'])
+@pytest.mark.parametrize("radius", [0.0, 3.5, 30])
+
+def test_within(kind, radius):
+    index = build(kind)
+    found = index.within_many(QUERIES, radius)
+    for query, indices in zip(QUERIES, found):
+        assert np.array_equal(indices, brute_within(query, radius))
+    assert np.array_equal(index.within(Point(*QUERIES[5]), radius), found[5])
+
+
+@pytest.mark.parametrize("kind", ['kdtree', 'grid'])
+
+def test_in_box(kind):
+    index = build(kind)
+    boxes = [(10, 20, 30, 25), (-5, -5, 0, 0), (0, 0, 100, 100), (50, 50, 50.5, 90)]
+    for box, indices in zip(boxes, index.in_box_many(boxes)):
+        x, y = POINTS[:, 0], POINTS[:, 1]
+        expected = np.flatnonzero((x >= box[0]) & (x <= box[2]) & (y >= box[1]) & (y <= box[3]))
+        assert np.array_equal(indices, expected)
+
+
+@pytest.mark.parametrize("kind", ['kdtree', 'grid'])
+
+def test_far_queries(kind):
+    # Consultas muy lejos de los puntos: caen en los mismos nodos del borde.
+    index = build(kind)
+    queries = np.column_stack((np.full(400, 5000.0), np.linspace(-50, 150, 400)))
+    distances, indices = index.nearest_many(queries, 3)
+    expected = np.sqrt(((queries[:, np.newaxis] - POINTS[np.newaxis]) ** 2).sum(axis=2))
+    order = np.argsort(expected, axis=1, kind='stable')[:, :3]
+    assert np.array_equal(indices, order)
+    assert np.allclose(distances, np.take_along_axis(expected, order, axis=1))
+
+
+def test_kdtree_outliers_memory():
+    # Las consultas lejanas no comparan todo el bloque con todos los puntos.
+    points = np.random.default_rng(1).uniform(0, 1, (50000, 2))
+    tree = KDTree(PointArray.from_xy(points))
+    queries = np.column_stack((np.full(3000, 50.0), np.linspace(0, 1, 3000)))
+    tracemalloc.start()
+    try:
+        tree.nearest_many(queries, 2)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < 64 * 1024 ** 2
+
+
+def test_kdtree_within_memory():
+    # Consultas en L fuera de una esquina con un radio grande: el bloque se parte.
+    rng = np.random.default_rng(2)
+    points = rng.uniform(0, 100, (50000, 2))
+    tree = KDTree(PointArray.from_xy(points))
+    side = np.linspace(-45, 100, 1000)
+    queries = np.vstack((np.column_stack((side, np.full(1000, -45.0))), np.column_stack((np.full(1000, -45.0), side))))
+    tracemalloc.start()
+    try:
+        found = tree.within_many(queries, 50)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < 48 * 1024 ** 2
+    for row in (0, 700, 1500):
+        expected = np.flatnonzero(np.sqrt(((points - queries[row]) ** 2).sum(axis=1)) <= 50)
+        assert np.array_equal(found[row], expected)
+
+
+def test_grid_updates():
+    grid = GridHash(2.0)
+    ids = grid.insert_many([Point(0, 0), Point(10, 10), Point(-3, 4)])
+    assert list(ids) == [0, 1, 2] and len(grid) == 3
+    assert grid.nearest(Point(9, 9))[1].tolist() == [1]
+    grid.remove(1)
+    assert grid.nearest(Point(9, 9))[1].tolist() == [0]
+    assert grid.insert(Point(8, 8)) == 3
+    assert grid.nearest(Point(9, 9), k=2)[1].tolist() == [3, 0]
+    with pytest.raises(KeyError):
+        grid.remove(1)
+    with pytest.raises(ValueError):
+        grid.nearest(Point(0, 0), k=4)
+    # Tras borrar los puntos lejanos, las búsquedas se limitan a las celdas que quedan.
+    far = grid.insert(Point(1e6, 1e6))
+    grid.remove(far)
+    assert grid._bounds() == ((-2, 0), (4, 4))
+    assert grid.nearest(Point(-1e5, 0))[1].tolist() == [2]
+
+
+def test_errors():
+    with pytest.raises(ValueError):
+        KDTree([Point(0, 0)]).nearest(Point(1, 1), k=2)
+    with pytest.raises(ValueError):
+        GridHash(0)
+    assert KDTree([]).within(Point(0, 0), 1).size == 0